@@ -1,6 +1,49 @@
 from django.contrib import admin
-from .models import Resource 
+from django.db.models import Q
+from .models import BookingEvent, Resource, ResourceUnit
 # Register your models here.
 
-admin.site.register(Resource)
 
+class ResourceUnitInline(admin.TabularInline):
+    model = ResourceUnit
+    extra = 0
+
+
+@admin.register(Resource)
+class ResourceAdmin(admin.ModelAdmin):
+    inlines = [ResourceUnitInline]
+
+
+@admin.register(BookingEvent)
+class BookingEventAdmin(admin.ModelAdmin):
+    """Read-only view of the audit log. Searching for a number, or adding
+?booking_id=<id> or ?resource_id=<id> to the URL, gives a timeline.
+
+Ids are matched on the raw columns, never through the foreign keys, so
+events of deleted bookings and resources still turn up.
+"""
+
+    list_display = ('created_at', 'booking_id', 'resource_id', 'actor', 'from_status', 'to_status', 'reason')
+    list_filter = ('to_status',)
+    list_select_related = ('actor',)
+    search_fields = ('actor__username',)
+    date_hierarchy = 'created_at'
+
+    def lookup_allowed(self, lookup, value, request=None):
+        return lookup in ('booking_id', 'resource_id') or super().lookup_allowed(lookup, value, request)
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip().isdigit():
+            object_id = int(search_term)
+            results |= queryset.filter(Q(booking_id=object_id) | Q(resource_id=object_id))
+        return results, may_have_duplicates
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,285 @@
+"""Unit assignment for pooled resources.
+
+Each unit's approved bookings never overlap, so a pair of sorted start/end
+arrays is a complete interval tree for it: bisect finds the neighbours of a
+window, and so whether the unit is free and how tight the fit is, in
+O(log n). The allocator puts a booking on the free unit leaving the
+smallest gap around it, which keeps long stretches free on other units
+for long bookings.
+
+If no unit is free under the current assignment but the resource still
+has capacity (peak use below the unit count), the resource's upcoming
+bookings are re-packed in start order, which needs no more units than the
+peak. Assignment therefore succeeds whenever the capacity check passes.
+Bookings moved by a re-pack are written like any other edit and their
+owners are told; bookings already under way never move.
+"""
+import heapq
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from .audit import record_transitions
+from .models import BookingRequest, Resource, ResourceUnit, UserMessage
+from .notifications import notify_recipients
+from .occupancy import approved_peak, lock_resources
+from .stats import invalidate_user_booking_stats
+from .transitions import save_if_unchanged
+
+
+User = get_user_model()
+
+
+# How far either side of a window counts when measuring a unit's free gap.
+FIT_HORIZON = timedelta(days=1)
+
+
+class NoUnitAvailable(Exception):
+    pass
+
+
+class UnitSchedule:
+    """The disjoint [start, end) intervals booked on one unit."""
+
+    __slots__ = ('unit_id', 'starts', 'ends')
+
+    def __init__(self, unit_id):
+        self.unit_id = unit_id
+        self.starts = []
+        self.ends = []
+
+    def _neighbours(self, start):
+        index = bisect_right(self.starts, start)
+        return index, (self.ends[index - 1] if index else None), (self.starts[index] if index < len(self.starts) else None)
+
+    def is_free(self, start, end):
+        _, previous_end, next_start = self._neighbours(start)
+        return (previous_end is None or previous_end <= start) and (next_start is None or next_start >= end)
+
+    def gap(self, start, end, floor, ceiling):
+        """Free time around [start, end) on this unit, clipped to [floor, ceiling]."""
+        _, previous_end, next_start = self._neighbours(start)
+        left = max(previous_end, floor) if previous_end is not None else floor
+        right = min(next_start, ceiling) if next_start is not None else ceiling
+        return right - left
+
+    def add(self, start, end):
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+
+class BestFitAllocator:
+    def __init__(self, unit_ids, horizon=None):
+        self.schedules = {unit_id: UnitSchedule(unit_id) for unit_id in unit_ids}
+        self.horizon = horizon
+
+    def load(self, unit_id, start, end):
+        schedule = self.schedules.get(unit_id)
+        if schedule is not None:
+            schedule.add(start, end)
+
+    def allocate(self, start, end):
+        """Books [start, end) on the tightest free unit; returns its id or None."""
+        horizon = self.horizon if self.horizon is not None else end - start
+        floor, ceiling = start - horizon, end + horizon
+        best = best_gap = None
+        for schedule in self.schedules.values():
+            if not schedule.is_free(start, end):
+                continue
+            gap = schedule.gap(start, end, floor, ceiling)
+            if best is None or gap < best_gap:
+                best, best_gap = schedule, gap
+                if gap == end - start:
+                    break  # Fills the gap exactly; nothing fits tighter.
+        if best is None:
+            return None
+        best.add(start, end)
+        return best.unit_id
+
+
+def pack(unit_ids, intervals, fixed=(), preferred=None):
+    """Assigns every (key, start, end) interval to a unit, in start order.
+
+    `fixed` holds (unit_id, start, end) bookings that must stay where they
+    are; one whose unit_id is not in `unit_ids` still holds some unit until
+    it ends. An interval keeps its unit in `preferred` ({key: unit_id})
+    when that unit is free. Returns {key: unit_id}, or None when the
+    intervals need more units than there are.
+    """
+    preferred = preferred or {}
+    busy = []
+    free = set(unit_ids)
+    # Ends of fixed bookings holding a unit we cannot name.
+    floating = []
+    for unit_id, _, end in fixed:
+        if unit_id in free:
+            free.discard(unit_id)
+            heapq.heappush(busy, (end, unit_id))
+        else:
+            heapq.heappush(floating, end)
+
+    assignment = {}
+    for key, start, end in sorted(intervals, key=lambda interval: interval[1]):
+        while busy and busy[0][0] <= start:
+            free.add(heapq.heappop(busy)[1])
+        while floating and floating[0] <= start:
+            heapq.heappop(floating)
+        if len(free) <= len(floating):
+            return None
+        unit_id = preferred.get(key)
+        if unit_id not in free:
+            unit_id = min(free)
+        free.discard(unit_id)
+        heapq.heappush(busy, (end, unit_id))
+        assignment[key] = unit_id
+    return assignment
+
+
+def _active_unit_ids(resource_id):
+    return list(
+        ResourceUnit.objects.filter(resource_id=resource_id, is_active=True).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def assign_unit(booking, persist, actor=None):
+    """Picks a unit for a booking about to be approved and writes it.
+
+    Everything happens under the resource's lock: the capacity check, the
+    choice of unit and `persist()`, which must write the booking (with the
+    unit_id set here, e.g. transition(..., fields=['unit'])) and return
+    whether it did. Resources without units only get the capacity check.
+    Raises NoUnitAvailable when the approved bookings already fill the
+    window or no unit is free even after re-packing. Returns what persist()
+    returned; when that is False nothing has been written.
+    """
+    with transaction.atomic():
+        lock_resources(booking.resource_id)
+        quantity = Resource.objects.filter(pk=booking.resource_id).values_list('quantity', flat=True).get()
+        if approved_peak(booking.resource_id, booking.start_time, booking.end_time, booking.pk) >= quantity:
+            raise NoUnitAvailable(
+                f"Every unit of this resource is already approved for bookings between "
+                f"{booking.start_time:%Y-%m-%d %H:%M} and {booking.end_time:%Y-%m-%d %H:%M}."
+            )
+
+        unit_ids = _active_unit_ids(booking.resource_id)
+        moves = {}
+        if unit_ids:
+            floor, ceiling = booking.start_time - FIT_HORIZON, booking.end_time + FIT_HORIZON
+            nearby = list(
+                BookingRequest.objects.filter(
+                    resource_id=booking.resource_id,
+                    status=BookingRequest.STATUS_APPROVED,
+                    start_time__lt=ceiling,
+                    end_time__gt=floor,
+                ).exclude(pk=booking.pk).values_list('unit_id', 'start_time', 'end_time')
+            )
+
+            unit_id = None
+            # Approved bookings still without a unit need the full re-pack.
+            if all(nearby_unit_id in unit_ids for nearby_unit_id, _, _ in nearby):
+                allocator = BestFitAllocator(unit_ids, FIT_HORIZON)
+                for nearby_unit_id, start, end in nearby:
+                    allocator.load(nearby_unit_id, start, end)
+                unit_id = allocator.allocate(booking.start_time, booking.end_time)
+
+            if unit_id is None:
+                unit_id, moves = _repack(booking, unit_ids)
+            booking.unit_id = unit_id
+
+        if not persist():
+            return False
+        if moves:
+            _move_bookings(booking.resource_id, moves, actor)
+    return True
+
+
+def _repack(booking, unit_ids):
+    """Re-packs the resource's upcoming approved bookings to make room for
+    `booking`; returns its unit and {booking_pk: new unit} for the others
+    that have to move."""
+    now = timezone.now()
+    approved = BookingRequest.objects.filter(
+        resource_id=booking.resource_id,
+        status=BookingRequest.STATUS_APPROVED,
+        end_time__gt=now,
+    ).exclude(pk=booking.pk)
+
+    # Bookings already under way never move, even without a usable unit;
+    # upcoming ones may.
+    fixed, movable, current = [], [], {}
+    for pk, unit_id, start, end in approved.values_list('pk', 'unit_id', 'start_time', 'end_time'):
+        if start <= now:
+            fixed.append((unit_id, start, end))
+        else:
+            movable.append((pk, start, end))
+            current[pk] = unit_id
+    movable.append((booking.pk, booking.start_time, booking.end_time))
+
+    assignment = pack(unit_ids, movable, fixed, preferred=current)
+    if assignment is None:
+        raise NoUnitAvailable(
+            f"Every unit of this resource is taken between "
+            f"{booking.start_time:%Y-%m-%d %H:%M} and {booking.end_time:%Y-%m-%d %H:%M}."
+        )
+    moves = {pk: unit_id for pk, unit_id in assignment.items() if pk != booking.pk and current[pk] != unit_id}
+    return assignment[booking.pk], moves
+
+
+def _move_bookings(resource_id, moves, actor):
+    """Writes {booking_pk: unit_id} like any other booking edit (version,
+    booking_changed, audit log) and tells the owners their unit changed."""
+    labels = dict(ResourceUnit.objects.filter(pk__in=set(moves.values())).values_list('pk', 'label'))
+    moved = list(BookingRequest.objects.filter(pk__in=moves, resource_id=resource_id).select_related('resource'))
+    for other in moved:
+        version = other.version
+        other.unit_id = moves[other.pk]
+        if other.status != BookingRequest.STATUS_APPROVED or not save_if_unchanged(other, ['unit'], version):
+            # Rolls back the whole approval.
+            raise NoUnitAvailable("Bookings of this resource changed while units were re-assigned. Please try again.")
+    reason = "Moved to another unit to make room for a new booking"
+    record_transitions(
+        [(other.pk, other.resource_id) for other in moved],
+        BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_APPROVED, actor, reason,
+    )
+
+    if actor is not None and (actor.is_staff or actor.is_superuser):
+        sender = actor
+    else:
+        sender = User.objects.filter(is_superuser=True).order_by('pk').first() or actor
+    if sender is None:
+        return
+    messages = [
+        UserMessage(
+            sender=sender,
+            recipient_id=other.user_id,
+            subject=f"🔁 Unit changed: {other.resource.name}",
+            body=(
+                f"To make room for another booking, your approved booking for {other.resource.name} from "
+                f"{timezone.localtime(other.start_time):%Y-%m-%d %H:%M} to "
+                f"{timezone.localtime(other.end_time):%Y-%m-%d %H:%M} has moved to unit {labels[other.unit_id]}. "
+                f"Its time is unchanged."
+            ),
+            is_read=False,
+        )
+        for other in moved
+    ]
+    UserMessage.objects.bulk_create(messages)
+    invalidate_user_booking_stats(*{message.recipient_id for message in messages})
+    notify_recipients(messages)
+
+
+def sync_resource_quantity(resource_id):
+    """Keeps Resource.quantity equal to the active unit count, when it has units."""
+    resource = Resource.objects.filter(pk=resource_id).first()
+    if resource is None:
+        return
+    units = resource.units.all()
+    if not units.exists():
+        return
+    active = units.filter(is_active=True).count()
+    if resource.quantity != active:
+        resource.quantity = active
+        resource.save(update_fields=['quantity', 'updated_at'])
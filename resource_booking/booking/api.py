@@ -0,0 +1,458 @@
+"""Versioned JSON API (/api/v1/) for mobile and kiosk clients.
+
+Lists are read with values_list(), so no model instances are built.
+Every read endpoint takes:
+
+* `fields=a,b,c` to return only those fields (see the *_FIELDS maps);
+* `format=columns` to encode a list column-wise, as
+  {"fields": [...], "columns": [[...], ...]}, instead of one object per row;
+* `If-None-Match`: responses carry an ETag and repeat requests get a 304.
+  Resource lists derive theirs from the catalog version, so a 304 there
+  costs no query at all.
+
+Booking, message and history lists are paged newest first with
+`after=<id>` and `limit`. A booking's status history is open to its owner
+and to reviewers; a resource's history (`since=<ISO time>`) to reviewers. Writes take JSON or form-encoded bodies and go through the same
+forms as the HTML pages.
+
+Clients either use the session cookie, in which case writes need Django's
+CSRF token like any session POST, or trade a username and password at
+POST /api/v1/auth/token/ for a signed token sent as `Authorization:
+Bearer <token>`. Browsers never attach that header on their own, so
+token requests skip the CSRF check. Tokens expire after API_TOKEN_MAX_AGE
+seconds and die with a password change.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .audit import booking_timeline, resource_timeline
+from .catalog import get_catalog_state
+from .forms import BookingRequestForm
+from .models import BookingRequest, Resource, UserMessage
+from .routers import mark_recent_write
+from .stats import invalidate_user_booking_stats
+from .transitions import can_transition, transition
+
+
+User = get_user_model()
+
+API_PATH_PREFIX = '/api/v1/'
+TOKEN_SALT = 'booking.api.token'
+
+# Public field name -> values() lookup.
+RESOURCE_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'type': 'type',
+    'description': 'description',
+    'image_url': 'image_url',
+    'quantity': 'quantity',
+    'cost': 'cost',
+    'is_available': 'is_available',
+    'updated_at': 'updated_at',
+}
+BOOKING_FIELDS = {
+    'id': 'id',
+    'resource': 'resource_id',
+    'resource_name': 'resource__name',
+    'unit': 'unit__label',
+    'start_time': 'start_time',
+    'end_time': 'end_time',
+    'purpose': 'purpose',
+    'status': 'status',
+    'payment_status': 'payment_status',
+    'requested_on': 'requested_on',
+    'version': 'version',
+}
+MESSAGE_FIELDS = {
+    'id': 'id',
+    'sender': 'sender__username',
+    'subject': 'subject',
+    'body': 'body',
+    'sent_at': 'sent_at',
+    'is_read': 'is_read',
+}
+EVENT_FIELDS = {
+    'id': 'id',
+    'booking': 'booking_id',
+    'resource': 'resource_id',
+    'actor': 'actor__username',
+    'from_status': 'from_status',
+    'to_status': 'to_status',
+    'reason': 'reason',
+    'created_at': 'created_at',
+}
+
+# Long text is left out of lists unless asked for by name.
+RESOURCE_LIST_FIELDS = [name for name in RESOURCE_FIELDS if name != 'description']
+BOOKING_LIST_FIELDS = [name for name in BOOKING_FIELDS if name != 'purpose']
+MESSAGE_LIST_FIELDS = [name for name in MESSAGE_FIELDS if name != 'body']
+
+
+def issue_token(user):
+    return signing.dumps({'user': user.pk, 'auth': user.get_session_auth_hash()}, salt=TOKEN_SALT)
+
+
+def _token_claims(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.API_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def _token_matches(user, claims):
+    # The hash covers the password, so changing it revokes every token.
+    return user is not None and constant_time_compare(user.get_session_auth_hash(), claims.get('auth', ''))
+
+
+def token_user(token):
+    """The active user a valid, unexpired `token` was issued to, else None."""
+    claims = _token_claims(token)
+    if claims is None:
+        return None
+    user = User._default_manager.filter(pk=claims.get('user'), is_active=True).first()
+    return user if _token_matches(user, claims) else None
+
+
+async def atoken_user(token):
+    claims = _token_claims(token)
+    if claims is None:
+        return None
+    user = await User._default_manager.filter(pk=claims.get('user'), is_active=True).afirst()
+    return user if _token_matches(user, claims) else None
+
+
+def _bearer_token(request):
+    if not request.path_info.startswith(API_PATH_PREFIX):
+        return None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' and token.strip() else None
+
+
+def _authenticate_as(request, user):
+    user = user or AnonymousUser()
+
+    async def auser():
+        return user
+
+    request.user = user
+    request.auser = auser
+    # Nothing ambient authenticated this request, so there is no CSRF risk.
+    request._dont_enforce_csrf_checks = True
+
+
+class ApiTokenMiddleware:
+    """Authenticates /api/v1/ requests that carry a bearer token.
+
+    Goes after AuthenticationMiddleware, and before RateLimitMiddleware so
+    token clients are limited per user. An invalid token leaves the request
+    anonymous rather than falling back to the session.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _bearer_token(request)
+        if token is not None:
+            _authenticate_as(request, token_user(token))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = _bearer_token(request)
+        if token is not None:
+            _authenticate_as(request, await atoken_user(token))
+        return await self.get_response(request)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def api_view(methods):
+    """JSON errors instead of login redirects and HTML error pages."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required.'}, status=401)
+            if request.method not in methods:
+                response = JsonResponse({'error': f'Method {request.method} not allowed.'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as exc:
+                return JsonResponse({'error': exc.message}, status=exc.status)
+
+        return _wrapped_view
+
+    return decorator
+
+
+def _dumps(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def _validated(response, etag):
+    response['ETag'] = etag
+    # Per user, and always revalidated, so a shared cache never serves it.
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _not_modified(request, etag):
+    """A 304 for `etag` when the client already has it, else None."""
+    etag = quote_etag(etag)
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    return _validated(response, etag) if response is not None else None
+
+
+def _json(request, payload, etag=None, status=200):
+    """Compact JSON response with an ETag (by default a hash of the body),
+    or a 304 when the client already has it."""
+    body = _dumps(payload)
+    if etag is None:
+        etag = hashlib.md5(body, usedforsecurity=False).hexdigest()
+    response = _not_modified(request, etag)
+    if response is not None:
+        return response
+    return _validated(HttpResponse(body, content_type='application/json', status=status), quote_etag(etag))
+
+
+def _requested_fields(request, available, default):
+    value = request.GET.get('fields')
+    if not value:
+        return default
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError(400, f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return names
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be a number.")
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def _encode(rows, fields, columnar):
+    if columnar:
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in fields]
+        return {'fields': fields, 'columns': columns}
+    return {'results': [dict(zip(fields, row)) for row in rows]}
+
+
+def _list(request, queryset, mapping, default, paged=True):
+    """Encodes `queryset` with the requested fields; paged lists are
+    ordered newest first and continue with ?after=<last id>."""
+    fields = _requested_fields(request, mapping, default)
+    columnar = request.GET.get('format') == 'columns'
+    if not paged:
+        rows = list(queryset.values_list(*[mapping[name] for name in fields]))
+        return _encode(rows, fields, columnar)
+
+    limit = _limit(request)
+    after = request.GET.get('after')
+    if after:
+        try:
+            queryset = queryset.filter(pk__lt=int(after))
+        except ValueError:
+            raise ApiError(400, "after must be an id.")
+    rows = list(queryset.order_by('-pk').values_list('pk', *[mapping[name] for name in fields])[:limit + 1])
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    payload = _encode([row[1:] for row in rows[:limit]], fields, columnar)
+    payload['next'] = next_after
+    return payload
+
+
+def _detail(request, queryset, mapping):
+    fields = _requested_fields(request, mapping, list(mapping))
+    row = queryset.values_list(*[mapping[name] for name in fields]).first()
+    if row is None:
+        raise ApiError(404, "Not found.")
+    return dict(zip(fields, row))
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ApiError(400, "Malformed JSON body.")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Expected a JSON object.")
+        return data
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+def obtain_token(request):
+    """Trades a username and password for a bearer token. Signs nothing in
+    to the session, so it needs no CSRF token."""
+    try:
+        data = _request_data(request)
+    except ApiError as exc:
+        return JsonResponse({'error': exc.message}, status=exc.status)
+    user = authenticate(request, username=data.get('username', ''), password=data.get('password', ''))
+    if user is None:
+        return JsonResponse({'error': 'Invalid username or password.'}, status=401)
+    return JsonResponse({
+        'token': issue_token(user),
+        'token_type': 'Bearer',
+        'expires_in': settings.API_TOKEN_MAX_AGE,
+    })
+
+
+@api_view(['GET', 'HEAD'])
+def resource_list(request):
+    # The catalog version changes with every resource edit, so it stands in
+    # for the body: an unchanged catalog is answered without a query.
+    version = get_catalog_state()['version']
+    etag = hashlib.md5(f"{version}|{request.GET.urlencode()}".encode(), usedforsecurity=False).hexdigest()
+    response = _not_modified(request, etag)
+    if response is not None:
+        return response
+
+    resources = Resource.objects.filter(is_available=True).order_by('name')
+    if request.GET.get('type'):
+        resources = resources.filter(type=request.GET['type'])
+    return _json(request, _list(request, resources, RESOURCE_FIELDS, RESOURCE_LIST_FIELDS, paged=False), etag=etag)
+
+
+@api_view(['GET', 'HEAD'])
+def resource_detail(request, pk):
+    return _json(request, _detail(request, Resource.objects.filter(pk=pk, is_available=True), RESOURCE_FIELDS))
+
+
+@api_view(['GET', 'HEAD', 'POST'])
+def booking_list(request):
+    if request.method == 'POST':
+        return _create_booking(request)
+    bookings = BookingRequest.objects.filter(user=request.user)
+    if request.GET.get('status'):
+        bookings = bookings.filter(status=request.GET['status'])
+    return _json(request, _list(request, bookings, BOOKING_FIELDS, BOOKING_LIST_FIELDS))
+
+
+def _create_booking(request):
+    data = _request_data(request).copy()
+    # The form requires a status; submit() decides the real one.
+    data.setdefault('status', BookingRequest.STATUS_PENDING)
+    form = BookingRequestForm(data)
+    booking = form.submit(request.user) if form.is_valid() else None
+    if booking is None:
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    mark_recent_write(request)
+    payload = _detail(request, BookingRequest.objects.filter(pk=booking.pk), BOOKING_FIELDS)
+    if booking.status == BookingRequest.STATUS_PENDING:
+        payload['payment_url'] = reverse('booking:initiate_payment', args=[booking.pk])
+    response = _json(request, payload, status=201)
+    response['Location'] = reverse('booking:api_booking_detail', args=[booking.pk])
+    return response
+
+
+@api_view(['GET', 'HEAD'])
+def booking_detail(request, pk):
+    return _json(request, _detail(request, BookingRequest.objects.filter(pk=pk, user=request.user), BOOKING_FIELDS))
+
+
+@api_view(['POST'])
+def booking_cancel(request, pk):
+    booking = BookingRequest.objects.filter(pk=pk, user=request.user).select_related('resource').first()
+    if booking is None:
+        raise ApiError(404, "Not found.")
+    if not can_transition(booking.status, BookingRequest.STATUS_CANCELLED):
+        raise ApiError(409, f"A {booking.status} booking cannot be cancelled.")
+    if booking.end_time < timezone.now():
+        raise ApiError(409, "The booking time has already passed.")
+    if not transition(booking, BookingRequest.STATUS_CANCELLED, request.user, "Cancelled by owner"):
+        raise ApiError(409, "The booking changed while it was being cancelled. Please try again.")
+    mark_recent_write(request)
+    return _json(request, _detail(request, BookingRequest.objects.filter(pk=pk), BOOKING_FIELDS))
+
+
+def _is_reviewer(user):
+    return user.has_perm('booking.can_review_booking')
+
+
+@api_view(['GET', 'HEAD'])
+def booking_history(request, pk):
+    # Reviewers may read the history of a booking that has since been deleted.
+    if not (_is_reviewer(request.user) or BookingRequest.objects.filter(pk=pk, user=request.user).exists()):
+        raise ApiError(404, "Not found.")
+    return _json(request, _list(request, booking_timeline(pk), EVENT_FIELDS, list(EVENT_FIELDS)))
+
+
+@api_view(['GET', 'HEAD'])
+def resource_history(request, pk):
+    if not _is_reviewer(request.user):
+        raise ApiError(403, "Only reviewers can read a resource's history.")
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = parse_datetime(request.GET['since'])
+        except ValueError:
+            since = None
+        if since is None:
+            raise ApiError(400, "since must be an ISO 8601 date and time.")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    return _json(request, _list(request, resource_timeline(pk, since), EVENT_FIELDS, list(EVENT_FIELDS)))
+
+
+@api_view(['GET', 'HEAD'])
+def message_list(request):
+    user_messages = UserMessage.objects.filter(recipient=request.user)
+    if request.GET.get('unread'):
+        user_messages = user_messages.filter(is_read=False)
+    return _json(request, _list(request, user_messages, MESSAGE_FIELDS, MESSAGE_LIST_FIELDS))
+
+
+@api_view(['GET', 'HEAD'])
+def message_detail(request, pk):
+    return _json(request, _detail(request, UserMessage.objects.filter(pk=pk, recipient=request.user), MESSAGE_FIELDS))
+
+
+@api_view(['POST'])
+def message_read(request, pk):
+    if not UserMessage.objects.filter(pk=pk, recipient=request.user).exists():
+        raise ApiError(404, "Not found.")
+    if UserMessage.objects.filter(pk=pk, is_read=False).update(is_read=True):
+        invalidate_user_booking_stats(request.user.pk)
+    return _json(request, _detail(request, UserMessage.objects.filter(pk=pk), MESSAGE_FIELDS))
@@ -1,15 +1,9 @@
 from django.apps import AppConfig
 
 
-class BookingConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'booking'
-
-    
-
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
 
     def ready(self):
-        import booking.signals 
+        import booking.signals
@@ -0,0 +1,159 @@
+"""Async versions of the high-traffic read views, served in ASGI mode.
+
+Every query runs through the async ORM and is fully evaluated before the
+template renders, so rendering never touches the database from the event
+loop. booking/urls.py picks these over booking/views.py when
+URBS_ASYNC_VIEWS is on.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_http_methods
+from .forms import AvailabilityQueryForm
+from .models import BookingRequest, Resource, UserMessage
+from .stats import aget_user_booking_stats, ainvalidate_user_booking_stats
+from .routers import use_read_replica
+from .catalog import aget_catalog_state, acatalog_conditional_response, set_catalog_validators
+from .transitions import transition_many
+from .events import astream_events, event_stream_response, parse_last_event_id, replay_queryset
+
+
+async def _aload_user(request):
+    # Resolve the lazy user (and its permissions, which the navbar checks)
+    # up front so the template can use them without a sync query.
+    user = await request.auser()
+    request.user = user
+    if user.is_authenticated:
+        await user.aget_all_permissions()
+    return user
+
+
+@login_required
+async def home_view(request):
+    user = await _aload_user(request)
+    context = await aget_user_booking_stats(user)
+    return render(request, 'booking/home.html', context)
+
+
+@login_required
+@use_read_replica
+async def my_bookings_dashboard(request):
+    user = await _aload_user(request)
+    now = timezone.now()
+
+    # Read before writing: after a write the router sends reads to the primary.
+    all_bookings = [
+        booking async for booking in
+        BookingRequest.objects.filter(user=user).select_related('resource', 'unit').order_by('-start_time')
+    ]
+
+    if any(b.status == BookingRequest.STATUS_APPROVED and b.end_time < now for b in all_bookings):
+        completed = await sync_to_async(transition_many)(
+            BookingRequest.objects.filter(user=user, end_time__lt=now),
+            BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_COMPLETED, reason="End time passed",
+        )
+        completed_pks = {b.pk for b in completed}
+        for b in all_bookings:
+            if b.pk in completed_pks:
+                b.status = BookingRequest.STATUS_COMPLETED
+
+    stats = await aget_user_booking_stats(user)
+
+    context = {
+        'bookings': all_bookings,
+        'pending_bookings': [b for b in all_bookings if b.status == 'PENDING'],
+        'past_bookings': [b for b in all_bookings if b.status != 'PENDING'],
+        'total_bookings': stats['total_bookings'],
+        'pending_count': stats['pending_bookings'],
+        'unread_messages_count': stats['unread_messages_count'],
+    }
+    return render(request, 'booking/my_bookings_dashboard.html', context)
+
+
+@login_required
+@use_read_replica
+async def message_inbox_view(request):
+    user = await _aload_user(request)
+
+    # Read before writing: after a write the router sends reads to the primary.
+    messages_list = [
+        message async for message in
+        UserMessage.objects.filter(recipient=user).select_related('sender', 'recipient').order_by('-sent_at')
+    ]
+
+    unread_pks = [message.pk for message in messages_list if not message.is_read]
+    if unread_pks and await UserMessage.objects.filter(pk__in=unread_pks, is_read=False).aupdate(is_read=True):
+        await ainvalidate_user_booking_stats(user.pk)
+
+    context = {
+        'messages': messages_list,
+        'unread_messages_count': 0,
+    }
+    return render(request, 'booking/message_inbox.html', context)
+
+
+@use_read_replica
+async def resource_list(request):
+    user = await _aload_user(request)
+    state = await aget_catalog_state()
+
+    not_modified, etag, last_modified = await acatalog_conditional_response(request, state)
+    if not_modified is not None:
+        return not_modified
+
+    query = request.GET.get('q', '')
+    is_staff_view = user.is_staff or user.is_superuser
+
+    # Serve a cached grid directly; only build the resource list on a miss.
+    grid_key = make_template_fragment_key('resource_grid', [state['version'], query, is_staff_view])
+    grid_html = await cache.aget(grid_key)
+    resources = []
+    if grid_html is None:
+        queryset = Resource.objects.filter(is_available=True).order_by('name')
+        if query:
+            queryset = queryset.filter(
+                Q(name__icontains=query) |
+                Q(description__icontains=query)
+            ).distinct()
+        resources = [resource async for resource in queryset]
+
+    context = {
+        'resources': resources,
+        'resource_grid_html': mark_safe(grid_html) if grid_html is not None else None,
+        'query': query,
+        'catalog_version': state['version'],
+        'is_staff_view': is_staff_view,
+        'fragment_cache_ttl': settings.RESOURCE_FRAGMENT_CACHE_TTL,
+    }
+    response = render(request, 'booking/resource_list.html', context)
+    set_catalog_validators(response, etag, last_modified)
+    return response
+
+
+@login_required
+async def booking_events_view(request):
+    user = await request.auser()
+    last_event_id = parse_last_event_id(request)
+    replay = [] if last_event_id is None else [
+        event async for event in replay_queryset(user.pk, last_event_id)
+    ]
+    return event_stream_response(astream_events(user.pk, replay))
+
+
+@login_required
+@require_http_methods(["GET"])
+async def availability_view(request):
+    user = await request.auser()
+    form = AvailabilityQueryForm(request.GET, user=user)
+    # Validation looks up the resource and the capacity check reads the
+    # occupancy index; both stay sync and run off the event loop.
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    return JsonResponse(await sync_to_async(form.availability)())
@@ -0,0 +1,113 @@
+"""Append-only audit log of booking status transitions.
+
+Views record a transition once their own transaction commits; the event
+goes into an in-process buffer and a daemon thread writes the buffer out
+with one bulk insert every AUDIT_FLUSH_INTERVAL seconds, or sooner once
+AUDIT_BATCH_SIZE events are waiting. Requests therefore never wait on an
+audit write. The buffer is also flushed at interpreter exit and before a
+timeline is read, so a process always sees its own events.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from .models import BookingEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, events):
+        with self._lock:
+            self._pending.extend(events)
+            overflow = len(self._pending) - settings.AUDIT_MAX_BUFFER
+            if overflow > 0:
+                # The database has been unreachable for a while; keep the newest.
+                del self._pending[:overflow]
+                logger.error("Booking audit buffer full; dropped %d event(s).", overflow)
+            if len(self._pending) >= settings.AUDIT_BATCH_SIZE:
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='booking-audit-log', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Writes every buffered event; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+            if not events:
+                return 0
+            try:
+                BookingEvent.objects.bulk_create(events, batch_size=settings.AUDIT_BATCH_SIZE)
+            except DatabaseError:
+                with self._lock:
+                    self._pending[:0] = events
+                raise
+            return len(events)
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("Writing the booking audit log failed; will retry.")
+                connection.close()
+
+
+audit_log = AuditLog()
+
+
+def _event(booking_id, resource_id, from_status, to_status, actor, reason, at):
+    return BookingEvent(
+        booking_id=booking_id,
+        resource_id=resource_id,
+        actor_id=actor.pk if actor is not None and actor.is_authenticated else None,
+        from_status=from_status or '',
+        to_status=to_status,
+        reason=reason[:255],
+        created_at=at,
+    )
+
+
+def record_transition(booking, from_status, to_status, actor=None, reason=''):
+    """Queues one transition; `from_status` is None for a new booking."""
+    record_transitions([(booking.pk, booking.resource_id)], from_status, to_status, actor, reason)
+
+
+def record_transitions(bookings, from_status, to_status, actor=None, reason=''):
+    """Queues the same transition for (booking_id, resource_id) pairs."""
+    now = timezone.now()
+    events = [
+        _event(booking_id, resource_id, from_status, to_status, actor, reason, now)
+        for booking_id, resource_id in bookings
+    ]
+    if events:
+        transaction.on_commit(lambda: audit_log.add(events))
+
+
+def booking_timeline(booking_id):
+    audit_log.flush()
+    return BookingEvent.objects.filter(booking_id=booking_id).select_related('actor')
+
+
+def resource_timeline(resource_id, since=None):
+    audit_log.flush()
+    events = BookingEvent.objects.filter(resource_id=resource_id).select_related('actor')
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    return events
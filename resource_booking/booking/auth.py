@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+PERMISSION_VERSION_KEY = 'booking:permission_version'
+USER_CACHE_KEY = 'booking:auth_user:{user_id}'
+PERMISSION_CACHE_KEY = 'booking:auth_perms:{user_id}:{version}'
+
+
+def get_permission_version():
+    version = cache.get(PERMISSION_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(PERMISSION_VERSION_KEY, version, None)
+    return version
+
+
+async def aget_permission_version():
+    version = await cache.aget(PERMISSION_VERSION_KEY)
+    if version is None:
+        version = 1
+        await cache.aadd(PERMISSION_VERSION_KEY, version, None)
+    return version
+
+
+def bump_permission_version():
+    """Invalidates every cached permission set at once."""
+    try:
+        cache.incr(PERMISSION_VERSION_KEY)
+    except ValueError:
+        cache.set(PERMISSION_VERSION_KEY, get_permission_version() + 1, None)
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(USER_CACHE_KEY.format(user_id=user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps users and their permission sets in the cache.
+
+    Users are cached per id and dropped whenever they are saved or deleted.
+    Permission sets are keyed on the permission version, which is bumped when
+    groups, permissions or a user's staff/superuser flags change.
+    """
+
+    def get_user(self, user_id):
+        key = USER_CACHE_KEY.format(user_id=user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_CACHE_TTL)
+        return user
+
+    async def aget_user(self, user_id):
+        key = USER_CACHE_KEY.format(user_id=user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, settings.AUTH_CACHE_TTL)
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = PERMISSION_CACHE_KEY.format(user_id=user_obj.pk, version=get_permission_version())
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, settings.AUTH_CACHE_TTL)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = PERMISSION_CACHE_KEY.format(user_id=user_obj.pk, version=await aget_permission_version())
+            perms = await cache.aget(key)
+            if perms is None:
+                perms = await super().aget_all_permissions(user_obj)
+                await cache.aset(key, perms, settings.AUTH_CACHE_TTL)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
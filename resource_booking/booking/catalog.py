@@ -0,0 +1,94 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from .models import Resource
+
+
+CATALOG_STATE_KEY = 'booking:resource_catalog_state'
+
+
+def _catalog_state(row):
+    last_modified = row['last_modified']
+    stamp = last_modified.timestamp() if last_modified else 0
+    return {
+        'version': f"{row['count']}.{stamp:.6f}",
+        'last_modified': last_modified,
+    }
+
+
+def get_catalog_state():
+    """Returns the resource catalog's version string and last change time.
+
+    The version changes whenever a resource is added, edited or deleted:
+    the count catches deletions, the newest `updated_at` everything else.
+    """
+    state = cache.get(CATALOG_STATE_KEY)
+    if state is None:
+        state = _catalog_state(
+            Resource.objects.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        )
+        cache.set(CATALOG_STATE_KEY, state, settings.RESOURCE_CATALOG_CACHE_TTL)
+    return state
+
+
+async def aget_catalog_state():
+    state = await cache.aget(CATALOG_STATE_KEY)
+    if state is None:
+        state = _catalog_state(
+            await Resource.objects.aaggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        )
+        await cache.aset(CATALOG_STATE_KEY, state, settings.RESOURCE_CATALOG_CACHE_TTL)
+    return state
+
+
+def invalidate_catalog_state():
+    cache.delete(CATALOG_STATE_KEY)
+
+
+def _is_public_request(request):
+    # Only anonymous pages without pending flash messages are the same for
+    # every visitor; anything else must always be rendered fresh.
+    return not request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def _etag(request, version):
+    key = f"{request.resolver_match.view_name}|{version}|{request.GET.get('q', '')}"
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    if not _is_public_request(request):
+        return None
+    return _etag(request, get_catalog_state()['version'])
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    if not _is_public_request(request):
+        return None
+    return get_catalog_state()['last_modified']
+
+
+async def acatalog_conditional_response(request, state):
+    """Async counterpart of condition(catalog_etag, catalog_last_modified).
+
+    Returns (response, etag, last_modified): a 304 response when the client's
+    copy is current, otherwise None plus the validators to set on the page.
+    """
+    if not _is_public_request(request):
+        return None, None, None
+    etag = quote_etag(_etag(request, state['version']))
+    last_modified = int(state['last_modified'].timestamp()) if state['last_modified'] else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return response, etag, last_modified
+
+
+def set_catalog_validators(response, etag, last_modified):
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Max, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import BookingRequest, ChangeEvent
+
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = ('id', 'user_id', 'kind', 'payload')
+
+# Replayed on reconnect (Last-Event-ID); older gaps just need a page reload.
+REPLAY_LIMIT = 100
+POLL_BATCH_SIZE = 500
+# Most skipped ids the poller keeps waiting for at once.
+MAX_OPEN_GAPS = 1000
+PRUNE_EVERY_SECONDS = 3600
+
+
+# A saved booking is published when one of these differs from when it was loaded.
+EVENT_STATE_FIELDS = ('status', 'payment_status', 'start_time', 'end_time')
+
+
+def booking_event_state(booking):
+    # Read from __dict__ so deferred fields are not loaded.
+    values = booking.__dict__
+    return tuple(values.get(field) for field in EVENT_STATE_FIELDS)
+
+
+def booking_payload(booking):
+    # The resource name only when already loaded; no query per event.
+    resource = booking.resource if BookingRequest.resource.is_cached(booking) else None
+    return {
+        'id': booking.pk,
+        'resource_id': booking.resource_id,
+        'resource': resource.name if resource is not None else None,
+        'status': booking.status,
+        'payment_status': booking.payment_status,
+        'start_time': booking.start_time.isoformat(),
+    }
+
+
+def message_payload(message):
+    return {
+        'id': message.pk,
+        'subject': message.subject,
+        'sender': message.sender.username if message.sender_id else None,
+    }
+
+
+def publish_booking_change(booking):
+    ChangeEvent.objects.create(
+        user_id=booking.user_id, kind=ChangeEvent.KIND_BOOKING, payload=booking_payload(booking),
+    )
+
+
+def publish_booking_changes(bookings):
+    """Records a feed event for each changed booking, in one insert."""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(user_id=booking.user_id, kind=ChangeEvent.KIND_BOOKING, payload=booking_payload(booking))
+        for booking in bookings
+    ])
+
+
+def publish_messages(messages):
+    """Records a feed event for each delivered message, in one insert."""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(user_id=message.recipient_id, kind=ChangeEvent.KIND_MESSAGE, payload=message_payload(message))
+        for message in messages
+    ])
+
+
+def replay_queryset(user_id, last_event_id):
+    return (
+        ChangeEvent.objects
+        .filter(user_id=user_id, id__gt=last_event_id)
+        .order_by('id')
+        .values(*EVENT_FIELDS)[:REPLAY_LIMIT]
+    )
+
+
+def parse_last_event_id(request):
+    try:
+        return int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        return None
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def format_sse(event):
+    # The id is where a reconnecting browser resumes from (Last-Event-ID):
+    # below any id the feed is still waiting for, so nothing is skipped.
+    data = json.dumps(event['payload'], separators=(',', ':'))
+    return f"id: {event.get('resume', event['id'])}\nevent: {event['kind']}\ndata: {data}\n\n"
+
+
+class _AsyncListener:
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def deliver(self, event):
+        # Called from the poller thread.
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ChangeFeed:
+    """Fans ChangeEvent rows out to the SSE streams open in this process.
+
+    One daemon thread polls the table for new ids once per
+    BOOKING_EVENTS_POLL_INTERVAL, however many streams are open, and sleeps
+    on an Event while there are none, so idle listeners cost a queue each.
+
+    Ids are allocated when a row is inserted but become visible when its
+    transaction commits, which need not be in id order. Ids the cursor
+    skips are therefore polled for again until they show up or
+    BOOKING_EVENTS_LATE_COMMIT_SECONDS pass (the transaction rolled back).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = {}
+        self._has_listeners = threading.Event()
+        self._thread = None
+        self._cursor = None
+        # Skipped id -> when it was first missed.
+        self._gaps = {}
+        self._pruned_at = 0
+
+    def subscribe(self, user_id, listener):
+        with self._lock:
+            self._listeners.setdefault(user_id, set()).add(listener)
+            self._has_listeners.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='booking-change-feed', daemon=True)
+                self._thread.start()
+        return listener
+
+    def unsubscribe(self, user_id, listener):
+        with self._lock:
+            listeners = self._listeners.get(user_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[user_id]
+            if not self._listeners:
+                self._has_listeners.clear()
+
+    def _run(self):
+        while True:
+            if not self._has_listeners.is_set():
+                # Nobody missed anything while idle; restart from the head.
+                self._cursor = None
+                self._has_listeners.wait()
+            try:
+                self._poll()
+                self._prune()
+            except DatabaseError:
+                logger.exception("Polling the booking change feed failed.")
+                connection.close()
+            time.sleep(settings.BOOKING_EVENTS_POLL_INTERVAL)
+
+    def _poll(self):
+        if self._cursor is None:
+            # Start at the head: streams only want what happens from now on.
+            self._cursor = ChangeEvent.objects.aggregate(head=Max('id'))['head'] or 0
+            self._gaps = {}
+            return
+        now = time.monotonic()
+        self._gaps = {
+            event_id: missed_at for event_id, missed_at in self._gaps.items()
+            if now - missed_at < settings.BOOKING_EVENTS_LATE_COMMIT_SECONDS
+        }
+        while True:
+            query = Q(id__gt=self._cursor)
+            if self._gaps:
+                query |= Q(id__in=list(self._gaps))
+            events = list(ChangeEvent.objects.filter(query).order_by('id').values(*EVENT_FIELDS)[:POLL_BATCH_SIZE])
+            if not events:
+                return
+            for event in events:
+                event_id = event['id']
+                if event_id > self._cursor:
+                    skipped = range(max(self._cursor + 1, event_id - MAX_OPEN_GAPS), event_id)
+                    self._gaps.update((missing, now) for missing in skipped)
+                    self._cursor = event_id
+                else:
+                    self._gaps.pop(event_id, None)
+            if len(self._gaps) > MAX_OPEN_GAPS:
+                self._gaps = dict(sorted(self._gaps.items())[-MAX_OPEN_GAPS:])
+            resume = min(self._gaps) - 1 if self._gaps else self._cursor
+            for event in events:
+                event['resume'] = resume
+            with self._lock:
+                targets = [(event, list(self._listeners.get(event['user_id'], ()))) for event in events]
+            for event, listeners in targets:
+                for listener in listeners:
+                    listener.deliver(event)
+            if len(events) < POLL_BATCH_SIZE:
+                return
+
+    def _prune(self):
+        if time.monotonic() - self._pruned_at < PRUNE_EVERY_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        cutoff = timezone.now() - timedelta(hours=settings.BOOKING_EVENTS_RETENTION_HOURS)
+        ChangeEvent.objects.filter(created_at__lt=cutoff).delete()
+
+
+feed = ChangeFeed()
+
+
+def _wait_seconds(deadline):
+    return max(0, min(settings.BOOKING_EVENTS_HEARTBEAT_SECONDS, deadline - time.monotonic()))
+
+
+def poll_events(user_id, last_event_id):
+    """The SSE body for one short poll, served where a held-open stream
+    would tie up a worker (WSGI): the events after `last_event_id`, or just
+    the current head on a first connection. The response then ends and the
+    browser reconnects after BOOKING_EVENTS_SHORT_POLL_MS."""
+    body = [f"retry: {settings.BOOKING_EVENTS_SHORT_POLL_MS}\n\n"]
+    if last_event_id is None:
+        head = ChangeEvent.objects.aggregate(head=Max('id'))['head'] or 0
+        # An id with no data moves the browser's Last-Event-ID without an event.
+        body.append(f"id: {head}\n\n")
+    else:
+        body.extend(format_sse(event) for event in replay_queryset(user_id, last_event_id))
+    return ''.join(body)
+
+
+async def astream_events(user_id, replay):
+    listener = feed.subscribe(user_id, _AsyncListener())
+    try:
+        yield f"retry: {settings.BOOKING_EVENTS_RETRY_MS}\n\n"
+        # Late commits arrive out of id order, so dedupe by id.
+        sent = set()
+        for event in replay:
+            sent.add(event['id'])
+            yield format_sse(event)
+        deadline = time.monotonic() + settings.BOOKING_EVENTS_MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            event = await listener.get(_wait_seconds(deadline))
+            if event is None:
+                yield ": keepalive\n\n"
+            elif event['id'] not in sent:
+                sent.add(event['id'])
+                yield format_sse(event)
+    finally:
+        feed.unsubscribe(user_id, listener)
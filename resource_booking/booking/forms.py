@@ -1,9 +1,23 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from django.db.models import Sum
+from django.utils import timezone
 from .models import BookingRequest, Resource, UserMessage
+from .allocation import NoUnitAvailable, assign_unit
+from .audit import record_transition
+from .occupancy import resource_availability
+from .heatmap import ALL_SCOPE, heatmap, type_scope
+
+
+AVAILABILITY_CACHE_KEY = 'booking:availability:{resource_id}:{start}:{end}:{booking_id}'
+HEATMAP_CACHE_KEY = 'booking:heatmap:{resource_id}:{type}:{weeks}'
+
 
 class BookingRequestForm(forms.ModelForm):
     
@@ -66,6 +80,13 @@ class BookingRequestForm(forms.ModelForm):
             self.fields['end_time'].disabled = True
             self.fields['purpose'].disabled = True
             self.fields['status'].required = True
+            if self.instance.pk:
+                current = self.instance.status
+                allowed = BookingRequest.TRANSITIONS.get(current, set())
+                self.fields['status'].choices = [
+                    (value, label) for value, label in BookingRequest.STATUS_CHOICES
+                    if value == current or value in allowed
+                ]
             
         elif is_owner:
             self.fields['status'].disabled = True
@@ -118,29 +139,15 @@ class BookingRequestForm(forms.ModelForm):
             )
 
         
-        OCCUPIED_STATUSES = ['APPROVED', 'PENDING']
-        
-        
-        conflicting_bookings = BookingRequest.objects.filter(
-            
-            resource=resource,
-            
-            status__in=OCCUPIED_STATUSES,
-            
-            start_time__lt=end_time,
-            end_time__gt=start_time,
+        availability = resource_availability(
+            resource, start_time, end_time,
+            exclude_booking_pk=self.instance.pk if self.instance else None,
         )
-
-        
-        if self.instance and self.instance.pk:
-            conflicting_bookings = conflicting_bookings.exclude(pk=self.instance.pk)
-
-        
-        booked_quantity = conflicting_bookings.count()
         
-        available_quantity = resource.quantity if resource else 0
+        booked_quantity = availability['in_use']
+        available_quantity = availability['quantity']
 
-        if booked_quantity >= available_quantity:
+        if not availability['remaining']:
             
             raise ValidationError(
                 f"The resource '{resource.name}' is fully booked ({booked_quantity} of {available_quantity} units reserved) "
@@ -149,6 +156,208 @@ class BookingRequestForm(forms.ModelForm):
             
         return cleaned_data
 
+    def submit(self, user):
+        """Saves a valid new booking for `user`: PENDING until paid for a
+        paid resource, otherwise APPROVED on a free unit. Returns the booking,
+        or None with a form error when no unit is free after all."""
+        booking = self.save(commit=False)
+        booking.user = user
+        if booking.resource.cost > 0:
+            booking.status = BookingRequest.STATUS_PENDING
+            reason = "Submitted; awaiting payment"
+            booking.save()
+        else:
+            booking.status = BookingRequest.STATUS_APPROVED
+            reason = "Submitted; no payment required"
+
+            def persist():
+                booking.save()
+                return True
+
+            try:
+                # Saved under the resource's lock, with the unit picked there.
+                assign_unit(booking, persist, actor=user)
+            except NoUnitAvailable as exc:
+                self.add_error(None, str(exc))
+                return None
+        record_transition(booking, None, booking.status, user, reason)
+        return booking
+
+
+class AvailabilityQueryForm(forms.Form):
+    """Query of the booking form's live availability check."""
+
+    resource = forms.ModelChoiceField(queryset=Resource.objects.filter(is_available=True))
+    start_time = forms.DateTimeField()
+    end_time = forms.DateTimeField()
+    booking = forms.ModelChoiceField(
+        queryset=BookingRequest.objects.none(),
+        required=False,
+        help_text="Booking being edited, left out of the count.",
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user is not None and (user.is_staff or user.is_superuser):
+            self.fields['booking'].queryset = BookingRequest.objects.all()
+        elif user is not None:
+            self.fields['booking'].queryset = BookingRequest.objects.filter(user=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        if start_time and end_time and start_time >= end_time:
+            raise ValidationError('End time must be after start time.')
+        return cleaned_data
+
+    def availability(self):
+        """The JSON answer for a valid query, cached for AVAILABILITY_CACHE_TTL."""
+        data = self.cleaned_data
+        booking_pk = data['booking'].pk if data['booking'] else None
+        key = AVAILABILITY_CACHE_KEY.format(
+            resource_id=data['resource'].pk,
+            start=data['start_time'].timestamp(),
+            end=data['end_time'].timestamp(),
+            booking_id=booking_pk or '',
+        )
+        payload = cache.get(key)
+        if payload is None:
+            availability = resource_availability(
+                data['resource'], data['start_time'], data['end_time'], exclude_booking_pk=booking_pk,
+            )
+            payload = {
+                'resource': data['resource'].pk,
+                'available': availability['remaining'] > 0,
+                'quantity': availability['quantity'],
+                'remaining': availability['remaining'],
+                'conflicts': [
+                    {'start': start.isoformat(), 'end': end.isoformat()}
+                    for start, end in availability['conflicts']
+                ],
+            }
+            cache.set(key, payload, settings.AVAILABILITY_CACHE_TTL)
+        return payload
+
+
+class HeatmapQueryForm(forms.Form):
+    """Query of the occupancy heatmap: one resource, one resource type, or
+    every resource when neither is given."""
+
+    resource = forms.ModelChoiceField(
+        queryset=Resource.objects.all(), required=False, empty_label='All resources',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    type = forms.ChoiceField(
+        choices=[('', 'Any type')] + Resource.RESOURCE_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    weeks = forms.IntegerField(
+        required=False, min_value=1, max_value=settings.HEATMAP_MAX_WEEKS,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('resource') and cleaned_data.get('type'):
+            raise ValidationError('Choose a resource or a resource type, not both.')
+        return cleaned_data
+
+    def heatmap(self):
+        """The JSON answer for a valid query, cached for HEATMAP_CACHE_TTL."""
+        data = self.cleaned_data
+        weeks = data['weeks'] or settings.HEATMAP_WEEKS
+        key = HEATMAP_CACHE_KEY.format(
+            resource_id=data['resource'].pk if data['resource'] else '',
+            type=data['type'],
+            weeks=weeks,
+        )
+        payload = cache.get(key)
+        if payload is None:
+            if data['resource']:
+                result = heatmap([data['resource']], weeks)
+            elif data['type']:
+                result = heatmap(Resource.objects.filter(type=data['type']), weeks, scope=type_scope(data['type']))
+            else:
+                result = heatmap(Resource.objects.all(), weeks, scope=ALL_SCOPE)
+            payload = {
+                'resource': data['resource'].pk if data['resource'] else None,
+                'type': data['type'] or None,
+                **result,
+            }
+            cache.set(key, payload, settings.HEATMAP_CACHE_TTL)
+        return payload
+
+
+class ApprovalSimulationForm(forms.Form):
+    """Pending bookings to simulate approving; all of them when none are given."""
+
+    booking = forms.ModelMultipleChoiceField(
+        queryset=BookingRequest.objects.filter(status=BookingRequest.STATUS_PENDING),
+        required=False,
+    )
+
+    def pending(self):
+        bookings = self.cleaned_data['booking']
+        if not bookings:
+            bookings = BookingRequest.objects.filter(status=BookingRequest.STATUS_PENDING)
+        return bookings.select_related('resource').order_by('start_time', 'pk')
+
+
+class BookingExplorerForm(forms.Form):
+    """Filters of the staff booking explorer; every field is optional."""
+
+    resource = forms.ModelChoiceField(
+        queryset=Resource.objects.all(), required=False, empty_label='Any resource',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    resource_type = forms.ChoiceField(
+        choices=[('', 'Any type')] + Resource.RESOURCE_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    user = forms.CharField(
+        required=False, label='Username',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Exact username'}),
+    )
+    status = forms.ChoiceField(
+        choices=[('', 'Any status')] + BookingRequest.STATUS_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    payment_status = forms.ChoiceField(
+        choices=[('', 'Any payment')] + BookingRequest.PAYMENT_STATUS_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    start_from = forms.DateField(
+        required=False, label='Starts from',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+    start_to = forms.DateField(
+        required=False, label='Starts up to',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+    )
+
+    def clean_user(self):
+        username = self.cleaned_data['user'].strip()
+        if not username:
+            return None
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise ValidationError('No user with that username.')
+        return user
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_from = cleaned_data.get('start_from')
+        start_to = cleaned_data.get('start_to')
+        if start_from and start_to and start_to < start_from:
+            raise ValidationError('The end of the date range is before its start.')
+        # Whole days in the current time zone, as [start_from, start_before).
+        if start_from:
+            cleaned_data['start_from'] = timezone.make_aware(datetime.combine(start_from, time.min))
+        if start_to:
+            cleaned_data['start_before'] = timezone.make_aware(datetime.combine(start_to + timedelta(days=1), time.min))
+        return cleaned_data
+
 
 class ResourceCreationForm(forms.ModelForm):
     class Meta:
@@ -167,6 +376,12 @@ class ResourceCreationForm(forms.ModelForm):
             'is_available': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and self.instance.units.exists():
+            self.fields['quantity'].disabled = True
+            self.fields['quantity'].help_text = "Set by the number of active units."
+
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(
@@ -0,0 +1,332 @@
+"""Hour-of-week occupancy heatmaps.
+
+Each resource has one HeatmapWeek row per local calendar week (keyed by
+its Monday) holding an array of booked unit-minutes per hour-of-week bin:
+7 days x 24 hours x (60 / HEATMAP_BIN_MINUTES) unsigned 32-bit counters.
+A heatmap over a year is then the column sums of about 52 such arrays per
+resource, added in C by zip()/sum() instead of walking BookingRequest rows.
+
+Heatmaps of every resource or of a whole type read HeatmapScopeWeek rows
+instead, one per week holding the sum over the scope, so their cost does
+not grow with the number of resources. They are built from the bookings
+table in one query per scope and kept current alongside the per-resource
+rows.
+
+Rows are kept current as bookings change (booking/signals.py) and built
+from the bookings table when first read. Approved and completed bookings
+count; pending requests do not hold a unit yet. Bins are in the current
+time zone, so a booking crossing a DST change is binned by wall-clock
+time.
+"""
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import BookingRequest, HeatmapScopeWeek, HeatmapWeek, Resource
+from .occupancy import FOOTPRINT_FIELDS, UNKNOWN, lock_resources
+
+
+HEATMAP_STATUSES = (BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_COMPLETED)
+
+DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+ALL_SCOPE = 'all'
+
+
+def bins_per_day():
+    return 24 * 60 // settings.HEATMAP_BIN_MINUTES
+
+
+def bins_per_week():
+    return 7 * bins_per_day()
+
+
+def _empty_week():
+    return array('I', bytes(4 * bins_per_week()))
+
+
+def _decode(data):
+    minutes = array('I')
+    minutes.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        minutes.byteswap()
+    return minutes
+
+
+def _encode(minutes):
+    if sys.byteorder == 'big':
+        minutes = array('I', minutes)
+        minutes.byteswap()
+    return minutes.tobytes()
+
+
+def week_of(value):
+    """Monday of the local week containing the aware datetime `value`."""
+    day = timezone.localtime(value).date()
+    return day - timedelta(days=day.weekday())
+
+
+def _week_start(week):
+    return timezone.make_aware(datetime.combine(week, time.min))
+
+
+def week_bins(start, end):
+    """Yields (week, bin, minutes) for the local wall-clock time [start, end)
+    covers, split at bin boundaries."""
+    bin_minutes = settings.HEATMAP_BIN_MINUTES
+    step = timedelta(minutes=bin_minutes)
+    at = timezone.localtime(start).replace(tzinfo=None)
+    end = timezone.localtime(end).replace(tzinfo=None)
+    while at < end:
+        minute_of_day = at.hour * 60 + at.minute
+        bin_end = datetime.combine(at.date(), time.min) + (minute_of_day // bin_minutes + 1) * step
+        stop = min(bin_end, end)
+        week = at.date() - timedelta(days=at.weekday())
+        index = at.weekday() * bins_per_day() + minute_of_day // bin_minutes
+        yield week, index, round((stop - at).total_seconds() / 60)
+        at = stop
+
+
+def heatmap_footprint(booking):
+    """(resource_id, start, end) while the booking counts, else None."""
+    values = booking.__dict__
+    if any(field not in values for field in FOOTPRINT_FIELDS):
+        return UNKNOWN
+    if booking.status not in HEATMAP_STATUSES or not (booking.start_time and booking.end_time):
+        return None
+    return booking.resource_id, booking.start_time, booking.end_time
+
+
+def _build_weeks(resource_id, weeks):
+    minutes = {week: _empty_week() for week in weeks}
+    using = router.db_for_write(HeatmapWeek)
+    with transaction.atomic(using=using):
+        # Serialised with booking changes, as in occupancy._build_days().
+        lock_resources(resource_id)
+        bookings = BookingRequest.objects.using(using).filter(
+            resource_id=resource_id,
+            status__in=HEATMAP_STATUSES,
+            start_time__lt=_week_start(max(weeks) + timedelta(days=7)),
+            end_time__gt=_week_start(min(weeks)),
+        ).values_list('start_time', 'end_time')
+        for start, end in bookings:
+            for week, index, booked in week_bins(start, end):
+                if week in minutes:
+                    minutes[week][index] += booked
+        HeatmapWeek.objects.bulk_create(
+            [HeatmapWeek(resource_id=resource_id, week=week, minutes=_encode(week_minutes))
+             for week, week_minutes in minutes.items()],
+            ignore_conflicts=True,
+        )
+    return minutes
+
+
+def load_weeks(resource_ids, weeks):
+    """Returns {resource_id: [week arrays]}, building any missing weeks.
+
+    Rows written with another HEATMAP_BIN_MINUTES are rebuilt.
+    """
+    size = bins_per_week()
+    loaded = defaultdict(dict)
+    stale = []
+    for row in HeatmapWeek.objects.filter(resource_id__in=resource_ids, week__in=weeks):
+        week_minutes = _decode(row.minutes)
+        if len(week_minutes) == size:
+            loaded[row.resource_id][row.week] = week_minutes
+        else:
+            stale.append(row.pk)
+    if stale:
+        HeatmapWeek.objects.filter(pk__in=stale).delete()
+    for resource_id in resource_ids:
+        missing = [week for week in weeks if week not in loaded[resource_id]]
+        if missing:
+            loaded[resource_id].update(_build_weeks(resource_id, missing))
+    return {resource_id: list(loaded[resource_id].values()) for resource_id in resource_ids}
+
+
+def type_scope(resource_type):
+    return f'type:{resource_type}'
+
+
+def _scope_bookings(scope, using):
+    bookings = BookingRequest.objects.using(using).filter(status__in=HEATMAP_STATUSES)
+    if scope != ALL_SCOPE:
+        resource_type = scope.removeprefix('type:')
+        resource_ids = list(Resource.objects.using(using).filter(type=resource_type).values_list('pk', flat=True))
+        bookings = bookings.filter(resource_id__in=resource_ids)
+    return bookings
+
+
+def _build_scope_weeks(scope, weeks):
+    """Fills the scope's rows for `weeks` from the bookings table.
+
+    The rows are committed empty first and the bookings read under their
+    row locks. A booking change either commits before the read, and is
+    counted by it, or waits on the lock and applies its delta afterwards.
+    """
+    using = router.db_for_write(HeatmapScopeWeek)
+    HeatmapScopeWeek.objects.using(using).bulk_create(
+        [HeatmapScopeWeek(scope=scope, week=week, minutes=_encode(_empty_week())) for week in weeks],
+        ignore_conflicts=True,
+    )
+    minutes = {week: _empty_week() for week in weeks}
+    with transaction.atomic(using=using):
+        rows = list(
+            HeatmapScopeWeek.objects.using(using).select_for_update()
+            .filter(scope=scope, week__in=weeks).order_by('week')
+        )
+        bookings = _scope_bookings(scope, using).filter(
+            start_time__lt=_week_start(max(weeks) + timedelta(days=7)),
+            end_time__gt=_week_start(min(weeks)),
+        ).values_list('start_time', 'end_time')
+        for start, end in bookings.iterator():
+            for week, index, booked in week_bins(start, end):
+                if week in minutes:
+                    minutes[week][index] += booked
+        for row in rows:
+            row.minutes = _encode(minutes[row.week])
+            row.built = True
+        HeatmapScopeWeek.objects.using(using).bulk_update(rows, ['minutes', 'built'])
+    return minutes
+
+
+def load_scope_weeks(scope, weeks):
+    """Returns the scope's week arrays, building any missing or stale weeks."""
+    size = bins_per_week()
+    loaded = {}
+    for row in HeatmapScopeWeek.objects.filter(scope=scope, week__in=weeks, built=True):
+        week_minutes = _decode(row.minutes)
+        if len(week_minutes) == size:
+            loaded[row.week] = week_minutes
+    missing = [week for week in weeks if week not in loaded]
+    if missing:
+        loaded.update(_build_scope_weeks(scope, missing))
+    return list(loaded.values())
+
+
+def heatmap(resources, weeks, until=None, scope=None):
+    """Booked unit-hours and utilisation per hour-of-week bin for
+    `resources` over the `weeks` local weeks ending with the one containing
+    `until` (default: now).
+
+    `resources` is a list of resources, or with `scope` (ALL_SCOPE or a
+    type_scope()) the queryset of every resource in that scope, which is
+    only aggregated. Utilisation divides by the resources' current
+    quantity; 1.0 means every unit was booked through that bin in every
+    week of the range.
+    """
+    last = week_of(until or timezone.now())
+    week_list = [last - timedelta(days=7 * offset) for offset in range(weeks - 1, -1, -1)]
+    if scope is None:
+        quantities = {resource.pk: resource.quantity for resource in resources}
+        resource_count, quantity = len(quantities), sum(quantities.values())
+        arrays = [
+            week_minutes
+            for week_arrays in load_weeks(list(quantities), week_list).values()
+            for week_minutes in week_arrays
+        ]
+    else:
+        totals = resources.aggregate(count=Count('pk'), quantity=Sum('quantity'))
+        resource_count, quantity = totals['count'], totals['quantity'] or 0
+        arrays = load_scope_weeks(scope, week_list)
+    per_day = bins_per_day()
+    totals = [sum(column) for column in zip(*arrays)] if arrays else [0] * bins_per_week()
+    capacity = quantity * settings.HEATMAP_BIN_MINUTES * weeks
+    return {
+        'from': week_list[0].isoformat(),
+        'to': (last + timedelta(days=6)).isoformat(),
+        'weeks': weeks,
+        'bin_minutes': settings.HEATMAP_BIN_MINUTES,
+        'days': DAY_NAMES,
+        'resource_count': resource_count,
+        'booked_hours': [
+            [round(minutes / 60, 2) for minutes in totals[day * per_day:(day + 1) * per_day]]
+            for day in range(7)
+        ],
+        'utilisation': [
+            [round(minutes / capacity, 4) if capacity else 0 for minutes in totals[day * per_day:(day + 1) * per_day]]
+            for day in range(7)
+        ],
+    }
+
+
+def _update_rows(rows, changes, key):
+    updated = []
+    for row in rows:
+        week_changes = changes.get(key(row))
+        if not week_changes:
+            continue
+        week_minutes = _decode(row.minutes)
+        if len(week_minutes) != bins_per_week():
+            continue
+        for index, delta in week_changes:
+            week_minutes[index] = max(0, week_minutes[index] + delta)
+        row.minutes = _encode(week_minutes)
+        updated.append(row)
+    return updated
+
+
+def apply_heatmap_changes(moves):
+    """Moves bookings' minutes in the stored weeks, per resource and per
+    scope, for (old, new) footprint pairs. Weeks that have no row yet are
+    built when first read."""
+    changes = defaultdict(list)
+    for old, new in moves:
+        if old == new:
+            continue
+        for footprint, sign in ((old, -1), (new, 1)):
+            if footprint is None:
+                continue
+            resource_id, start, end = footprint
+            for week, index, booked in week_bins(start, end):
+                changes[resource_id, week].append((index, sign * booked))
+    if not changes:
+        return
+
+    resource_ids = {resource_id for resource_id, _ in changes}
+    weeks = {week for _, week in changes}
+    with transaction.atomic():
+        lock_resources(*resource_ids)
+        rows = HeatmapWeek.objects.select_for_update().filter(resource_id__in=resource_ids, week__in=weeks)
+        updated = _update_rows(rows, changes, lambda row: (row.resource_id, row.week))
+        if updated:
+            HeatmapWeek.objects.bulk_update(updated, ['minutes'])
+
+        types = dict(Resource.objects.filter(pk__in=resource_ids).values_list('pk', 'type'))
+        scope_changes = defaultdict(list)
+        for (resource_id, week), week_changes in changes.items():
+            scope_changes[ALL_SCOPE, week].extend(week_changes)
+            if resource_id in types:
+                scope_changes[type_scope(types[resource_id]), week].extend(week_changes)
+        # Rows still being built are updated too; the build overwrites them.
+        rows = (
+            HeatmapScopeWeek.objects.select_for_update()
+            .filter(scope__in={scope for scope, _ in scope_changes}, week__in=weeks)
+            .order_by('scope', 'week')
+        )
+        updated = _update_rows(rows, scope_changes, lambda row: (row.scope, row.week))
+        if updated:
+            HeatmapScopeWeek.objects.bulk_update(updated, ['minutes'])
+
+
+def invalidate_heatmaps(*resource_ids):
+    """Drops stored weeks, with those of the resources' scopes, so they
+    are rebuilt on the next read."""
+    rows = HeatmapWeek.objects.all()
+    scope_rows = HeatmapScopeWeek.objects.all()
+    if resource_ids:
+        rows = rows.filter(resource_id__in=resource_ids)
+        types = Resource.objects.filter(pk__in=resource_ids).values_list('type', flat=True).distinct()
+        scope_rows = scope_rows.filter(scope__in=[ALL_SCOPE, *map(type_scope, types)])
+    return rows.delete()[0] + scope_rows.delete()[0]
+
+
+def invalidate_type_heatmaps(*resource_types):
+    """Drops the stored weeks of these types' scopes, e.g. after a resource
+    moves from one type to another."""
+    return HeatmapScopeWeek.objects.filter(scope__in=[type_scope(value) for value in resource_types]).delete()[0]
@@ -0,0 +1,95 @@
+"""Idempotency keys for POSTs that create bookings or start payments.
+
+Forms carry a hidden single-use key. The first POST with a key claims it
+in the cache with cache.add (atomic on every backend); when the view ends
+in a redirect, the redirect replaces the claim for IDEMPOTENCY_KEY_TTL.
+A repeat of the same key (double-click, browser retry) gets that redirect
+back without the view running again; one arriving while the first is still
+running waits briefly for its result. Outcomes other than a redirect (form
+errors, a failed payment call) release the key so the user can fix the
+form and resubmit.
+
+With the per-process LocMemCache, duplicates are only caught within one
+worker; a shared cache backend covers them all.
+"""
+import re
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect
+
+
+IDEMPOTENCY_KEY_FIELD = 'idempotency_key'
+IDEMPOTENCY_CACHE_KEY = 'booking:idempotency:{scope}:{user_id}:{key}'
+
+# Lifetime of a claim whose request has not finished; a worker that dies
+# mid-request only blocks its key for this long.
+IN_FLIGHT_TTL = 60
+IN_FLIGHT = 'in-flight'
+POLL_SECONDS = 0.1
+
+_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def _posted_key(request):
+    key = request.POST.get(IDEMPOTENCY_KEY_FIELD, '')
+    return key if _KEY_RE.match(key) else None
+
+
+def _await_result(cache_key):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        stored = cache.get(cache_key)
+        if stored != IN_FLIGHT or time.monotonic() >= deadline:
+            return stored
+        time.sleep(POLL_SECONDS)
+
+
+def idempotent(scope):
+    """Replays the original redirect for POSTs repeating an idempotency key.
+
+    POSTs without a well-formed key run as usual.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = _posted_key(request) if request.method == 'POST' else None
+            if key is None:
+                return view_func(request, *args, **kwargs)
+
+            cache_key = IDEMPOTENCY_CACHE_KEY.format(scope=scope, user_id=request.user.pk, key=key)
+            if not cache.add(cache_key, IN_FLIGHT, IN_FLIGHT_TTL):
+                stored = _await_result(cache_key)
+                if stored == IN_FLIGHT:
+                    return HttpResponse(
+                        "This request is already being processed. Please wait a moment.", status=409,
+                    )
+                if stored is not None:
+                    messages.info(request, "This request was already submitted; showing its result.")
+                    return HttpResponseRedirect(stored)
+                # Released (the first attempt failed) or expired: run it afresh.
+                if not cache.add(cache_key, IN_FLIGHT, IN_FLIGHT_TTL):
+                    return HttpResponse(
+                        "This request is already being processed. Please wait a moment.", status=409,
+                    )
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except BaseException:
+                cache.delete(cache_key)
+                raise
+            if isinstance(response, HttpResponseRedirect):
+                cache.set(cache_key, response['Location'], settings.IDEMPOTENCY_KEY_TTL)
+            else:
+                cache.delete(cache_key)
+            return response
+        return wrapper
+    return decorator
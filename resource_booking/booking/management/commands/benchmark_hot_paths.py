@@ -0,0 +1,155 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.models import BookingRequest, Resource, UserMessage
+
+
+User = get_user_model()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the booking hot paths through the test client against the current "
+        "database and prints the results as JSON. Every request runs inside a "
+        "rolled-back transaction, so the dataset is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--search', default='Lab', help="Query string used for the resource_list search.")
+        parser.add_argument('--output', help="Also write the JSON results to this file.")
+        parser.add_argument('--only', nargs='*', help="Run only the named benchmarks.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        student = (
+            User.objects.filter(is_staff=False, is_superuser=False)
+            .annotate(n=Count('user_bookings')).order_by('-n').first()
+        )
+        reviewer = User.objects.filter(is_superuser=True).first()
+        resource = Resource.objects.filter(is_available=True).order_by('pk').first()
+        if not (student and reviewer and resource):
+            raise CommandError(
+                "Benchmarks need at least one student, one superuser and one available resource. "
+                "Run generate_synthetic_data and createsuperuser first."
+            )
+
+        start = timezone.now() + timedelta(days=3)
+        booking_post = {
+            'resource': resource.pk,
+            'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+            'end_time': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'Benchmark',
+            'status': BookingRequest.STATUS_PENDING,
+        }
+
+        student_client = Client(HTTP_HOST='localhost')
+        student_client.force_login(student)
+        reviewer_client = Client(HTTP_HOST='localhost')
+        reviewer_client.force_login(reviewer)
+
+        benchmarks = {
+            'booking_create_validation': lambda: student_client.post(reverse('booking:new_booking'), booking_post),
+            'admin_pending_requests': lambda: reviewer_client.get(reverse('booking:admin_pending_dashboard')),
+            'my_bookings_dashboard': lambda: student_client.get(reverse('booking:my_bookings_dashboard')),
+            'resource_list_search': lambda: student_client.get(reverse('booking:resource_list'), {'q': options['search']}),
+            'message_inbox': lambda: student_client.get(reverse('booking:message_inbox')),
+        }
+        if options['only']:
+            unknown = set(options['only']) - set(benchmarks)
+            if unknown:
+                raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+            benchmarks = {name: benchmarks[name] for name in options['only']}
+
+        results = {}
+        # The loops request far faster than a person could; time the views, not 429s.
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            for name, request in benchmarks.items():
+                results[name] = self._run(request, options['warmup'], options['iterations'])
+                self.stderr.write(f"{name}: median {results[name]['median_ms']} ms, {results[name]['queries']} queries")
+
+        report = {
+            'revision': _git_revision(),
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'resources': Resource.objects.count(),
+                'bookings': BookingRequest.objects.count(),
+                'messages': UserMessage.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    def _run(self, request, warmup, iterations):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        samples = []
+        status_codes = set()
+        for i in range(warmup + iterations):
+            queries = 0
+            with transaction.atomic():
+                with connection.execute_wrapper(count_query):
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if i >= warmup:
+                samples.append(elapsed * 1000)
+                status_codes.add(response.status_code)
+
+        return {
+            'min_ms': round(min(samples), 3),
+            'median_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(_percentile(samples, 0.95), 3),
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'max_ms': round(max(samples), 3),
+            'queries': queries,
+            'status_codes': sorted(status_codes),
+        }
@@ -0,0 +1,189 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from .load_test import _free_port, _percentile
+
+
+User = get_user_model()
+
+PAGES = {
+    'resource_list': 'booking:resource_list',
+    'home': 'booking:home',
+    'dashboard': 'booking:my_bookings_dashboard',
+    'inbox': 'booking:message_inbox',
+}
+
+AUTH_BACKEND = 'booking.auth.CachedModelBackend'
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the app once under WSGI (threaded runserver, sync views) and once under "
+        "ASGI (uvicorn, async views), drives both with the same concurrent logged-in "
+        "clients and reports requests per second and latency percentiles per page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help="Concurrent connections.")
+        parser.add_argument('--requests', type=int, default=40, help="Timed requests per client.")
+        parser.add_argument('--pages', default='resource_list,home,dashboard',
+                            help=f"Comma-separated pages to cycle through: {', '.join(PAGES)}.")
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--asgi-workers', type=int, default=1, help="uvicorn worker processes.")
+        parser.add_argument('--user-prefix', default='synth_user_')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        self.timeout = options['timeout']
+        pages = [page.strip() for page in options['pages'].split(',') if page.strip()]
+        unknown = set(pages) - set(PAGES)
+        if not pages or unknown:
+            raise CommandError(f"--pages must be drawn from: {', '.join(PAGES)}")
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        if set(modes) - {'wsgi', 'asgi'}:
+            raise CommandError("--modes must be drawn from: wsgi, asgi")
+        if 'asgi' in modes and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError("ASGI mode needs uvicorn: pip install uvicorn")
+
+        users = list(
+            User.objects.filter(username__startswith=options['user_prefix'], is_active=True)
+            .order_by('pk')[:options['clients']]
+        )
+        if len(users) < options['clients']:
+            raise CommandError("Not enough user accounts. Run generate_synthetic_data first.")
+        # Sessions are written straight to the database so the benchmark does
+        # not spend its time (or the server's) hashing passwords.
+        session_keys = [self._session_for(user) for user in users]
+        paths = [(page, reverse(PAGES[page])) for page in pages]
+
+        report = {'clients': options['clients'], 'requests_per_client': options['requests'], 'modes': {}}
+        try:
+            for mode in modes:
+                server, base_url = self._start_server(mode, options['asgi_workers'])
+                try:
+                    report['modes'][mode] = self._drive(base_url, session_keys, paths, options['requests'])
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            Session.objects.filter(session_key__in=session_keys).delete()
+        if {'wsgi', 'asgi'} <= set(report['modes']):
+            wsgi_rps = report['modes']['wsgi']['throughput_rps']
+            asgi_rps = report['modes']['asgi']['throughput_rps']
+            report['asgi_speedup'] = round(asgi_rps / wsgi_rps, 2) if wsgi_rps else None
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    def _session_for(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = AUTH_BACKEND
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def _start_server(self, mode, asgi_workers):
+        port = _free_port()
+        # The clients are deliberately flooding the server.
+        env = dict(os.environ, URBS_ASYNC_VIEWS='1' if mode == 'asgi' else '0', RATE_LIMIT_ENABLED='0')
+        if mode == 'asgi':
+            command = [
+                sys.executable, '-m', 'uvicorn', 'resource_booking.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(asgi_workers), '--no-access-log',
+            ]
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"The {mode.upper()} server did not start.")
+
+    def _drive(self, base_url, session_keys, paths, per_client):
+        lock = threading.Lock()
+        latencies = defaultdict(list)
+        failures = defaultdict(int)
+        start_line = threading.Barrier(len(session_keys) + 1)
+
+        def client(session_key):
+            http = requests.Session()
+            http.cookies.set(settings.SESSION_COOKIE_NAME, session_key)
+            # One untimed pass warms connections and per-process caches.
+            for _, path in paths:
+                try:
+                    http.get(base_url + path, timeout=self.timeout)
+                except requests.RequestException:
+                    pass
+            start_line.wait()
+            for index in range(per_client):
+                page, path = paths[index % len(paths)]
+                started = time.perf_counter()
+                try:
+                    response = http.get(base_url + path, timeout=self.timeout, allow_redirects=False)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies[page].append(elapsed)
+                    if not ok:
+                        failures[page] += 1
+
+        with ThreadPoolExecutor(max_workers=len(session_keys)) as pool:
+            futures = [pool.submit(client, key) for key in session_keys]
+            start_line.wait()
+            started = time.perf_counter()
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - started
+
+        total = sum(len(samples) for samples in latencies.values())
+        return {
+            'target': base_url,
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+            'failures': sum(failures.values()),
+            'pages': {
+                page: {
+                    'requests': len(samples),
+                    'p50_ms': _percentile(samples, 0.50),
+                    'p95_ms': _percentile(samples, 0.95),
+                    'p99_ms': _percentile(samples, 0.99),
+                    'failures': failures[page],
+                }
+                for page, samples in sorted(latencies.items())
+            },
+        }
@@ -0,0 +1,98 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.allocation import BestFitAllocator
+
+
+# (minutes, weight): mostly short loans with a tail of full-day ones.
+DURATIONS = [(30, 20), (60, 30), (120, 20), (240, 15), (480, 10), (1440, 5)]
+SLOT = 15
+DAY = 24 * 60
+
+
+class FirstFitAllocator(BestFitAllocator):
+    """Baseline: the first free unit in id order."""
+
+    def allocate(self, start, end):
+        for schedule in self.schedules.values():
+            if schedule.is_free(start, end):
+                schedule.add(start, end)
+                return schedule.unit_id
+        return None
+
+
+STRATEGIES = {
+    'best_fit': BestFitAllocator,
+    'first_fit': FirstFitAllocator,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the unit allocator in memory on a dense synthetic schedule: "
+        "requests arrive in random order against a pool of units and are placed "
+        "by best fit and by first fit. Reports speed and how many requests each "
+        "strategy could place, long ones separately."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--units', type=int, default=200)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--load', type=float, default=0.9,
+                            help="Requested unit-time as a fraction of the pool's total.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        requests = self._requests(options['units'], options['days'], options['load'], options['seed'])
+        report = {
+            'units': options['units'],
+            'days': options['days'],
+            'requests': len(requests),
+            'offered_load': options['load'],
+            'strategies': {name: self._run(cls, options['units'], requests) for name, cls in STRATEGIES.items()},
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    def _requests(self, units, days, load, seed):
+        rng = random.Random(seed)
+        lengths = [length for length, _ in DURATIONS]
+        weights = [weight for _, weight in DURATIONS]
+        budget = units * days * DAY * load
+        requests = []
+        while budget > 0:
+            length = rng.choices(lengths, weights)[0]
+            start = rng.randrange(0, days * DAY - length, SLOT)
+            requests.append((start, start + length))
+            budget -= length
+        return requests
+
+    def _run(self, allocator_class, units, requests):
+        allocator = allocator_class(range(units), horizon=DAY)
+        timings = []
+        placed = long_placed = long_total = 0
+        for start, end in requests:
+            began = time.perf_counter()
+            unit = allocator.allocate(start, end)
+            timings.append(time.perf_counter() - began)
+            is_long = end - start >= 480
+            long_total += is_long
+            if unit is not None:
+                placed += 1
+                long_placed += is_long
+        timings.sort()
+        return {
+            'placed': placed,
+            'placed_rate': round(placed / len(requests), 4),
+            'long_placed_rate': round(long_placed / long_total, 4) if long_total else None,
+            'allocations_per_s': round(len(requests) / sum(timings)),
+            'p50_us': round(timings[len(timings) // 2] * 1e6, 1),
+            'p99_us': round(timings[int(len(timings) * 0.99)] * 1e6, 1),
+        }
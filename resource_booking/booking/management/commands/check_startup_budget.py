@@ -0,0 +1,86 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing is imported yet: times what a new
+# worker pays before it can route its first request.
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.urls import get_resolver, resolve
+get_resolver().url_patterns
+resolve('/')
+finished = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - started) * 1000,
+    'urls_ms': (finished - setup_done) * 1000,
+    'total_ms': (finished - started) * 1000,
+    'deferred_loaded': [name for name in sys.argv[1:] if name in sys.modules],
+}))
+'''
+
+# Modules a worker should only import once a request needs them.
+DEFERRED_MODULES = ('django_daraja.mpesa.core', 'requests', 'cryptography')
+
+
+def probe_startup(runs):
+    """Runs PROBE in `runs` fresh interpreters; returns one sample each."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    samples = []
+    for _ in range(max(1, runs)):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, *DEFERRED_MODULES],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, env=env,
+        )
+        if result.returncode:
+            raise CommandError(f"Start-up probe failed:\n{result.stderr}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures cold start-up, django.setup() plus loading and resolving the URLconf, "
+        "in fresh interpreters and fails when the median exceeds the budget or when "
+        "the payment stack is imported before it is used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--budget-ms', type=float, default=settings.STARTUP_BUDGET_MS)
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        samples = probe_startup(options['runs'])
+
+        report = {
+            'runs': len(samples),
+            'budget_ms': options['budget_ms'],
+            'setup_ms': round(statistics.median(s['setup_ms'] for s in samples), 1),
+            'urls_ms': round(statistics.median(s['urls_ms'] for s in samples), 1),
+            'total_ms': round(statistics.median(s['total_ms'] for s in samples), 1),
+            'deferred_loaded': sorted({name for s in samples for name in s['deferred_loaded']}),
+        }
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+
+        problems = []
+        if report['total_ms'] > options['budget_ms']:
+            problems.append(f"start-up took {report['total_ms']} ms, over the {options['budget_ms']:g} ms budget")
+        if report['deferred_loaded']:
+            problems.append(f"imported at start-up: {', '.join(report['deferred_loaded'])}")
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS("Start-up is within budget."))
@@ -0,0 +1,189 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from booking.models import BookingRequest, Resource, UserMessage
+from booking.heatmap import invalidate_heatmaps
+from booking.occupancy import invalidate_resource_occupancy
+
+
+User = get_user_model()
+
+RESOURCE_NAMES = {
+    Resource.ROOM: ['Lecture Hall', 'Seminar Room', 'Tutorial Room', 'Boardroom'],
+    Resource.EQUIP: ['Projector', 'DSLR Camera', 'PA System', 'Laptop'],
+    Resource.LAB: ['Chemistry Lab', 'Computer Lab', 'Physics Lab', 'Robotics Lab'],
+    Resource.VEH: ['Minibus', 'Field Van', 'Staff Car'],
+    Resource.OTHER: ['Sports Field', 'Studio', 'Exhibition Stand'],
+}
+
+# Rough shape of a live term: most requests are settled, a tail is pending.
+STATUS_WEIGHTS = [
+    (BookingRequest.STATUS_APPROVED, 55),
+    (BookingRequest.STATUS_PENDING, 15),
+    (BookingRequest.STATUS_CANCELLED, 12),
+    (BookingRequest.STATUS_REJECTED, 8),
+    (BookingRequest.STATUS_COMPLETED, 10),
+]
+
+PURPOSES = [
+    'Lecture', 'Group project meeting', 'Club event', 'Exam revision',
+    'Lab practical', 'Field trip', 'Guest talk', 'Departmental workshop',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with synthetic users, resources, bookings and messages "
+        "using bulk inserts. Production scale is roughly --users 100000 --resources 10000 "
+        "--bookings 2000000 --messages 5000000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--resources', type=int, default=100)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--messages', type=int, default=50000)
+        parser.add_argument('--days', type=int, default=180,
+                            help="Bookings are spread over this many days either side of today.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='synth',
+                            help="Prefix for generated usernames and resource names.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Synthetic data with prefix '{prefix}' already exists. Use another --prefix.")
+
+        started = time.perf_counter()
+
+        user_ids = self._create_users(prefix, options['users'])
+        resources = self._create_resources(prefix, options['resources'])
+        sender_ids = list(
+            User.objects.filter(is_staff=True).values_list('pk', flat=True)
+        ) or user_ids[:1]
+
+        self._create_bookings(user_ids, resources, options['bookings'], options['days'])
+        self._create_messages(sender_ids, user_ids, options['messages'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synthetic dataset generated in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def _batches(self, total):
+        for offset in range(0, total, self.batch_size):
+            yield offset, min(self.batch_size, total - offset)
+
+    def _create_users(self, prefix, total):
+        # Hashing once keeps 100k users from costing 100k PBKDF2 rounds.
+        password = make_password('password')
+        now = timezone.now()
+        staff_every = 50
+
+        for offset, size in self._batches(total):
+            User.objects.bulk_create([
+                User(
+                    username=f'{prefix}_user_{i}',
+                    email=f'{prefix}_user_{i}@example.edu',
+                    password=password,
+                    is_staff=(i % staff_every == 0),
+                    date_joined=now - timedelta(days=self.rng.randint(0, 1000)),
+                )
+                for i in range(offset, offset + size)
+            ])
+            self.stdout.write(f"  users: {offset + size}/{total}")
+
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_user_')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def _create_resources(self, prefix, total):
+        types = list(RESOURCE_NAMES)
+
+        for offset, size in self._batches(total):
+            batch = []
+            for i in range(offset, offset + size):
+                resource_type = self.rng.choice(types)
+                base_name = self.rng.choice(RESOURCE_NAMES[resource_type])
+                quantity = 1 if resource_type in (Resource.ROOM, Resource.LAB) else self.rng.randint(1, 20)
+                cost = Decimal(self.rng.choice([0, 0, 0, 50, 100, 250, 500]))
+                batch.append(Resource(
+                    name=f'{prefix} {base_name} {i}',
+                    type=resource_type,
+                    description=f'Synthetic {base_name.lower()} for load testing.',
+                    quantity=quantity,
+                    cost=cost,
+                    is_available=self.rng.random() > 0.05,
+                ))
+            Resource.objects.bulk_create(batch)
+            self.stdout.write(f"  resources: {offset + size}/{total}")
+
+        return list(
+            Resource.objects.filter(name__startswith=f'{prefix} ')
+            .order_by('pk').values_list('pk', 'cost')
+        )
+
+    def _create_bookings(self, user_ids, resources, total, days):
+        statuses = [status for status, _ in STATUS_WEIGHTS]
+        weights = [weight for _, weight in STATUS_WEIGHTS]
+        today = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+        for offset, size in self._batches(total):
+            batch = []
+            for _ in range(size):
+                resource_id, cost = self.rng.choice(resources)
+                start = today + timedelta(
+                    days=self.rng.randint(-days, days),
+                    hours=self.rng.randint(8, 19) - today.hour,
+                    minutes=self.rng.choice([0, 15, 30, 45]),
+                )
+                end = start + timedelta(minutes=self.rng.choice([30, 60, 60, 90, 120, 180, 240]))
+                status = self.rng.choices(statuses, weights)[0]
+                if cost > 0:
+                    payment_status = BookingRequest.PAYMENT_PAID if status != BookingRequest.STATUS_PENDING else BookingRequest.PAYMENT_PENDING
+                else:
+                    payment_status = BookingRequest.PAYMENT_NOT_REQUIRED
+                batch.append(BookingRequest(
+                    user_id=self.rng.choice(user_ids),
+                    resource_id=resource_id,
+                    start_time=start,
+                    end_time=end,
+                    purpose=self.rng.choice(PURPOSES),
+                    status=status,
+                    payment_status=payment_status,
+                ))
+            with transaction.atomic():
+                BookingRequest.objects.bulk_create(batch)
+            self.stdout.write(f"  bookings: {offset + size}/{total}")
+        # bulk_create skips the signals that keep the occupancy index and
+        # heatmaps current.
+        invalidate_resource_occupancy(*[resource_id for resource_id, _ in resources])
+        invalidate_heatmaps(*[resource_id for resource_id, _ in resources])
+
+    def _create_messages(self, sender_ids, user_ids, total):
+        for offset, size in self._batches(total):
+            batch = [
+                UserMessage(
+                    sender_id=self.rng.choice(sender_ids),
+                    recipient_id=self.rng.choice(user_ids),
+                    subject=f'Booking update #{offset + i}',
+                    body='Your booking request has been reviewed. Check your dashboard for details.',
+                    is_read=self.rng.random() < 0.7,
+                )
+                for i in range(size)
+            ]
+            with transaction.atomic():
+                UserMessage.objects.bulk_create(batch)
+            self.stdout.write(f"  messages: {offset + size}/{total}")
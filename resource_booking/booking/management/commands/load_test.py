@@ -0,0 +1,371 @@
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.models import BookingRequest, Resource
+
+
+User = get_user_model()
+
+BOOKING_PK_RE = re.compile(r'/(?:success|payment/initiate)/(\d+)/')
+REVIEW_PK_RE = re.compile(r'/admin/pending/review/(\d+)/')
+
+OCCUPYING_STATUSES = [BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_PENDING]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+def find_capacity_violations(since):
+    """Sweeps every resource booked since `since` and reports windows where
+    more PENDING/APPROVED bookings overlap than the resource has units.
+
+    Only overlaps that involve at least one booking made since `since` are
+    reported, so pre-existing (e.g. synthetic) data does not drown the result.
+    """
+    resource_ids = set(
+        BookingRequest.objects.filter(requested_on__gte=since).values_list('resource_id', flat=True)
+    )
+    quantities = dict(Resource.objects.filter(pk__in=resource_ids).values_list('pk', 'quantity'))
+
+    events = defaultdict(list)
+    bookings = BookingRequest.objects.filter(
+        resource_id__in=resource_ids, status__in=OCCUPYING_STATUSES,
+    ).values_list('resource_id', 'start_time', 'end_time', 'requested_on')
+    for resource_id, start, end, requested_on in bookings.iterator():
+        is_new = int(requested_on >= since)
+        # Ends sort before starts at the same instant: back-to-back is fine.
+        events[resource_id].append((start, 1, is_new))
+        events[resource_id].append((end, -1, -is_new))
+
+    violations = []
+    for resource_id, resource_events in events.items():
+        in_use = new_in_use = peak = 0
+        peak_at = None
+        for at, delta, new_delta in sorted(resource_events):
+            in_use += delta
+            new_in_use += new_delta
+            if new_in_use and in_use > quantities[resource_id] and in_use > peak:
+                peak, peak_at = in_use, at
+        if peak_at is not None:
+            violations.append({
+                'resource_id': resource_id,
+                'quantity': quantities[resource_id],
+                'peak_overlap': peak,
+                'at': peak_at.isoformat(),
+            })
+    return violations
+
+
+class SimulatedUser(threading.Thread):
+
+    def __init__(self, harness, username, password, reviewer=False):
+        super().__init__(daemon=True)
+        self.harness = harness
+        self.username = username
+        self.password = password
+        self.reviewer = reviewer
+        self.rng = random.Random(f'{harness.seed}:{username}')
+        self.session = requests.Session()
+        self.own_bookings = []
+
+    def request(self, action, method, path, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('timeout', self.harness.timeout)
+        if method == 'POST':
+            kwargs.setdefault('headers', {})['X-CSRFToken'] = self.session.cookies.get('csrftoken', '')
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.harness.base_url + path, **kwargs)
+        except requests.RequestException as exc:
+            self.harness.record(action, time.perf_counter() - started, None, error=type(exc).__name__)
+            return None
+        self.harness.record(action, time.perf_counter() - started, response.status_code)
+        return response
+
+    def login(self):
+        self.request('login_form', 'GET', reverse('login'))
+        response = self.request('login', 'POST', reverse('login'), data={
+            'username': self.username, 'password': self.password,
+        })
+        return response is not None and response.status_code == 302
+
+    def run(self):
+        # Logins (deliberately slow password hashing) happen before the
+        # measured window opens.
+        try:
+            logged_in = self.login()
+        except Exception:
+            # Nobody else may wait for this thread at the start line.
+            self.harness.start_line.abort()
+            raise
+        try:
+            self.harness.start_line.wait()
+        except threading.BrokenBarrierError:
+            return
+        if not logged_in:
+            self.harness.count('failed_logins')
+            return
+        while not self.harness.stopping.is_set():
+            if self.reviewer:
+                self.review()
+            else:
+                action = self.rng.choices(self.harness.actions, self.harness.weights)[0]
+                getattr(self, action)()
+            if self.harness.think_time:
+                time.sleep(self.rng.uniform(0, self.harness.think_time))
+
+    def browse(self):
+        if self.rng.random() < 0.5:
+            self.request('browse_resources', 'GET', reverse('booking:resource_list'))
+        else:
+            self.request('search_resources', 'GET', reverse('booking:resource_list'),
+                         params={'q': self.rng.choice(self.harness.search_terms)})
+
+    def dashboard(self):
+        self.request('dashboard', 'GET', reverse('booking:my_bookings_dashboard'))
+
+    def book(self):
+        self.request('booking_form', 'GET', reverse('booking:new_booking'))
+        start = self.harness.window_start + timedelta(
+            days=self.rng.randint(0, self.harness.window_days - 1),
+            hours=self.rng.randint(8, 18),
+        )
+        end = start + timedelta(hours=self.rng.choice([1, 1, 2]))
+        response = self.request('book', 'POST', reverse('booking:new_booking'), data={
+            'resource': self.rng.choice(self.harness.resource_ids),
+            'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+            'end_time': end.strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'Load test',
+            'status': BookingRequest.STATUS_PENDING,
+        })
+        if response is None:
+            return
+        if response.status_code == 302:
+            match = BOOKING_PK_RE.search(response.headers.get('Location', ''))
+            if match:
+                self.own_bookings.append(int(match.group(1)))
+            self.harness.count('bookings_accepted')
+        elif response.status_code == 200:
+            self.harness.count('bookings_rejected_by_validation')
+
+    def cancel(self):
+        if not self.own_bookings:
+            return self.book()
+        pk = self.own_bookings.pop(self.rng.randrange(len(self.own_bookings)))
+        self.request('cancel', 'POST', reverse('booking:cancel_booking', args=[pk]))
+
+    def review(self):
+        response = self.request('review_list', 'GET', reverse('booking:admin_pending_dashboard'))
+        if response is None or response.status_code != 200:
+            return
+        pks = REVIEW_PK_RE.findall(response.text)
+        for pk in self.rng.sample(pks, min(len(pks), 5)):
+            self.request('review', 'POST', reverse('booking:admin_review_booking', args=[pk]), data={
+                'action': self.rng.choice(['approve', 'approve', 'reject']),
+            })
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs many simulated users (one thread each) against a local server, mixing "
+        "browsing, booking, cancellation and admin review, then reports throughput, "
+        "latency percentiles, error rates and capacity violations found in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Target an already running server instead of starting one.")
+        parser.add_argument('--users', type=int, default=50, help="Concurrent simulated students.")
+        parser.add_argument('--reviewers', type=int, default=2, help="Concurrent simulated admins.")
+        parser.add_argument('--duration', type=float, default=60.0, help="Seconds to run for.")
+        parser.add_argument('--think-time', type=float, default=0.5, help="Maximum random pause between actions.")
+        parser.add_argument('--mix', default='browse=45,dashboard=20,book=25,cancel=10',
+                            help="Relative weights of student actions.")
+        parser.add_argument('--user-prefix', default='synth_user_')
+        parser.add_argument('--password', default='password',
+                            help="Password shared by the student and reviewer accounts.")
+        parser.add_argument('--window-days', type=int, default=7,
+                            help="Bookings target the next N days, which controls contention.")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.timeout = options['timeout']
+        self.think_time = options['think_time']
+        self.window_days = options['window_days']
+        self.window_start = (timezone.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.search_terms = ['Lab', 'Hall', 'Projector', 'Camera', 'Room']
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(list)
+        self._statuses = defaultdict(lambda: defaultdict(int))
+        self._errors = defaultdict(lambda: defaultdict(int))
+        self._counters = defaultdict(int)
+        self._closed = False
+
+        try:
+            mix = dict(item.split('=') for item in options['mix'].split(','))
+            self.actions = list(mix)
+            self.weights = [float(weight) for weight in mix.values()]
+        except ValueError:
+            raise CommandError("--mix must look like 'browse=45,book=25'.")
+        unknown = set(self.actions) - {'browse', 'dashboard', 'book', 'cancel'}
+        if unknown:
+            raise CommandError(f"Unknown action(s) in --mix: {', '.join(sorted(unknown))}")
+
+        self.resource_ids = list(Resource.objects.filter(is_available=True).values_list('pk', flat=True))
+        students = list(
+            User.objects.filter(username__startswith=options['user_prefix'], is_staff=False)
+            .order_by('pk').values_list('username', flat=True)[:options['users']]
+        )
+        reviewers = list(
+            User.objects.filter(is_superuser=True).order_by('pk').values_list('username', flat=True)[:options['reviewers']]
+        )
+        if not self.resource_ids or len(students) < options['users']:
+            raise CommandError("Not enough resources or student accounts. Run generate_synthetic_data first.")
+
+        server = None
+        if options['url']:
+            self.base_url = options['url'].rstrip('/')
+        else:
+            server, self.base_url = self._start_server()
+
+        started_at = timezone.now()
+        workers = [SimulatedUser(self, username, options['password']) for username in students]
+        workers += [SimulatedUser(self, username, options['password'], reviewer=True) for username in reviewers]
+        self.start_line = threading.Barrier(len(workers) + 1)
+        try:
+            for worker in workers:
+                worker.start()
+            try:
+                # A login is two requests, each bounded by --timeout.
+                self.start_line.wait(2 * self.timeout)
+            except threading.BrokenBarrierError:
+                raise CommandError("A simulated user failed or timed out while logging in.")
+            started = time.perf_counter()
+            time.sleep(options['duration'])
+            self.stopping.set()
+            deadline = time.monotonic() + self.timeout
+            for worker in workers:
+                worker.join(max(0.0, deadline - time.monotonic()))
+            elapsed = time.perf_counter() - started
+        finally:
+            self.stopping.set()
+            self.start_line.abort()
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        # Workers still stuck in a request may finish later; they must not
+        # change the results while they are being reported.
+        with self._lock:
+            self._closed = True
+        stragglers = sum(worker.is_alive() for worker in workers)
+        if stragglers:
+            self._counters['workers_not_stopped'] = stragglers
+        report = self._report(elapsed, started_at, len(students), len(reviewers))
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+        if report['capacity_violations']:
+            self.stderr.write(self.style.ERROR(
+                f"{len(report['capacity_violations'])} resource(s) are oversubscribed."
+            ))
+
+    def _start_server(self):
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}'],
+            cwd=settings.BASE_DIR, env=dict(os.environ, RATE_LIMIT_ENABLED='0'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("The local server did not start.")
+
+    def record(self, action, seconds, status, error=None):
+        with self._lock:
+            if self._closed:
+                return
+            self._latencies[action].append(seconds * 1000)
+            if error:
+                self._errors[action][error] += 1
+            else:
+                self._statuses[action][status] += 1
+
+    def count(self, name):
+        with self._lock:
+            if self._closed:
+                return
+            self._counters[name] += 1
+
+    def _report(self, elapsed, started_at, students, reviewers):
+        actions = {}
+        total = failed = 0
+        for action, samples in sorted(self._latencies.items()):
+            statuses = self._statuses[action]
+            errors = self._errors[action]
+            server_errors = sum(count for status, count in statuses.items() if status >= 500)
+            action_failed = server_errors + sum(errors.values())
+            total += len(samples)
+            failed += action_failed
+            actions[action] = {
+                'requests': len(samples),
+                'p50_ms': _percentile(samples, 0.50),
+                'p95_ms': _percentile(samples, 0.95),
+                'p99_ms': _percentile(samples, 0.99),
+                'max_ms': round(max(samples), 3),
+                'error_rate': round(action_failed / len(samples), 4),
+                'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+                'errors': dict(errors),
+            }
+
+        return {
+            'target': self.base_url,
+            'students': students,
+            'reviewers': reviewers,
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+            'error_rate': round(failed / total, 4) if total else None,
+            'counters': dict(self._counters),
+            'actions': actions,
+            'capacity_violations': find_capacity_violations(started_at),
+        }
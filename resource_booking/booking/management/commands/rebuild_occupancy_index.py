@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.models import Resource
+from booking.heatmap import invalidate_heatmaps
+from booking.occupancy import invalidate_resource_occupancy, load_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops the stored slot occupancy index and heatmap weeks so they are rebuilt "
+        "from the bookings table, e.g. after bulk imports or raw SQL edits. With --days, rebuilds that "
+        "many days from today straight away instead of on first lookup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', type=int, action='append', dest='resources',
+                            help="Only this resource id (repeatable).")
+        parser.add_argument('--days', type=int, default=0)
+
+    def handle(self, *args, **options):
+        resource_ids = options['resources'] or []
+        dropped = invalidate_resource_occupancy(*resource_ids)
+        self.stdout.write(f"Dropped {dropped} stored day(s).")
+        dropped = invalidate_heatmaps(*resource_ids)
+        self.stdout.write(f"Dropped {dropped} stored heatmap week(s).")
+
+        if options['days'] > 0:
+            today = timezone.now().date()
+            days = [today + timedelta(days=offset) for offset in range(options['days'])]
+            resources = Resource.objects.all()
+            if resource_ids:
+                resources = resources.filter(pk__in=resource_ids)
+            count = 0
+            for resource_id in resources.values_list('pk', flat=True).iterator():
+                load_days(resource_id, days)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(days)} day(s) for {count} resource(s)."))
@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from booking.reminders import prune_reminders, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Messages the owners of approved bookings that start within "
+        "BOOKING_REMINDER_LEAD_MINUTES, once per booking and start time. Runs one "
+        "pass (e.g. from cron), or with --loop keeps running as the scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, one pass per interval.")
+        parser.add_argument('--interval', type=float, default=settings.BOOKING_REMINDER_INTERVAL_SECONDS,
+                            help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            now = timezone.now()
+            sent = send_due_reminders(now)
+            pruned = prune_reminders(now - timedelta(days=settings.BOOKING_REMINDER_RETENTION_DAYS))
+            self.stdout.write(
+                f"{now:%Y-%m-%d %H:%M:%S} sent {sent} reminder(s), pruned {pruned} old record(s) "
+                f"in {(time.monotonic() - started) * 1000:.0f} ms."
+            )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
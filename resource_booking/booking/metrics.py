@@ -0,0 +1,252 @@
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger('booking.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request accumulator for query and template time. Set by the
+# middleware, added to by _record_query and InstrumentedDjangoTemplates;
+# None when nobody is measuring. asgiref copies the context into
+# sync_to_async threads, so queries made there are counted too.
+_request_stats = ContextVar('booking_request_stats', default=None)
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+class MetricsRegistry:
+    """In-process store of per-view request metrics.
+
+    Each worker process keeps its own registry, so a scraper sees the numbers
+    of whichever worker answered the /metrics request.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._views = {}
+        self._statuses = {}
+
+    def observe(self, view, method, status, duration, stats, response_bytes):
+        with self._lock:
+            entry = self._views.get((view, method))
+            if entry is None:
+                entry = self._views[(view, method)] = {
+                    'buckets': [0] * len(self.buckets),
+                    'count': 0,
+                    'duration': 0.0,
+                    'queries': 0,
+                    'db_seconds': 0.0,
+                    'template_seconds': 0.0,
+                    'response_bytes': 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            entry['count'] += 1
+            entry['duration'] += duration
+            entry['queries'] += stats.queries
+            entry['db_seconds'] += stats.db_seconds
+            entry['template_seconds'] += stats.template_seconds
+            entry['response_bytes'] += response_bytes
+
+            status_key = (view, method, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._statuses.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            views = {key: dict(value, buckets=list(value['buckets'])) for key, value in self._views.items()}
+            statuses = dict(self._statuses)
+
+        lines = [
+            '# HELP urbs_requests_total Requests handled, by view, method and status code.',
+            '# TYPE urbs_requests_total counter',
+        ]
+        for (view, method, status), count in sorted(statuses.items()):
+            lines.append(f'urbs_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP urbs_request_duration_seconds Wall-clock time spent in the view stack.',
+            '# TYPE urbs_request_duration_seconds histogram',
+        ]
+        for (view, method), entry in sorted(views.items()):
+            labels = f'view="{view}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry['buckets']):
+                cumulative += count
+                lines.append(f'urbs_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'urbs_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f'urbs_request_duration_seconds_sum{{{labels}}} {entry["duration"]:.6f}')
+            lines.append(f'urbs_request_duration_seconds_count{{{labels}}} {entry["count"]}')
+
+        counters = [
+            ('urbs_db_queries_total', 'queries', 'Database queries executed.'),
+            ('urbs_db_seconds_total', 'db_seconds', 'Time spent executing database queries.'),
+            ('urbs_template_render_seconds_total', 'template_seconds', 'Time spent rendering templates.'),
+            ('urbs_response_bytes_total', 'response_bytes', 'Bytes of non-streaming response bodies.'),
+        ]
+        for name, field, help_text in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (view, method), entry in sorted(views.items()):
+                value = entry[field]
+                if isinstance(value, float):
+                    value = f'{value:.6f}'
+                lines.append(f'{name}{{view="{view}",method="{method}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that reports render time to the metrics middleware."""
+
+    def get_template(self, template_name):
+        return _InstrumentedTemplate(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return _InstrumentedTemplate(super().from_string(template_code))
+
+
+class _InstrumentedTemplate:
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        stats = _request_stats.get()
+        if stats is None:
+            return self._template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def _install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_on_open_connections(**kwargs):
+    # request_started runs in the thread that serves the request's sync
+    # code (under ASGI, the sync_to_async thread), whose connections may
+    # have opened before the middleware was loaded.
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection)
+
+
+class RequestMetricsMiddleware:
+    """Records latency, DB and template cost for every request.
+
+    Disabled entirely (removed from the middleware chain) unless
+    BOOKING_METRICS_ENABLED is true. Runs natively under both WSGI and ASGI
+    so it never forces async views through a sync adapter.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BOOKING_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request_seconds = settings.BOOKING_METRICS_SLOW_REQUEST_MS / 1000
+        self.slow_query_count = settings.BOOKING_METRICS_SLOW_QUERY_COUNT
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections are per thread: each gets the query recorder when it
+        # opens, or when a request starts on a thread that already has one.
+        connection_created.connect(_install_query_recorder, dispatch_uid='booking_metrics_query_recorder')
+        request_started.connect(_install_on_open_connections, dispatch_uid='booking_metrics_query_recorder')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def _observe(self, request, response, duration, stats):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        response_bytes = 0 if response.streaming else len(response.content)
+
+        registry.observe(view, request.method, response.status_code, duration, stats, response_bytes)
+
+        if duration >= self.slow_request_seconds or stats.queries >= self.slow_query_count:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_queries': stats.queries,
+                'db_ms': round(stats.db_seconds * 1000, 2),
+                'template_ms': round(stats.template_seconds * 1000, 2),
+                'response_bytes': response_bytes,
+                'user_id': getattr(getattr(request, '_acached_user', None) or getattr(request, '_cached_user', None), 'pk', None),
+            }))
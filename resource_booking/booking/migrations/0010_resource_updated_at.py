@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_alter_bookingrequest_options_alter_resource_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_changeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slots', models.BinaryField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy_days', to='booking.resource')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resource', 'day'), name='unique_resource_occupancy_day')],
+            },
+        ),
+    ]
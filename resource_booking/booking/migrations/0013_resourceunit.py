@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_occupancyday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100)),
+                ('is_active', models.BooleanField(default=True, help_text='Untick while the unit is out of service.')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='units', to='booking.resource')),
+            ],
+            options={
+                'ordering': ['resource', 'label'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='unit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='booking.resourceunit'),
+        ),
+        migrations.AddConstraint(
+            model_name='resourceunit',
+            constraint=models.UniqueConstraint(fields=('resource', 'label'), name='unique_resource_unit_label'),
+        ),
+    ]
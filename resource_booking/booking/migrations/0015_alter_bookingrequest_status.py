@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_bookingevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookingrequest',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending Review'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed'), ('ARCHIVED', 'Archived')], default='PENDING', max_length=10),
+        ),
+    ]
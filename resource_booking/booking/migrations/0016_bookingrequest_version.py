@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_alter_bookingrequest_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0016_bookingrequest_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['start_time', 'id'], name='booking_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['resource', 'start_time'], name='booking_resource_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['user', 'start_time'], name='booking_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['status', 'start_time'], name='booking_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['payment_status', 'start_time'], name='booking_payment_start_idx'),
+        ),
+    ]
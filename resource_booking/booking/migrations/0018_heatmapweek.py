@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_bookingrequest_explorer_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatmapWeek',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('minutes', models.BinaryField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heatmap_weeks', to='booking.resource')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resource', 'week'), name='unique_resource_heatmap_week')],
+            },
+        ),
+    ]
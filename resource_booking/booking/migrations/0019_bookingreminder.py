@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0018_heatmapweek'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='booking.bookingrequest')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('booking', 'start_time'), name='unique_booking_reminder')],
+            },
+        ),
+    ]
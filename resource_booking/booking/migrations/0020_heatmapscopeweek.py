@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0019_bookingreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatmapScopeWeek',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=20)),
+                ('week', models.DateField()),
+                ('minutes', models.BinaryField()),
+                ('built', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'week'), name='unique_heatmap_scope_week')],
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db.models import Sum, Q
@@ -50,6 +50,10 @@ class Resource(models.Model):
     is_available = models.BooleanField(
         default=True, 
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ['name']
@@ -66,28 +70,45 @@ class Resource(models.Model):
         return f"{self.name} ({self.get_type_display()})" 
 
     def get_currently_booked_quantity(self, start_time, end_time, exclude_booking_pk=None):
-        
-        conflicts = self.resource_bookings.filter(
-            Q(status=BookingRequest.STATUS_APPROVED) | Q(status=BookingRequest.STATUS_PENDING),
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        )
-        
-        if exclude_booking_pk:
-            conflicts = conflicts.exclude(pk=exclude_booking_pk)
-            
-        return conflicts.count()
+        # Peak number of units in use at any moment of the window.
+        from .occupancy import peak_usage
+        return peak_usage(self, start_time, end_time, exclude_booking_pk=exclude_booking_pk)
 
     def get_available_quantity_at_time(self, start_time, end_time):
         booked_count = self.get_currently_booked_quantity(start_time, end_time)
         return self.quantity - booked_count
 
+class ResourceUnit(models.Model):
+    """One physical item of a pooled resource (a specific projector, van...).
+
+    Resources with units take their quantity from the active unit count and
+    every approved booking is assigned a unit (see booking/allocation.py).
+    """
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='units')
+    label = models.CharField(max_length=100)
+    is_active = models.BooleanField(
+        default=True,
+        help_text="Untick while the unit is out of service.",
+    )
+
+    class Meta:
+        ordering = ['resource', 'label']
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'label'], name='unique_resource_unit_label'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource.name} – {self.label}"
+
+
 class BookingRequest(models.Model):
     
     STATUS_PENDING = 'PENDING'
     STATUS_APPROVED = 'APPROVED'
     STATUS_REJECTED = 'REJECTED'
     STATUS_CANCELLED = 'CANCELLED'
+    STATUS_COMPLETED = 'COMPLETED'
     STATUS_ARCHIVED = 'ARCHIVED'
     
     STATUS_CHOICES = [
@@ -95,9 +116,21 @@ class BookingRequest(models.Model):
         (STATUS_APPROVED, 'Approved'),
         (STATUS_REJECTED, 'Rejected'),
         (STATUS_CANCELLED, 'Cancelled'),
+        (STATUS_COMPLETED, 'Completed'),
         (STATUS_ARCHIVED, 'Archived'),
     ]
 
+    # Every status change must be listed here; booking/transitions.py
+    # applies them.
+    TRANSITIONS = {
+        STATUS_PENDING: {STATUS_APPROVED, STATUS_REJECTED, STATUS_CANCELLED},
+        STATUS_APPROVED: {STATUS_COMPLETED, STATUS_CANCELLED, STATUS_REJECTED},
+        STATUS_REJECTED: {STATUS_PENDING, STATUS_APPROVED, STATUS_ARCHIVED},
+        STATUS_CANCELLED: {STATUS_ARCHIVED},
+        STATUS_COMPLETED: {STATUS_ARCHIVED},
+        STATUS_ARCHIVED: set(),
+    }
+
     PAYMENT_NOT_REQUIRED = 'NOT_REQUIRED'
     PAYMENT_PENDING = 'PENDING'
     PAYMENT_PAID = 'PAID'
@@ -122,6 +155,14 @@ class BookingRequest(models.Model):
         related_name='resource_bookings', 
     )
     
+    unit = models.ForeignKey(
+        ResourceUnit,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bookings',
+    )
+    
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
 
@@ -142,6 +183,10 @@ class BookingRequest(models.Model):
     )
     
     requested_on = models.DateTimeField(auto_now_add=True)
+
+    # Incremented by every write in booking/transitions.py; edits only
+    # apply while the version they were made from is still current.
+    version = models.PositiveIntegerField(default=1)
     
     class Meta:
         ordering = ['start_time']
@@ -151,10 +196,153 @@ class BookingRequest(models.Model):
         permissions = [
             ("can_review_booking", "Can approve or reject pending bookings"),
         ]
+        # One per booking explorer filter (booking/explorer.py), each ending
+        # in start_time so a filtered page is a range scan in display order.
+        indexes = [
+            models.Index(fields=['start_time', 'id'], name='booking_start_idx'),
+            models.Index(fields=['resource', 'start_time'], name='booking_resource_start_idx'),
+            models.Index(fields=['user', 'start_time'], name='booking_user_start_idx'),
+            models.Index(fields=['status', 'start_time'], name='booking_status_start_idx'),
+            models.Index(fields=['payment_status', 'start_time'], name='booking_payment_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.resource.name} booked by {self.user.username} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        # post_save updates the occupancy and heatmap indexes, which must
+        # change in the same transaction as the row (booking/occupancy.py).
+        from .transitions import lock_booking_resources
+        if not self._state.adding:
+            # Like every write in booking/transitions.py, so a transition
+            # from an instance loaded before this save no longer matches.
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        with transaction.atomic(using=kwargs.get('using')):
+            lock_booking_resources(self)
+            super().save(*args, **kwargs)
+
+
+class BookingEvent(models.Model):
+    """One status transition of a booking: who, when, from -> to and why.
+
+    Append-only and written in batches by booking/audit.py. The foreign keys
+    carry no database constraint so the history outlives deleted bookings,
+    resources and users.
+    """
+
+    booking = models.ForeignKey(
+        BookingRequest, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events',
+    )
+    resource = models.ForeignKey(
+        Resource, on_delete=models.DO_NOTHING, db_constraint=False, related_name='booking_events',
+    )
+    actor = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='booking_events',
+    )
+    from_status = models.CharField(max_length=10, blank=True)
+    to_status = models.CharField(max_length=10)
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['booking', 'created_at'], name='bookingevent_booking_idx'),
+            models.Index(fields=['resource', 'created_at'], name='bookingevent_resource_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking {self.booking_id}: {self.from_status or 'NEW'} -> {self.to_status}"
+
+
+class BookingReminder(models.Model):
+    """A reminder sent for a booking starting at `start_time`.
+
+    The unique constraint makes booking/reminders.py send at most one
+    reminder per booking and start time; a rescheduled booking is reminded
+    again for its new time.
+    """
+
+    booking = models.ForeignKey(BookingRequest, on_delete=models.CASCADE, related_name='reminders')
+    start_time = models.DateTimeField()
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['booking', 'start_time'], name='unique_booking_reminder'),
+        ]
+
+    def __str__(self):
+        return f"Reminder for booking {self.booking_id} starting {self.start_time}"
+
+
+class OccupancyDay(models.Model):
+    """Units of a resource in use per 15-minute slot over one UTC day.
+
+    `slots` holds one unsigned 16-bit counter per slot (see
+    booking/occupancy.py). Rows are kept current as bookings change and
+    rebuilt from BookingRequest when missing.
+    """
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='occupancy_days')
+    day = models.DateField()
+    slots = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'day'], name='unique_resource_occupancy_day'),
+        ]
+
+    def __str__(self):
+        return f"Occupancy of resource {self.resource_id} on {self.day}"
+
+
+class HeatmapWeek(models.Model):
+    """Booked unit-minutes of a resource per hour-of-week bin over one week.
+
+    `week` is the week's local Monday and `minutes` one unsigned 32-bit
+    counter per bin (see booking/heatmap.py). Rows are kept current as
+    bookings change and rebuilt from BookingRequest when missing.
+    """
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='heatmap_weeks')
+    week = models.DateField()
+    minutes = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'week'], name='unique_resource_heatmap_week'),
+        ]
+
+    def __str__(self):
+        return f"Heatmap of resource {self.resource_id} for the week of {self.week}"
+
+
+class HeatmapScopeWeek(models.Model):
+    """HeatmapWeek summed over every resource (scope 'all') or one resource
+    type ('type:<TYPE>'), so a heatmap of many resources reads one row per
+    week.
+
+    Rows are inserted empty with `built` false and then filled from
+    BookingRequest under the row locks (see booking/heatmap.py); readers
+    ignore rows that are not built yet.
+    """
+
+    scope = models.CharField(max_length=20)
+    week = models.DateField()
+    minutes = models.BinaryField()
+    built = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'week'], name='unique_heatmap_scope_week'),
+        ]
+
+    def __str__(self):
+        return f"Heatmap of {self.scope} for the week of {self.week}"
+
 
 class UserMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
@@ -168,4 +356,33 @@ class UserMessage(models.Model):
         ordering = ['-sent_at']
 
     def __str__(self):
-        return f"Message from {self.sender.username} to {self.recipient.username}: {self.subject}"
\ No newline at end of file
+        return f"Message from {self.sender.username} to {self.recipient.username}: {self.subject}"
+
+class ChangeEvent(models.Model):
+    """A booking or inbox change pushed live to its user over SSE.
+
+    The auto-increment id doubles as the change feed cursor: each process
+    polls for ids above the last one it has seen (see booking/events.py).
+    """
+
+    KIND_BOOKING = 'booking'
+    KIND_MESSAGE = 'message'
+
+    KIND_CHOICES = [
+        (KIND_BOOKING, 'Booking Update'),
+        (KIND_MESSAGE, 'New Message'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_events')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changeevent_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} for {self.user_id}"
@@ -0,0 +1,184 @@
+"""Delivery of UserMessages: the live change feed and, optionally, email.
+
+notify_recipients() is called wherever messages are created. With
+NOTIFICATION_EMAIL_ENABLED on, it also queues the message ids once the
+surrounding transaction commits. A daemon thread per process then loads
+the queued messages and sends them in batches of
+NOTIFICATION_EMAIL_BATCH_SIZE over one SMTP connection that it keeps open
+between batches. The connection is closed after
+NOTIFICATION_EMAIL_IDLE_SECONDS without mail. A request therefore never
+waits on the mail server.
+
+A batch that fails is retried after NOTIFICATION_EMAIL_RETRY_BACKOFF
+seconds, doubling on every further failure. It is dropped after
+NOTIFICATION_EMAIL_MAX_ATTEMPTS attempts. A message that can never be
+sent, such as one whose subject holds a newline, is logged and skipped
+without holding up the rest of its batch. The messages stay in the inbox
+either way.
+
+Any EMAIL_BACKEND works: locmem in tests, or the SMTP backend pointed at
+a local debugging server (e.g. `python -m aiosmtpd -n -l localhost:1025`
+with EMAIL_PORT=1025).
+"""
+import atexit
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.message import sanitize_address
+from django.db import DatabaseError, connection, transaction
+from .events import publish_messages
+from .models import UserMessage
+
+
+logger = logging.getLogger(__name__)
+
+SEND_ERRORS = (smtplib.SMTPException, OSError)
+
+
+class EmailOutbox:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        # (message_id, attempts, not_before) in arrival order.
+        self._pending = []
+        self._wake = threading.Event()
+        self._thread = None
+        self._connection = None
+        self._last_sent = 0.0
+
+    def add(self, message_ids):
+        with self._lock:
+            self._pending.extend((message_id, 0, 0.0) for message_id in message_ids)
+            overflow = len(self._pending) - settings.NOTIFICATION_EMAIL_MAX_BUFFER
+            if overflow > 0:
+                del self._pending[:overflow]
+                logger.error("Notification email queue full; dropped %d message(s).", overflow)
+            if len(self._pending) >= settings.NOTIFICATION_EMAIL_BATCH_SIZE:
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='booking-email-outbox', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self, force=False):
+        """Sends every queued message that is due (all of them with
+        `force`); returns how many emails were sent."""
+        now = time.monotonic()
+        with self._send_lock:
+            with self._lock:
+                due = [item for item in self._pending if force or item[2] <= now]
+                self._pending = [item for item in self._pending if not (force or item[2] <= now)]
+            sent = 0
+            size = settings.NOTIFICATION_EMAIL_BATCH_SIZE
+            for offset in range(0, len(due), size):
+                sent += self._send_batch(due[offset:offset + size])
+            return sent
+
+    def _emails(self, message_ids):
+        rows = (
+            UserMessage.objects.filter(pk__in=message_ids)
+            .exclude(recipient__email='')
+            .values_list('pk', 'subject', 'body', 'recipient__email', 'sender__username')
+        )
+        return {
+            pk: EmailMessage(
+                subject=subject,
+                body=f"{body}\n\n-- \nSent by {sender} through the resource booking system.",
+                from_email=settings.NOTIFICATION_EMAIL_FROM,
+                to=[email],
+            )
+            for pk, subject, body, email, sender in rows
+        }
+
+    def _deliverable(self, emails):
+        """Drops the emails no retry could send; the backend would otherwise
+        raise on them and fail the whole batch."""
+        deliverable = []
+        for message_id, email in emails.items():
+            encoding = email.encoding or settings.DEFAULT_CHARSET
+            try:
+                # BadHeaderError is a ValueError.
+                email.message()
+                for address in [email.from_email, *email.recipients()]:
+                    sanitize_address(address, encoding)
+            except ValueError as exc:
+                logger.error("Cannot email notification %s; skipping it: %s", message_id, exc)
+                continue
+            deliverable.append(email)
+        return deliverable
+
+    def _send_batch(self, batch):
+        try:
+            emails = self._deliverable(self._emails([message_id for message_id, _, _ in batch]))
+            if not emails:
+                return 0
+            if self._connection is None:
+                self._connection = get_connection(fail_silently=False)
+                self._connection.open()
+            # A batch that fails part-way is retried whole: delivery is at least once.
+            sent = self._connection.send_messages(emails) or 0
+        except SEND_ERRORS + (DatabaseError,) as exc:
+            if isinstance(exc, DatabaseError):
+                connection.close()
+            else:
+                self._close()
+            self._retry(batch, exc)
+            return 0
+        self._last_sent = time.monotonic()
+        return sent
+
+    def _retry(self, batch, exc):
+        retry, dropped = [], 0
+        for message_id, attempts, _ in batch:
+            attempts += 1
+            if attempts >= settings.NOTIFICATION_EMAIL_MAX_ATTEMPTS:
+                dropped += 1
+                continue
+            delay = settings.NOTIFICATION_EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1)
+            retry.append((message_id, attempts, time.monotonic() + delay))
+        with self._lock:
+            self._pending[:0] = retry
+        if dropped:
+            logger.error("Gave up emailing %d notification(s): %s", dropped, exc)
+        else:
+            logger.warning("Emailing %d notification(s) failed; will retry: %s", len(retry), exc)
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except SEND_ERRORS:
+                pass
+            self._connection = None
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.NOTIFICATION_EMAIL_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+                with self._send_lock:
+                    if self._connection is not None and (
+                        time.monotonic() - self._last_sent > settings.NOTIFICATION_EMAIL_IDLE_SECONDS
+                    ):
+                        self._close()
+            except Exception:
+                # Keep the thread alive; an unexpected error must not stop all later mail.
+                logger.exception("Sending notification emails failed.")
+
+
+email_outbox = EmailOutbox()
+
+
+def notify_recipients(messages):
+    """Publishes newly created messages to the change feed and, when
+    enabled, queues them for email after the transaction commits."""
+    publish_messages(messages)
+    if settings.NOTIFICATION_EMAIL_ENABLED:
+        message_ids = [message.pk for message in messages if message.pk]
+        if message_ids:
+            transaction.on_commit(lambda: email_outbox.add(message_ids))
@@ -0,0 +1,291 @@
+"""Slot-bitmap occupancy index.
+
+Each resource has one OccupancyDay row per UTC day holding an array of
+SLOTS_PER_DAY unsigned counters: the number of PENDING/APPROVED bookings
+touching each 15-minute slot. Availability for a window is then a max over
+a slice of one or two arrays instead of a query over BookingRequest.
+
+Bookings are widened outward to whole slots, so the slot maximum is an
+upper bound on real concurrent use. When that bound reaches the resource's
+quantity the answer is confirmed with an exact sweep over the overlapping
+bookings, so back-to-back bookings inside one slot are still allowed.
+
+Building a missing day and applying a booking change both hold the
+resource's row lock (lock_resources()), and booking writes apply their
+change inside their own transaction. A build therefore either sees a
+booking or runs before it and has its row updated by it, never neither.
+"""
+import math
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import router, transaction
+from django.utils import timezone
+from .models import BookingRequest, OccupancyDay, Resource
+
+
+SLOT_MINUTES = 15
+SLOT_SECONDS = SLOT_MINUTES * 60
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+OCCUPYING_STATUSES = (BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_PENDING)
+
+FOOTPRINT_FIELDS = ('resource_id', 'start_time', 'end_time', 'status')
+
+# Footprint of an instance loaded without some of FOOTPRINT_FIELDS.
+UNKNOWN = object()
+
+
+def _empty_day():
+    return array('H', bytes(2 * SLOTS_PER_DAY))
+
+
+def _decode(data):
+    slots = array('H')
+    slots.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        slots.byteswap()
+    return slots
+
+
+def _encode(slots):
+    if sys.byteorder == 'big':
+        slots = array('H', slots)
+        slots.byteswap()
+    return slots.tobytes()
+
+
+def _utc(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(dt_timezone.utc)
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def day_spans(start, end):
+    """Yields (day, first_slot, stop_slot) for every UTC day [start, end)
+    touches, widened outward to whole slots."""
+    start, end = _utc(start), _utc(end)
+    day = start.date()
+    while _day_start(day) < end:
+        offset = _day_start(day)
+        first = max(0, int((start - offset).total_seconds() // SLOT_SECONDS))
+        stop = min(SLOTS_PER_DAY, math.ceil((end - offset).total_seconds() / SLOT_SECONDS))
+        if stop > first:
+            yield day, first, stop
+        day += timedelta(days=1)
+
+
+def booking_footprint(booking):
+    """(resource_id, start, end) while the booking holds a unit, else None."""
+    values = booking.__dict__
+    if any(field not in values for field in FOOTPRINT_FIELDS):
+        return UNKNOWN
+    if booking.status not in OCCUPYING_STATUSES or not (booking.start_time and booking.end_time):
+        return None
+    return booking.resource_id, booking.start_time, booking.end_time
+
+
+def lock_resources(*resource_ids):
+    """Locks the resources' rows until the surrounding transaction ends.
+
+    Held while a resource's bookings or occupancy days are written; taken
+    in id order so two writers never wait on each other.
+    """
+    ids = sorted({resource_id for resource_id in resource_ids if resource_id is not None})
+    if ids:
+        list(Resource.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+
+def _build_days(resource_id, days):
+    slots = {day: _empty_day() for day in days}
+    using = router.db_for_write(OccupancyDay)
+    with transaction.atomic(using=using):
+        # Bookings committing meanwhile wait here, then update the new rows.
+        lock_resources(resource_id)
+        bookings = BookingRequest.objects.using(using).filter(
+            resource_id=resource_id,
+            status__in=OCCUPYING_STATUSES,
+            start_time__lt=_day_start(max(days) + timedelta(days=1)),
+            end_time__gt=_day_start(min(days)),
+        ).values_list('start_time', 'end_time')
+        for start, end in bookings:
+            for day, first, stop in day_spans(start, end):
+                if day in slots:
+                    day_slots = slots[day]
+                    for index in range(first, stop):
+                        day_slots[index] += 1
+        OccupancyDay.objects.bulk_create(
+            [OccupancyDay(resource_id=resource_id, day=day, slots=_encode(day_slots)) for day, day_slots in slots.items()],
+            ignore_conflicts=True,
+        )
+    return slots
+
+
+def load_days(resource_id, days):
+    """Returns {day: slot array}, building and storing any missing days."""
+    slots = {
+        row.day: _decode(row.slots)
+        for row in OccupancyDay.objects.filter(resource_id=resource_id, day__in=days)
+    }
+    missing = [day for day in days if day not in slots]
+    if missing:
+        slots.update(_build_days(resource_id, missing))
+    return slots
+
+
+def _slot_peak(resource_id, start, end, excluded=None):
+    spans = list(day_spans(start, end))
+    if not spans:
+        return 0
+    days = load_days(resource_id, [day for day, _, _ in spans])
+    excluded_spans = {}
+    if excluded is not None and excluded[0] == resource_id:
+        excluded_spans = {day: (first, stop) for day, first, stop in day_spans(excluded[1], excluded[2])}
+
+    peak = 0
+    for day, first, stop in spans:
+        window = days[day][first:stop]
+        if day in excluded_spans:
+            own_first, own_stop = excluded_spans[day]
+            for index in range(max(first, own_first), min(stop, own_stop)):
+                if window[index - first]:
+                    window[index - first] -= 1
+        peak = max(peak, max(window))
+    return peak
+
+
+def _exact_usage(resource_id, start, end, capacity, exclude_booking_pk=None, statuses=OCCUPYING_STATUSES):
+    """Exact peak use over [start, end) and the windows where use reaches
+    `capacity`, found by sweeping the overlapping bookings."""
+    bookings = BookingRequest.objects.filter(
+        resource_id=resource_id,
+        status__in=statuses,
+        start_time__lt=end,
+        end_time__gt=start,
+    )
+    if exclude_booking_pk:
+        bookings = bookings.exclude(pk=exclude_booking_pk)
+
+    events = []
+    for booking_start, booking_end in bookings.values_list('start_time', 'end_time'):
+        # Ends sort before starts at the same instant: back-to-back is fine.
+        events.append((max(booking_start, start), 1))
+        events.append((min(booking_end, end), -1))
+    events.append((end, 0))
+
+    in_use = peak = 0
+    full = []
+    previous = start
+    for at, delta in sorted(events):
+        if at > previous and in_use >= capacity:
+            if full and full[-1][1] == previous:
+                full[-1] = (full[-1][0], at)
+            else:
+                full.append((previous, at))
+        previous = max(previous, at)
+        in_use += delta
+        peak = max(peak, in_use)
+    return peak, full
+
+
+def resource_availability(resource, start, end, exclude_booking_pk=None):
+    """Capacity of `resource` over [start, end), as used by BookingRequestForm.
+
+    `in_use` is the most units in use at any moment and `conflicts` the
+    windows where every unit is taken. Both are exact whenever the resource
+    is full; below that `in_use` may be a slot-rounded overestimate, which
+    cannot change an availability decision.
+    """
+    excluded = None
+    if exclude_booking_pk:
+        excluded = (
+            BookingRequest.objects
+            .filter(pk=exclude_booking_pk, status__in=OCCUPYING_STATUSES)
+            .values_list('resource_id', 'start_time', 'end_time')
+            .first()
+        )
+    in_use = _slot_peak(resource.pk, start, end, excluded)
+    conflicts = []
+    if in_use >= resource.quantity:
+        in_use, conflicts = _exact_usage(resource.pk, start, end, resource.quantity, exclude_booking_pk)
+    return {
+        'quantity': resource.quantity,
+        'in_use': in_use,
+        'remaining': max(0, resource.quantity - in_use),
+        'conflicts': conflicts,
+    }
+
+
+def peak_usage(resource, start, end, exclude_booking_pk=None):
+    """Most units of `resource` in use at any moment of [start, end); see
+    resource_availability()."""
+    return resource_availability(resource, start, end, exclude_booking_pk)['in_use']
+
+
+def approved_peak(resource_id, start, end, exclude_booking_pk=None):
+    """Most APPROVED bookings of the resource overlapping at any moment of
+    [start, end), counted exactly."""
+    return _exact_usage(
+        resource_id, start, end, math.inf, exclude_booking_pk, statuses=(BookingRequest.STATUS_APPROVED,),
+    )[0]
+
+
+def apply_booking_change(old, new):
+    """Moves a booking's footprint in the stored days from `old` to `new`.
+
+    Must run in the transaction that writes the booking. Days that have no
+    row yet are skipped: a build running now is still waiting for the
+    resource lock and will read the booking once it commits, and a later
+    build reads it anyway.
+    """
+    apply_booking_changes([(old, new)])
+
+
+def apply_booking_changes(moves):
+    """apply_booking_change() for many (old, new) footprint pairs at once."""
+    changes = defaultdict(list)
+    for old, new in moves:
+        if old == new:
+            continue
+        for footprint, delta in ((old, -1), (new, 1)):
+            if footprint is None:
+                continue
+            resource_id, start, end = footprint
+            for day, first, stop in day_spans(start, end):
+                changes[resource_id, day].append((first, stop, delta))
+    if not changes:
+        return
+
+    with transaction.atomic():
+        lock_resources(*{resource_id for resource_id, _ in changes})
+        rows = OccupancyDay.objects.select_for_update().filter(
+            resource_id__in={resource_id for resource_id, _ in changes},
+            day__in={day for _, day in changes},
+        )
+        updated = []
+        for row in rows:
+            day_changes = changes.get((row.resource_id, row.day))
+            if not day_changes:
+                continue
+            slots = _decode(row.slots)
+            for first, stop, delta in day_changes:
+                for index in range(first, stop):
+                    slots[index] = max(0, slots[index] + delta)
+            row.slots = _encode(slots)
+            updated.append(row)
+        if updated:
+            OccupancyDay.objects.bulk_update(updated, ['slots'])
+
+
+def invalidate_resource_occupancy(*resource_ids):
+    """Drops stored days so they are rebuilt on the next lookup."""
+    rows = OccupancyDay.objects.all()
+    if resource_ids:
+        rows = rows.filter(resource_id__in=resource_ids)
+    return rows.delete()[0]
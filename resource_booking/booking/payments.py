@@ -0,0 +1,73 @@
+"""M-Pesa payments.
+
+django_daraja pulls in requests, cryptography and its own settings
+handling, which is a sizeable share of a worker's start-up time, yet only
+the STK push below talks to M-Pesa. The client is therefore imported on
+first use instead of when the URLconf is loaded.
+"""
+from decimal import Decimal
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import get_object_or_404, redirect, render
+from .idempotency import idempotent, new_idempotency_key
+from .models import BookingRequest
+
+
+def mpesa_client():
+    from django_daraja.mpesa.core import MpesaClient
+    return MpesaClient()
+
+
+@login_required
+@idempotent('stk_push')
+def initiate_stk_push_view(request, pk):
+    booking = get_object_or_404(BookingRequest, pk=pk, user=request.user)
+    
+    if booking.start_time and booking.end_time:
+        duration = booking.end_time - booking.start_time
+        duration_in_hours_float = duration.total_seconds() / 3600
+        
+        
+        duration_in_hours_decimal = Decimal(str(duration_in_hours_float))
+        
+        
+        total_cost = round(booking.resource.cost * duration_in_hours_decimal, 2)
+    else:
+        total_cost = booking.resource.cost
+    
+    if request.method == 'POST':
+        
+        phone_number = request.POST.get('phoneNumber')
+        try:
+            
+            amount = int(float(request.POST.get('amount')))
+            if amount <= 0:
+                raise ValueError("Amount must be positive.")
+        except (ValueError, TypeError):
+            messages.error(request, "Invalid amount provided for M-Pesa.")
+            return redirect('booking:initiate_payment', pk=pk)
+            
+        cl = mpesa_client()
+        account_reference = f'BOOKING_{booking.pk}'
+        transaction_desc = f'Payment for {booking.resource.name} Booking #{booking.pk}'
+        callback_url = 'https://api.darajambili.com/express-payment' 
+        
+        try:
+            response = cl.stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
+            
+            messages.success(request, f"M-Pesa prompt sent to {phone_number}. Please check your phone to complete the KES {amount} payment.")
+            
+            return redirect('booking:my_bookings_dashboard') 
+            
+        except Exception as e:
+            messages.error(request, f"Payment initiation failed. Error: {e}")
+            
+    context = {
+        'booking': booking,
+        'cost': total_cost,
+        'idempotency_key': new_idempotency_key(),
+    }
+    
+    
+    return render(request, 'booking/stk_push_form.html', context)
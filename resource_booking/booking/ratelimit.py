@@ -0,0 +1,214 @@
+"""Token-bucket rate limiting per URL name.
+
+Budgets are written like '20/m': a bucket of 20 tokens that refills at 20
+per minute, so a client may burst up to 20 requests and then sustain one
+every three seconds. Authenticated users are keyed by user id, anonymous
+clients by address, and every URL name has its own buckets.
+
+Each bucket is one cache entry holding the time (in milliseconds) at which
+it will be full again, the "theoretical arrival time" of the generic cell
+rate algorithm. Taking a token is a single cache.incr by the refill
+interval; the request is refused (and the token handed back) when that
+time runs more than a full bucket ahead of now. incr is atomic on the
+local-memory, memcached and Redis backends; the file and database backends
+implement it as get-then-set, so under heavy concurrency they may let a
+few extra requests through.
+
+Views decorated with @rate_limit (see booking/urls.py) use their own
+budgets; RateLimitMiddleware applies RATE_LIMIT_DEFAULT_* to the rest.
+"""
+import math
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse
+
+
+RATE_LIMIT_CACHE_KEY = 'booking:ratelimit:{scope}:{client}'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_RATE_RE = re.compile(r'^(\d+)/([smhd])$')
+
+# A bucket entry lives this many refill periods. The algorithm only rewrites
+# an entry once its bucket has refilled, so a client kept over its limit
+# gets one extra burst per lifetime when the entry expires.
+KEY_TTL_PERIODS = 10
+
+
+class Rate:
+    __slots__ = ('spec', 'interval_ms', 'burst_ms', 'ttl')
+
+    def __init__(self, spec):
+        match = _RATE_RE.match(spec)
+        if not match or not int(match.group(1)):
+            raise ImproperlyConfigured(f"Invalid rate {spec!r}; expected e.g. '20/m'.")
+        tokens, period = int(match.group(1)), PERIODS[match.group(2)]
+        self.spec = spec
+        self.interval_ms = max(1, period * 1000 // tokens)
+        self.burst_ms = self.interval_ms * tokens
+        self.ttl = period * KEY_TTL_PERIODS
+
+    def __repr__(self):
+        return f'Rate({self.spec!r})'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _take(cache, key, rate):
+    """Takes a token; returns 0, or the seconds until one is available."""
+    now = _now_ms()
+    try:
+        due = cache.incr(key, rate.interval_ms)
+    except ValueError:
+        due = now + rate.interval_ms
+        if not cache.add(key, due, rate.ttl):
+            due = cache.incr(key, rate.interval_ms)
+    if due - rate.interval_ms < now:
+        # The bucket had refilled completely: restart it from now.
+        due = now + rate.interval_ms
+        cache.set(key, due, rate.ttl)
+    excess = due - now - rate.burst_ms
+    if excess <= 0:
+        return 0
+    cache.decr(key, rate.interval_ms)
+    return excess / 1000
+
+
+async def _atake(cache, key, rate):
+    now = _now_ms()
+    try:
+        due = await cache.aincr(key, rate.interval_ms)
+    except ValueError:
+        due = now + rate.interval_ms
+        if not await cache.aadd(key, due, rate.ttl):
+            due = await cache.aincr(key, rate.interval_ms)
+    if due - rate.interval_ms < now:
+        due = now + rate.interval_ms
+        await cache.aset(key, due, rate.ttl)
+    excess = due - now - rate.burst_ms
+    if excess <= 0:
+        return 0
+    await cache.adecr(key, rate.interval_ms)
+    return excess / 1000
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Too many requests. Please slow down and try again shortly.", status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _scope(request, view_func):
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.view_name:
+        return match.view_name
+    return f'{view_func.__module__}.{view_func.__qualname__}'
+
+
+class RateLimit:
+    """Separate budgets for authenticated users and anonymous clients; None
+    leaves that kind of client unlimited."""
+
+    def __init__(self, authenticated=None, anonymous=None):
+        self.authenticated = Rate(authenticated) if authenticated else None
+        self.anonymous = Rate(anonymous) if anonymous else None
+
+    def _bucket(self, request, user, scope):
+        if user.is_authenticated:
+            rate, client = self.authenticated, f'u{user.pk}'
+        else:
+            rate, client = self.anonymous, f"a{request.META.get('REMOTE_ADDR', '')}"
+        return rate, RATE_LIMIT_CACHE_KEY.format(scope=scope, client=client)
+
+    def check(self, request, scope):
+        """Returns a 429 response when the client is over budget, else None."""
+        rate, key = self._bucket(request, request.user, scope)
+        if rate is None:
+            return None
+        retry_after = _take(caches[settings.RATE_LIMIT_CACHE], key, rate)
+        return too_many_requests(retry_after) if retry_after else None
+
+    async def acheck(self, request, scope):
+        rate, key = self._bucket(request, await request.auser(), scope)
+        if rate is None:
+            return None
+        retry_after = await _atake(caches[settings.RATE_LIMIT_CACHE], key, rate)
+        return too_many_requests(retry_after) if retry_after else None
+
+
+def rate_limit(authenticated=None, anonymous=None):
+    """Limits the view to the given budgets, per URL name.
+
+    Works on sync and async views; RateLimitMiddleware leaves decorated
+    views to their own budgets.
+    """
+    limit = RateLimit(authenticated, anonymous)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                if settings.RATE_LIMIT_ENABLED:
+                    response = await limit.acheck(request, _scope(request, view_func))
+                    if response is not None:
+                        return response
+                return await view_func(request, *args, **kwargs)
+
+            _async_wrapped_view.rate_limit = limit
+            return _async_wrapped_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if settings.RATE_LIMIT_ENABLED:
+                response = limit.check(request, _scope(request, view_func))
+                if response is not None:
+                    return response
+            return view_func(request, *args, **kwargs)
+
+        _wrapped_view.rate_limit = limit
+        return _wrapped_view
+
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Applies the default budgets to every view without its own @rate_limit.
+
+    Removed from the middleware chain when RATE_LIMIT_ENABLED is false. Runs
+    natively under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.RATE_LIMIT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limit = RateLimit(settings.RATE_LIMIT_DEFAULT_AUTHENTICATED, settings.RATE_LIMIT_DEFAULT_ANONYMOUS)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'rate_limit', None) is not None:
+            return None
+        return self.limit.check(request, _scope(request, view_func))
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'rate_limit', None) is not None:
+            return None
+        return await self.limit.acheck(request, _scope(request, view_func))
@@ -0,0 +1,108 @@
+"""Reminders for approved bookings that are about to start.
+
+Each tick reads the APPROVED bookings starting within the next
+BOOKING_REMINDER_LEAD_MINUTES as a range scan on the (status, start_time)
+index, with a NOT EXISTS lookup to skip bookings already reminded. The
+work per tick is therefore bounded by the bookings in the lead window, not
+by the size of the table. New reminders are written with bulk_create in
+batches of BOOKING_REMINDER_BATCH_SIZE. Each batch inserts its
+BookingReminder rows together with the messages in one transaction, so
+the unique (booking, start_time) constraint keeps two schedulers racing on
+the same batch from both sending it.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import BookingReminder, BookingRequest, UserMessage
+from .notifications import notify_recipients
+from .stats import invalidate_user_booking_stats
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Consecutive batches lost to other schedulers before giving up the tick.
+MAX_RACES = 3
+
+
+def due_reminders(now, lead):
+    """APPROVED bookings starting in (now, now + lead] not yet reminded for
+    their current start time."""
+    already_sent = BookingReminder.objects.filter(booking=OuterRef('pk'), start_time=OuterRef('start_time'))
+    return (
+        BookingRequest.objects
+        .filter(status=BookingRequest.STATUS_APPROVED, start_time__gt=now, start_time__lte=now + lead)
+        .filter(~Exists(already_sent))
+        .order_by('start_time', 'pk')
+    )
+
+
+def _reminder_body(row):
+    body = (
+        f"Reminder: your booking for {row['resource__name']} starts at "
+        f"{timezone.localtime(row['start_time']).strftime('%Y-%m-%d %H:%M')} and ends at "
+        f"{timezone.localtime(row['end_time']).strftime('%Y-%m-%d %H:%M')}."
+    )
+    if row['unit__label']:
+        body += f" Your assigned unit is {row['unit__label']}."
+    body += " If you no longer need it, please cancel so others can use it."
+    return body
+
+
+def send_due_reminders(now=None):
+    """Sends the reminders that are due; returns how many were sent."""
+    now = now or timezone.now()
+    sender = User.objects.filter(is_superuser=True).order_by('pk').first()
+    if sender is None:
+        logger.warning("No superuser to send booking reminders from; skipping.")
+        return 0
+
+    lead = timedelta(minutes=settings.BOOKING_REMINDER_LEAD_MINUTES)
+    sent = races = 0
+    while True:
+        rows = list(
+            due_reminders(now, lead)
+            .values('pk', 'user_id', 'start_time', 'end_time', 'resource__name', 'unit__label')
+            [:settings.BOOKING_REMINDER_BATCH_SIZE]
+        )
+        if not rows:
+            return sent
+        messages = [
+            UserMessage(
+                sender=sender,
+                recipient_id=row['user_id'],
+                subject=f"⏰ Upcoming booking: {row['resource__name']}",
+                body=_reminder_body(row),
+                is_read=False,
+            )
+            for row in rows
+        ]
+        try:
+            with transaction.atomic():
+                BookingReminder.objects.bulk_create([
+                    BookingReminder(booking_id=row['pk'], start_time=row['start_time'], sent_at=now) for row in rows
+                ])
+                UserMessage.objects.bulk_create(messages)
+                notify_recipients(messages)
+        except IntegrityError:
+            # Another scheduler sent some of this batch first; re-read what is left.
+            races += 1
+            if races > MAX_RACES:
+                raise
+            logger.info("Booking reminder batch raced another scheduler; retrying.")
+            continue
+        invalidate_user_booking_stats(*{row['user_id'] for row in rows})
+        sent += len(rows)
+        if len(rows) < settings.BOOKING_REMINDER_BATCH_SIZE:
+            return sent
+
+
+def prune_reminders(before):
+    """Deletes records of reminders for start times before `before`."""
+    return BookingReminder.objects.filter(start_time__lt=before).delete()[0]
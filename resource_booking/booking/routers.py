@@ -0,0 +1,101 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Session key holding the time until which this user's reads stay on the
+# primary, so they see their own booking changes despite replication lag.
+STICKY_SESSION_KEY = 'booking_read_primary_until'
+
+
+class _ReplicaRoute:
+    __slots__ = ('wrote',)
+
+    def __init__(self):
+        self.wrote = False
+
+
+# Set only while a @use_read_replica view runs.
+_route = ContextVar('booking_replica_route', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in connections.databases
+
+
+def mark_recent_write(request):
+    """Pins the user's reads to the primary for READ_REPLICA_STICKY_SECONDS."""
+    if replica_configured() and hasattr(request, 'session'):
+        request.session[STICKY_SESSION_KEY] = time.time() + settings.READ_REPLICA_STICKY_SECONDS
+
+
+def _is_sticky(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+async def _ais_sticky(request):
+    session = getattr(request, 'session', None)
+    return session is not None and await session.aget(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def use_read_replica(view_func):
+    """Serves the view's reads from the replica alias when one is configured.
+
+    Writes always go to the primary, and once the view writes, its later
+    reads follow so it never reads back stale rows. Works on sync and async
+    views; async ORM calls inherit the route through the context.
+    """
+
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _async_wrapped_view(request, *args, **kwargs):
+            if not replica_configured() or await _ais_sticky(request):
+                return await view_func(request, *args, **kwargs)
+            token = _route.set(_ReplicaRoute())
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _route.reset(token)
+
+        return _async_wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not replica_configured() or _is_sticky(request):
+            return view_func(request, *args, **kwargs)
+        token = _route.set(_ReplicaRoute())
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _route.reset(token)
+
+    return _wrapped_view
+
+
+class ReadReplicaRouter:
+    """Sends reads from @use_read_replica views to REPLICA_DB_ALIAS and
+    everything else to the default database."""
+
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or route.wrote:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
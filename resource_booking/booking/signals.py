@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, post_init, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserMessage
+from django.contrib.auth.models import Group, Permission
+from .models import BookingRequest, Resource, ResourceUnit, UserMessage
+from .stats import invalidate_user_booking_stats
+from .catalog import invalidate_catalog_state
+from .auth import bump_permission_version, invalidate_cached_user
+from .events import booking_event_state, publish_booking_change, publish_booking_changes
+from .notifications import notify_recipients
+from .allocation import sync_resource_quantity
+from .occupancy import UNKNOWN, apply_booking_change, apply_booking_changes, booking_footprint, invalidate_resource_occupancy
+from .heatmap import apply_heatmap_changes, heatmap_footprint, invalidate_heatmaps, invalidate_type_heatmaps
+from .transitions import booking_changed
 from django.utils import timezone
 
 User = get_user_model()
@@ -30,6 +40,8 @@ def notify_admin_new_user(sender, instance, created, **kwargs):
         
         if messages_to_create:
             UserMessage.objects.bulk_create(messages_to_create)
+            invalidate_user_booking_stats(*[m.recipient_id for m in messages_to_create])
+            notify_recipients(messages_to_create)
 
 
 @receiver(post_delete, sender=User)
@@ -67,4 +79,178 @@ def notify_admin_user_deleted(sender, instance, **kwargs):
         )
     
     if messages_to_create:
-        UserMessage.objects.bulk_create(messages_to_create)
\ No newline at end of file
+        UserMessage.objects.bulk_create(messages_to_create)
+        invalidate_user_booking_stats(*[m.recipient_id for m in messages_to_create])
+        notify_recipients(messages_to_create)
+
+
+@receiver(post_save, sender=BookingRequest)
+@receiver(post_delete, sender=BookingRequest)
+def invalidate_booking_owner_stats(sender, instance, **kwargs):
+    invalidate_user_booking_stats(instance.user_id)
+
+
+@receiver(post_save, sender=UserMessage)
+@receiver(post_delete, sender=UserMessage)
+def invalidate_message_recipient_stats(sender, instance, **kwargs):
+    invalidate_user_booking_stats(instance.recipient_id)
+
+
+@receiver(post_save, sender=BookingRequest)
+def publish_booking_event(sender, instance, created, raw=False, **kwargs):
+    # Only what the live views show: a new booking, its status or its times.
+    state = booking_event_state(instance)
+    if not raw and (created or state != getattr(instance, '_loaded_event_state', None)):
+        publish_booking_change(instance)
+    instance._loaded_event_state = state
+
+
+@receiver(post_init, sender=BookingRequest)
+def remember_booking_footprint(sender, instance, **kwargs):
+    instance._loaded_footprint = booking_footprint(instance) if instance.pk else None
+    instance._loaded_heatmap = heatmap_footprint(instance) if instance.pk else None
+    instance._loaded_event_state = booking_event_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=BookingRequest)
+def update_occupancy_on_save(sender, instance, **kwargs):
+    old = getattr(instance, '_loaded_footprint', None)
+    new = booking_footprint(instance)
+    if old is UNKNOWN or new is UNKNOWN:
+        invalidate_resource_occupancy(instance.resource_id)
+    else:
+        apply_booking_change(old, new)
+    instance._loaded_footprint = new
+
+    old = getattr(instance, '_loaded_heatmap', None)
+    new = heatmap_footprint(instance)
+    if old is UNKNOWN or new is UNKNOWN:
+        invalidate_heatmaps(instance.resource_id)
+    else:
+        apply_heatmap_changes([(old, new)])
+    instance._loaded_heatmap = new
+
+
+@receiver(post_delete, sender=BookingRequest)
+def update_occupancy_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_loaded_footprint', None)
+    if old is UNKNOWN:
+        invalidate_resource_occupancy(instance.resource_id)
+    else:
+        apply_booking_change(old, None)
+
+    old = getattr(instance, '_loaded_heatmap', None)
+    if old is UNKNOWN:
+        invalidate_heatmaps(instance.resource_id)
+    else:
+        apply_heatmap_changes([(old, None)])
+
+
+@receiver(booking_changed)
+def sync_after_booking_change(sender, bookings, **kwargs):
+    # The post_save handlers above, for writes made with update().
+    invalidate_user_booking_stats(*{booking.user_id for booking in bookings})
+    publish_booking_changes(bookings)
+
+    moves, heatmap_moves = [], []
+    stale_resources, stale_heatmaps = set(), set()
+    for booking in bookings:
+        old = getattr(booking, '_loaded_footprint', None)
+        new = booking_footprint(booking)
+        if old is UNKNOWN or new is UNKNOWN:
+            stale_resources.add(booking.resource_id)
+        else:
+            moves.append((old, new))
+        booking._loaded_footprint = new
+
+        old = getattr(booking, '_loaded_heatmap', None)
+        new = heatmap_footprint(booking)
+        if old is UNKNOWN or new is UNKNOWN:
+            stale_heatmaps.add(booking.resource_id)
+        else:
+            heatmap_moves.append((old, new))
+        booking._loaded_heatmap = new
+    if stale_resources:
+        invalidate_resource_occupancy(*stale_resources)
+    apply_booking_changes(moves)
+    if stale_heatmaps:
+        invalidate_heatmaps(*stale_heatmaps)
+    apply_heatmap_changes(heatmap_moves)
+
+
+@receiver(post_save, sender=UserMessage)
+def publish_message_event(sender, instance, created, **kwargs):
+    if created:
+        notify_recipients([instance])
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def invalidate_resource_catalog(sender, instance, **kwargs):
+    invalidate_catalog_state()
+
+
+@receiver(pre_save, sender=Resource)
+def remember_resource_type(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or 'type' in update_fields):
+        instance._previous_type = Resource.objects.filter(pk=instance.pk).values_list('type', flat=True).first()
+
+
+@receiver(post_save, sender=Resource)
+def move_heatmaps_with_type(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_type', None)
+    if previous is not None and previous != instance.type:
+        # The resource's bookings now count towards another type.
+        invalidate_type_heatmaps(previous, instance.type)
+    instance._previous_type = None
+
+
+@receiver(post_save, sender=ResourceUnit)
+@receiver(post_delete, sender=ResourceUnit)
+def sync_quantity_with_units(sender, instance, **kwargs):
+    sync_resource_quantity(instance.resource_id)
+
+
+AUTH_FLAGS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def _auth_flags(instance):
+    # Only the loaded flags: reading a deferred one would query per instance.
+    values = instance.__dict__
+    return {flag: values[flag] for flag in AUTH_FLAGS if flag in values}
+
+
+@receiver(post_init, sender=User)
+def remember_user_auth_flags(sender, instance, **kwargs):
+    instance._loaded_auth_flags = _auth_flags(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_on_save(sender, instance, created, **kwargs):
+    invalidate_cached_user(instance.pk)
+    # A flag assigned after a deferred load shows up as a new key: a change.
+    flags = _auth_flags(instance)
+    if not created and flags != getattr(instance, '_loaded_auth_flags', flags):
+        bump_permission_version()
+    instance._loaded_auth_flags = flags
+
+
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_on_delete(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def bump_permissions_on_change(sender, **kwargs):
+    bump_permission_version()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def bump_permissions_on_membership_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_permission_version()
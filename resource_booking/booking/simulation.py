@@ -0,0 +1,141 @@
+"""What-if simulation of approving pending bookings together.
+
+For each resource the approved bookings are fixed and the pending ones are
+candidates. Their start and end times are compressed to the sorted
+distinct instants, and a segment tree over the gaps between them holds the
+units in use, with range add and range max in O(log n). That gives, in
+O(n log n) per resource:
+
+* `blocked` requests, which do not fit next to the approved bookings even
+  on their own;
+* `oversubscribed` requests, which overlap a moment where approving every
+  candidate would exceed Resource.quantity;
+* a suggested conflict-free approval set, chosen greedily by earliest end
+  time. Each request accepted or rejected is final, so the set is maximal:
+  no request left out could be added to it.
+"""
+from collections import defaultdict
+
+from .models import BookingRequest
+
+
+class _MaxTree:
+    """Range add / range max over `size` slots, all starting at zero."""
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.top = [0] * (4 * self.size)
+        self.pending = [0] * (4 * self.size)
+
+    def add(self, first, stop, delta):
+        if first < stop:
+            self._add(1, 0, self.size, first, stop, delta)
+
+    def max(self, first, stop):
+        if first >= stop:
+            return 0
+        return self._max(1, 0, self.size, first, stop)
+
+    def _add(self, node, low, high, first, stop, delta):
+        if first <= low and high <= stop:
+            self.top[node] += delta
+            self.pending[node] += delta
+            return
+        middle = (low + high) // 2
+        if first < middle:
+            self._add(2 * node, low, middle, first, stop, delta)
+        if stop > middle:
+            self._add(2 * node + 1, middle, high, first, stop, delta)
+        self.top[node] = max(self.top[2 * node], self.top[2 * node + 1]) + self.pending[node]
+
+    def _max(self, node, low, high, first, stop):
+        if first <= low and high <= stop:
+            return self.top[node]
+        middle = (low + high) // 2
+        best = None
+        if first < middle:
+            best = self._max(2 * node, low, middle, first, stop)
+        if stop > middle:
+            right = self._max(2 * node + 1, middle, high, first, stop)
+            best = right if best is None else max(best, right)
+        return best + self.pending[node]
+
+
+def _simulate_resource(quantity, approved, pending):
+    """`approved` holds (start, end) pairs and `pending` (pk, start, end);
+    returns {pk: (blocked, oversubscribed, suggested)}."""
+    instants = sorted({at for _, start, end in pending for at in (start, end)}
+                      | {at for start, end in approved for at in (start, end)})
+    index = {at: position for position, at in enumerate(instants)}
+    slots = len(instants) - 1
+
+    booked = _MaxTree(slots)
+    for start, end in approved:
+        booked.add(index[start], index[end], 1)
+
+    # Every candidate at once: which moments would be over capacity?
+    everything = _MaxTree(slots)
+    for start, end in approved:
+        everything.add(index[start], index[end], 1)
+    for _, start, end in pending:
+        everything.add(index[start], index[end], 1)
+
+    results = {}
+    blocked = {}
+    for pk, start, end in pending:
+        first, stop = index[start], index[end]
+        blocked[pk] = booked.max(first, stop) >= quantity
+        results[pk] = [blocked[pk], everything.max(first, stop) > quantity, False]
+
+    for pk, start, end in sorted(pending, key=lambda item: (item[2], item[1], item[0])):
+        first, stop = index[start], index[end]
+        if not blocked[pk] and booked.max(first, stop) < quantity:
+            booked.add(first, stop, 1)
+            results[pk][2] = True
+    return {pk: tuple(result) for pk, result in results.items()}
+
+
+def simulate_approvals(pending):
+    """Simulates approving the `pending` bookings (PENDING BookingRequests,
+    with their resource loaded) together; returns one result per booking,
+    in the given order."""
+    by_resource = defaultdict(list)
+    resources = {}
+    for booking in pending:
+        if booking.end_time > booking.start_time:
+            by_resource[booking.resource_id].append((booking.pk, booking.start_time, booking.end_time))
+            resources[booking.resource_id] = booking.resource
+
+    approved = defaultdict(list)
+    if by_resource:
+        spans = {
+            resource_id: (min(start for _, start, _ in items), max(end for _, _, end in items))
+            for resource_id, items in by_resource.items()
+        }
+        rows = BookingRequest.objects.filter(
+            resource_id__in=list(by_resource),
+            status=BookingRequest.STATUS_APPROVED,
+            start_time__lt=max(end for _, end in spans.values()),
+            end_time__gt=min(start for start, _ in spans.values()),
+        ).values_list('resource_id', 'start_time', 'end_time')
+        for resource_id, start, end in rows:
+            span_start, span_end = spans[resource_id]
+            if start < span_end and end > span_start and end > start:
+                approved[resource_id].append((max(start, span_start), min(end, span_end)))
+
+    outcomes = {}
+    for resource_id, items in by_resource.items():
+        outcomes.update(_simulate_resource(resources[resource_id].quantity, approved[resource_id], items))
+
+    results = []
+    for booking in pending:
+        blocked, oversubscribed, suggested = outcomes.get(booking.pk, (True, False, False))
+        results.append({
+            'booking': booking.pk,
+            'resource': booking.resource_id,
+            'quantity': booking.resource.quantity,
+            'blocked': blocked,
+            'oversubscribed': oversubscribed,
+            'suggested': suggested,
+        })
+    return results
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .models import BookingRequest, UserMessage
+
+
+User = get_user_model()
+
+STATS_CACHE_KEY = 'booking:user_stats:{user_id}'
+
+
+def _stats_cache_key(user_id):
+    return STATS_CACHE_KEY.format(user_id=user_id)
+
+
+EMPTY_STATS = {
+    'total_bookings': 0,
+    'pending_bookings': 0,
+    'upcoming_bookings': 0,
+    'unread_messages_count': 0,
+}
+
+
+def _user_stats_queryset(user_id):
+    """Builds the dashboard counters for one user as a single SQL query.
+
+    The booking counters are conditional aggregates over the user's bookings;
+    the unread message count rides along as a correlated subquery so the
+    whole thing is one round trip.
+    """
+    now = timezone.now()
+
+    unread_messages = (
+        UserMessage.objects
+        .filter(recipient=OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('recipient')
+        .annotate(unread=Count('pk'))
+        .values('unread')
+    )
+
+    return (
+        User.objects
+        .filter(pk=user_id)
+        .annotate(
+            total_bookings=Count('user_bookings'),
+            pending_bookings=Count(
+                'user_bookings',
+                filter=Q(user_bookings__status=BookingRequest.STATUS_PENDING),
+            ),
+            upcoming_bookings=Count(
+                'user_bookings',
+                filter=Q(
+                    user_bookings__status=BookingRequest.STATUS_APPROVED,
+                    user_bookings__start_time__gte=now,
+                ),
+            ),
+            unread_messages_count=Coalesce(
+                Subquery(unread_messages, output_field=IntegerField()), 0
+            ),
+        )
+        .values('total_bookings', 'pending_bookings', 'upcoming_bookings', 'unread_messages_count')
+    )
+
+
+def compute_user_booking_stats(user_id):
+    return _user_stats_queryset(user_id).first() or dict(EMPTY_STATS)
+
+
+def get_user_booking_stats(user):
+    key = _stats_cache_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_user_booking_stats(user.pk)
+        cache.set(key, stats, settings.BOOKING_STATS_CACHE_TTL)
+    return stats
+
+
+async def aget_user_booking_stats(user):
+    key = _stats_cache_key(user.pk)
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = await _user_stats_queryset(user.pk).afirst() or dict(EMPTY_STATS)
+        await cache.aset(key, stats, settings.BOOKING_STATS_CACHE_TTL)
+    return stats
+
+
+def invalidate_user_booking_stats(*user_ids):
+    if user_ids:
+        cache.delete_many([_stats_cache_key(user_id) for user_id in user_ids])
+
+
+async def ainvalidate_user_booking_stats(*user_ids):
+    if user_ids:
+        await cache.adelete_many([_stats_cache_key(user_id) for user_id in user_ids])
@@ -1,3 +1,631 @@
-from django.test import TestCase
+import math
+import random
+import statistics
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core import mail
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, router
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .allocation import BestFitAllocator, pack
+from .api import issue_token
+from .explorer import filtered_bookings
+from .notifications import EmailOutbox
+from .reminders import send_due_reminders
+from .simulation import _simulate_resource
+from .heatmap import ALL_SCOPE, heatmap, type_scope
+from .audit import audit_log
+from .ratelimit import rate_limit
+from .idempotency import IDEMPOTENCY_CACHE_KEY, new_idempotency_key
+from .management.commands.check_startup_budget import probe_startup
+from .models import BookingRequest, ChangeEvent, OccupancyDay, Resource, UserMessage
+from .routers import REPLICA_DB_ALIAS, ReadReplicaRouter, use_read_replica
+from .occupancy import _decode, _exact_usage, day_spans, invalidate_resource_occupancy, load_days, peak_usage
+from .transitions import InvalidTransition, save_if_unchanged, transition, transition_many
+
+
+# Slot-aligned, so the occupancy index is exact and can be compared as is.
+MONDAY = datetime(2030, 1, 7, 9, 0, tzinfo=dt_timezone.utc)
+
+
+def hours(count):
+    return timedelta(hours=count)
+
+
+class BookingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', 'student@example.com', 'password')
+        cls.resource = Resource.objects.create(name='Projector', quantity=2)
+
+    def book(self, start, end, status=BookingRequest.STATUS_PENDING):
+        return BookingRequest.objects.create(
+            user=self.user, resource=self.resource, start_time=start, end_time=end, status=status,
+        )
+
+
+class TransitionTests(BookingTestCase):
+    def test_lost_race_returns_false(self):
+        booking = self.book(MONDAY, MONDAY + hours(1))
+        mine = BookingRequest.objects.get(pk=booking.pk)
+        theirs = BookingRequest.objects.get(pk=booking.pk)
+
+        self.assertTrue(transition(theirs, BookingRequest.STATUS_APPROVED))
+        self.assertFalse(transition(mine, BookingRequest.STATUS_REJECTED))
+        self.assertEqual(mine.status, BookingRequest.STATUS_PENDING)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, BookingRequest.STATUS_APPROVED)
+
+    def test_stale_version_returns_false(self):
+        booking = self.book(MONDAY, MONDAY + hours(1))
+        stale = BookingRequest.objects.get(pk=booking.pk)
+        booking.purpose = 'Edited'
+        self.assertTrue(save_if_unchanged(booking, ['purpose'], booking.version))
+
+        # Same status, older version: the edit must not be approved unseen.
+        self.assertFalse(transition(stale, BookingRequest.STATUS_APPROVED))
+
+    def test_transition_many_moves_only_rows_in_from_status(self):
+        pending = [self.book(MONDAY + hours(day * 24), MONDAY + hours(day * 24 + 1)) for day in range(2)]
+        approved = self.book(MONDAY, MONDAY + hours(1), BookingRequest.STATUS_APPROVED)
+
+        moved = transition_many(
+            BookingRequest.objects.filter(resource=self.resource),
+            BookingRequest.STATUS_PENDING, BookingRequest.STATUS_CANCELLED,
+        )
+
+        self.assertEqual(sorted(booking.pk for booking in moved), sorted(booking.pk for booking in pending))
+        approved.refresh_from_db()
+        self.assertEqual(approved.status, BookingRequest.STATUS_APPROVED)
+        self.assertEqual(approved.version, 1)
+        for booking in pending:
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, BookingRequest.STATUS_CANCELLED)
+
+    def test_disallowed_moves_raise(self):
+        booking = self.book(MONDAY, MONDAY + hours(1), BookingRequest.STATUS_CANCELLED)
+
+        with self.assertRaises(InvalidTransition):
+            transition(booking, BookingRequest.STATUS_APPROVED)
+        with self.assertRaises(InvalidTransition):
+            transition_many(
+                BookingRequest.objects.all(), BookingRequest.STATUS_PENDING, BookingRequest.STATUS_ARCHIVED,
+            )
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, BookingRequest.STATUS_CANCELLED)
+
+
+class ChangeEventTests(BookingTestCase):
+    def test_only_status_and_time_changes_are_published(self):
+        booking = self.book(MONDAY, MONDAY + hours(1))
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+
+        booking = BookingRequest.objects.get(pk=booking.pk)
+        booking.purpose = 'Edited'
+        booking.save()
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+
+        booking.end_time = MONDAY + hours(2)
+        with CaptureQueriesContext(connection) as queries:
+            booking.save()
+        self.assertFalse([query for query in queries if '"booking_resource"."name"' in query['sql']])
+        event = ChangeEvent.objects.latest('id')
+        self.assertEqual(ChangeEvent.objects.count(), 2)
+        self.assertEqual(event.payload['resource_id'], self.resource.pk)
+
+    def test_wsgi_view_answers_a_short_poll(self):
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('booking:booking_events'))
+        head = ChangeEvent.objects.latest('id').pk if ChangeEvent.objects.exists() else 0
+        self.assertIn(f'id: {head}\n\n', b''.join(first.streaming_content).decode())
+
+        booking = self.book(MONDAY, MONDAY + hours(1))
+        body = b''.join(self.client.get(
+            reverse('booking:booking_events'), headers={'Last-Event-ID': str(head)},
+        ).streaming_content).decode()
+        self.assertIn(f'"id":{booking.pk}', body)
+        self.assertTrue(body.startswith(f'retry: {settings.BOOKING_EVENTS_SHORT_POLL_MS}'))
+
+
+def form_time(value):
+    return timezone.localtime(value).strftime('%Y-%m-%dT%H:%M')
+
+
+class IdempotencyTests(BookingTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.key = new_idempotency_key()
+
+    def submit(self, start, end):
+        return self.client.post(reverse('booking:new_booking'), {
+            'resource': self.resource.pk,
+            'start_time': form_time(start),
+            'end_time': form_time(end),
+            'purpose': 'Seminar',
+            'status': BookingRequest.STATUS_PENDING,
+            'idempotency_key': self.key,
+        })
+
+    def test_replayed_key_returns_stored_redirect(self):
+        first = self.submit(MONDAY, MONDAY + hours(1))
+        second = self.submit(MONDAY, MONDAY + hours(1))
+
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(BookingRequest.objects.count(), 1)
+
+    def test_form_error_releases_key(self):
+        invalid = self.submit(MONDAY + hours(1), MONDAY)
+        self.assertEqual(invalid.status_code, 200)
+        self.assertIsNone(cache.get(IDEMPOTENCY_CACHE_KEY.format(
+            scope='booking_create', user_id=self.user.pk, key=self.key,
+        )))
+
+        fixed = self.submit(MONDAY, MONDAY + hours(1))
+        self.assertEqual(fixed.status_code, 302)
+        self.assertEqual(BookingRequest.objects.count(), 1)
+
+
+class RateLimitTests(BookingTestCase):
+    def setUp(self):
+        cache.clear()
+        self.view = rate_limit(authenticated='2/m', anonymous='1/m')(lambda request: HttpResponse('ok'))
+
+    def call(self, user, address='10.0.0.1'):
+        request = RequestFactory().get('/limited/', REMOTE_ADDR=address)
+        request.user = user
+        return self.view(request)
+
+    def test_exhausted_budget_answers_429_with_retry_after(self):
+        self.assertEqual([self.call(self.user).status_code for _ in range(2)], [200, 200])
+        refused = self.call(self.user)
+        self.assertEqual(refused.status_code, 429)
+        self.assertTrue(1 <= int(refused['Retry-After']) <= 30)
+
+    def test_users_and_anonymous_clients_have_separate_buckets(self):
+        anonymous = AnonymousUser()
+        self.assertEqual(self.call(anonymous).status_code, 200)
+        self.assertEqual(self.call(anonymous).status_code, 429)
+        self.assertEqual(self.call(anonymous, address='10.0.0.2').status_code, 200)
+        self.assertEqual(self.call(self.user).status_code, 200)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled_setting_never_limits(self):
+        self.assertEqual({self.call(AnonymousUser()).status_code for _ in range(5)}, {200})
+
+
+class HistoryTests(BookingTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reviewer = User.objects.create_user('reviewer', 'reviewer@example.com', 'password')
+        cls.reviewer.user_permissions.add(Permission.objects.get(codename='can_review_booking'))
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking = self.book(MONDAY, MONDAY + hours(1))
+            transition(self.booking, BookingRequest.STATUS_APPROVED, self.reviewer, 'Looks fine')
+            transition(self.booking, BookingRequest.STATUS_CANCELLED, self.user, 'Plans changed')
+        audit_log.flush()
+
+    def history(self, user, name, pk, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse(name, args=[pk]), params)
+
+    def test_owner_reads_booking_history(self):
+        response = self.history(self.user, 'booking:api_booking_history', self.booking.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(event['to_status'], event['actor']) for event in response.json()['results']],
+            [(BookingRequest.STATUS_CANCELLED, 'student'), (BookingRequest.STATUS_APPROVED, 'reviewer')],
+        )
+
+    def test_history_outlives_the_booking_for_reviewers(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.assertEqual(self.history(other, 'booking:api_booking_history', self.booking.pk).status_code, 404)
+
+        pk = self.booking.pk
+        self.booking.delete()
+        response = self.history(self.reviewer, 'booking:api_booking_history', pk)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_resource_history_is_for_reviewers(self):
+        self.assertEqual(self.history(self.user, 'booking:api_resource_history', self.resource.pk).status_code, 403)
+        later = (timezone.now() + hours(1)).isoformat()
+        response = self.history(self.reviewer, 'booking:api_resource_history', self.resource.pk, since=later)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_admin_finds_events_by_raw_id(self):
+        pk = self.booking.pk
+        self.booking.delete()
+        self.client.force_login(self.admin)
+        changelist = reverse('admin:booking_bookingevent_changelist')
+        self.assertEqual(self.client.get(changelist, {'q': pk}).context['cl'].result_count, 2)
+        self.assertEqual(self.client.get(changelist, {'booking_id': pk}).context['cl'].result_count, 2)
+
+
+class ExplorerTests(BookingTestCase):
+    def test_resource_type_filter_uses_resource_ids(self):
+        lab = Resource.objects.create(name='Chemistry lab', type=Resource.LAB)
+        booking = BookingRequest.objects.create(
+            user=self.user, resource=lab, start_time=MONDAY, end_time=MONDAY + hours(1),
+        )
+        self.book(MONDAY, MONDAY + hours(1))
+
+        bookings = filtered_bookings({'resource_type': Resource.LAB})
+
+        self.assertEqual(list(bookings), [booking])
+        self.assertNotIn('JOIN', str(bookings.query))
+
+
+class HeatmapScopeTests(BookingTestCase):
+    def scoped(self, resources, scope):
+        return heatmap(resources, 2, until=MONDAY, scope=scope)
+
+    def per_resource(self, resources):
+        return heatmap(list(resources), 2, until=MONDAY)
+
+    def assert_scopes_match(self):
+        for scope, resources in (
+            (ALL_SCOPE, Resource.objects.all()),
+            (type_scope(Resource.LAB), Resource.objects.filter(type=Resource.LAB)),
+            (type_scope(Resource.OTHER), Resource.objects.filter(type=Resource.OTHER)),
+        ):
+            self.assertEqual(self.scoped(resources, scope), self.per_resource(resources), scope)
+
+    def test_scope_rows_follow_booking_and_type_changes(self):
+        lab = Resource.objects.create(name='Physics lab', type=Resource.LAB, quantity=3)
+        booking = self.book(MONDAY - hours(30), MONDAY - hours(28), BookingRequest.STATUS_APPROVED)
+        self.assert_scopes_match()
+
+        BookingRequest.objects.create(
+            user=self.user, resource=lab, start_time=MONDAY - hours(100), end_time=MONDAY - hours(97),
+            status=BookingRequest.STATUS_APPROVED,
+        )
+        booking.start_time, booking.end_time = MONDAY - hours(50), MONDAY - hours(47.5)
+        self.assertTrue(save_if_unchanged(booking, ['start_time', 'end_time'], booking.version))
+        self.assert_scopes_match()
+
+        self.assertTrue(transition(booking, BookingRequest.STATUS_CANCELLED))
+        self.book(MONDAY - hours(60), MONDAY - hours(59), BookingRequest.STATUS_APPROVED)
+        self.assert_scopes_match()
+        self.resource.type = Resource.LAB
+        self.resource.save()
+        self.book(MONDAY - hours(10), MONDAY - hours(9), BookingRequest.STATUS_APPROVED)
+        self.assert_scopes_match()
+
+    def test_all_resources_heatmap_reads_one_row_per_week(self):
+        for number in range(5):
+            resource = Resource.objects.create(name=f'Room {number}')
+            BookingRequest.objects.create(
+                user=self.user, resource=resource, start_time=MONDAY - hours(20), end_time=MONDAY - hours(19),
+                status=BookingRequest.STATUS_APPROVED,
+            )
+        self.scoped(Resource.objects.all(), ALL_SCOPE)
+
+        with self.assertNumQueries(2):
+            result = self.scoped(Resource.objects.all(), ALL_SCOPE)
+        self.assertEqual(result['resource_count'], 6)
+        self.assertEqual(sum(map(sum, result['booked_hours'])), 5)
+
+
+class ReminderTests(BookingTestCase):
+    def test_reminded_once_per_start_time(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        now = MONDAY - hours(1)
+        booking = self.book(now + hours(0.5), now + hours(1.5), BookingRequest.STATUS_APPROVED)
+
+        self.assertEqual(send_due_reminders(now), 1)
+        self.assertEqual(send_due_reminders(now), 0)
+
+        booking.start_time, booking.end_time = now + hours(0.75), now + hours(2)
+        self.assertTrue(save_if_unchanged(booking, ['start_time', 'end_time'], booking.version))
+        self.assertEqual(send_due_reminders(now), 1)
+        self.assertEqual(UserMessage.objects.filter(recipient=self.user).count(), 2)
+
+
+class ApiTokenTests(BookingTestCase):
+    def setUp(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+
+    def get_bookings(self, token):
+        return self.client.get(reverse('booking:api_booking_list'), headers={'Authorization': f'Bearer {token}'})
+
+    def test_valid_token_authenticates_without_csrf(self):
+        response = self.client.post(
+            reverse('booking:api_obtain_token'), {'username': 'student', 'password': 'password'},
+        )
+        token = response.json()['token']
+        self.assertEqual(self.get_bookings(token).status_code, 200)
+
+        created = self.client.post(
+            reverse('booking:api_booking_list'),
+            {
+                'resource': self.resource.pk, 'purpose': 'Seminar',
+                'start_time': form_time(MONDAY), 'end_time': form_time(MONDAY + hours(1)),
+            },
+            headers={'Authorization': f'Bearer {token}'},
+        )
+        self.assertEqual(created.status_code, 201)
+
+    def test_wrong_password_gets_no_token(self):
+        response = self.client.post(
+            reverse('booking:api_obtain_token'), {'username': 'student', 'password': 'wrong'},
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_tampered_token_is_rejected(self):
+        token = issue_token(self.user)
+        self.assertEqual(self.get_bookings(token[:-1] + ('A' if token[-1] != 'A' else 'B')).status_code, 401)
+
+    def test_expired_token_is_rejected(self):
+        token = issue_token(self.user)
+        with override_settings(API_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.get_bookings(token).status_code, 401)
+
+    def test_password_change_revokes_token(self):
+        token = issue_token(self.user)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.get_bookings(token).status_code, 401)
+
+    def test_session_writes_still_need_csrf(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('booking:api_booking_list'), {'resource': self.resource.pk})
+        self.assertEqual(response.status_code, 403)
+
+
+class EmailOutboxTests(BookingTestCase):
+    def test_unsendable_message_is_skipped_and_the_rest_sent(self):
+        subjects = ['Before', 'Broken\nsubject', 'After']
+        messages = [
+            UserMessage.objects.create(sender=self.user, recipient=self.user, subject=subject, body='Hi')
+            for subject in subjects
+        ]
+        outbox = EmailOutbox()
+        outbox._pending = [(message.pk, 0, 0.0) for message in messages]
+
+        with self.assertLogs('booking.notifications', 'ERROR'):
+            self.assertEqual(outbox.flush(), 2)
+
+        self.assertEqual(sorted(email.subject for email in mail.outbox), ['After', 'Before'])
+        self.assertEqual(outbox._pending, [])
+
+
+class ModifyBookingTests(BookingTestCase):
+    def test_stale_version_is_a_conflict(self):
+        booking = self.book(MONDAY, MONDAY + hours(1))
+        booking.purpose = 'Changed elsewhere'
+        self.assertTrue(save_if_unchanged(booking, ['purpose'], booking.version))
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('booking:modify_booking', args=[booking.pk]), {
+            'resource': self.resource.pk,
+            'start_time': (MONDAY + hours(2)).strftime('%Y-%m-%dT%H:%M'),
+            'end_time': (MONDAY + hours(3)).strftime('%Y-%m-%dT%H:%M'),
+            'purpose': 'My edit',
+            'version': booking.version - 1,
+        })
+
+        self.assertEqual(response.status_code, 409)
+        booking.refresh_from_db()
+        self.assertEqual((booking.start_time, booking.purpose), (MONDAY, 'Changed elsewhere'))
+
+
+class OccupancyIndexTests(BookingTestCase):
+    def stored_days(self):
+        return {row.day: list(_decode(row.slots)) for row in OccupancyDay.objects.filter(resource=self.resource)}
+
+    def test_index_matches_rebuild_and_exact_sweep(self):
+        window = (MONDAY - hours(9), MONDAY + hours(72))
+        days = sorted({day for day, _, _ in day_spans(*window)})
+        load_days(self.resource.pk, days)
+
+        first = self.book(MONDAY, MONDAY + hours(2))
+        second = self.book(MONDAY + hours(1), MONDAY + hours(3))
+        third = self.book(MONDAY + hours(23), MONDAY + hours(26), BookingRequest.STATUS_APPROVED)
+        fourth = self.book(MONDAY + hours(1), MONDAY + hours(1.5))
+
+        first.start_time, first.end_time = MONDAY + hours(24), MONDAY + hours(25)
+        self.assertTrue(save_if_unchanged(first, ['start_time', 'end_time'], first.version))
+        self.assertTrue(transition(second, BookingRequest.STATUS_CANCELLED))
+        self.assertTrue(transition(third, BookingRequest.STATUS_CANCELLED))
+        fourth.delete()
+        self.book(MONDAY + hours(25), MONDAY + hours(27.25))
+
+        incremental = self.stored_days()
+        invalidate_resource_occupancy(self.resource.pk)
+        load_days(self.resource.pk, days)
+        self.assertEqual(incremental, self.stored_days())
+
+        for offset in range(0, 72, 3):
+            start = MONDAY + hours(offset)
+            end = start + hours(3)
+            exact = _exact_usage(self.resource.pk, start, end, math.inf)[0]
+            self.assertEqual(peak_usage(self.resource, start, end), exact, start)
+
+
+class ReadReplicaTests(BookingTestCase):
+    def setUp(self):
+        patcher = mock.patch('booking.routers.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_replica_until_a_write(self):
+        @use_read_replica
+        def view(request):
+            aliases = [BookingRequest.objects.all().db]
+            router.db_for_write(BookingRequest)
+            aliases.append(BookingRequest.objects.all().db)
+            return aliases
+
+        request = mock.Mock(session={})
+        self.assertEqual(view(request), [REPLICA_DB_ALIAS, DEFAULT_DB_ALIAS])
+
+    def routed_reads(self, url):
+        """Models read by the view with the alias the router chose for each;
+        queries still run on the default database, there being no replica."""
+        routed = []
+        db_for_read = ReadReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            routed.append((model, db_for_read(router, model, **hints)))
+            return DEFAULT_DB_ALIAS
+
+        self.client.force_login(self.user)
+        with mock.patch.object(ReadReplicaRouter, 'db_for_read', record):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return routed
+
+    def first_alias(self, routed, model):
+        return next(alias for routed_model, alias in routed if routed_model is model)
+
+    def test_dashboard_reads_bookings_from_replica(self):
+        past = timezone.now() - hours(3)
+        finished = self.book(past, past + hours(1), BookingRequest.STATUS_APPROVED)
+
+        routed = self.routed_reads(reverse('booking:my_bookings_dashboard'))
+
+        self.assertEqual(self.first_alias(routed, BookingRequest), REPLICA_DB_ALIAS)
+        finished.refresh_from_db()
+        self.assertEqual(finished.status, BookingRequest.STATUS_COMPLETED)
+
+    def test_inbox_reads_messages_from_replica(self):
+        message = UserMessage.objects.create(sender=self.user, recipient=self.user, subject='Hello', body='Hi')
+
+        routed = self.routed_reads(reverse('booking:message_inbox'))
+
+        self.assertEqual(self.first_alias(routed, UserMessage), REPLICA_DB_ALIAS)
+        message.refresh_from_db()
+        self.assertTrue(message.is_read)
+
+
+class UserAuthFlagTests(BookingTestCase):
+    def test_deferred_users_load_in_one_query(self):
+        User.objects.create_user('other', 'other@example.com', 'password')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(User.objects.only('username'))), 2)
+
+    def test_flag_change_bumps_permission_version(self):
+        user = User.objects.only('username').get(pk=self.user.pk)
+        user.is_staff = True
+        with mock.patch('booking.signals.bump_permission_version') as bump:
+            user.save()
+        bump.assert_called_once_with()
+
+
+def _assert_disjoint(test, bookings):
+    by_unit = {}
+    for unit_id, start, end in bookings:
+        by_unit.setdefault(unit_id, []).append((start, end))
+    for unit_id, intervals in by_unit.items():
+        intervals.sort()
+        for (_, previous_end), (start, _) in zip(intervals, intervals[1:]):
+            test.assertLessEqual(previous_end, start, f"unit {unit_id} is double-booked")
+
+
+def _random_intervals(rng, count):
+    intervals = []
+    for key in range(count):
+        start = rng.randrange(0, 96)
+        intervals.append((key, start, start + rng.randrange(1, 16)))
+    return intervals
+
+
+class AllocationTests(SimpleTestCase):
+    def test_pack_never_double_books(self):
+        rng = random.Random(42)
+        for _ in range(300):
+            unit_ids = list(range(rng.randrange(1, 5)))
+            intervals = _random_intervals(rng, rng.randrange(0, 12))
+            fixed = []
+            for unit_id in unit_ids:
+                if rng.random() < 0.5:
+                    start = rng.randrange(0, 96)
+                    fixed.append((unit_id, start, start + rng.randrange(1, 16)))
+            preferred = {key: rng.choice(unit_ids) for key, _, _ in intervals if rng.random() < 0.5}
+
+            assignment = pack(unit_ids, intervals, fixed, preferred)
+            if assignment is None:
+                continue
+            self.assertEqual(set(assignment), {key for key, _, _ in intervals})
+            self.assertLessEqual(set(assignment.values()), set(unit_ids))
+            _assert_disjoint(self, fixed + [(assignment[key], start, end) for key, start, end in intervals])
+
+    def test_pack_fails_only_when_over_capacity(self):
+        intervals = [(key, 0, 10) for key in range(3)]
+        self.assertIsNone(pack([1, 2], intervals))
+        self.assertEqual(len(set(pack([1, 2, 3], intervals).values())), 3)
+
+    def test_best_fit_never_double_books(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            unit_ids = list(range(rng.randrange(1, 5)))
+            allocator = BestFitAllocator(unit_ids)
+            booked = []
+            for _, start, end in _random_intervals(rng, 15):
+                unit_id = allocator.allocate(start, end)
+                if unit_id is None:
+                    # Refused only when every unit overlaps the interval.
+                    busy = {unit for unit, other_start, other_end in booked if other_start < end and start < other_end}
+                    self.assertEqual(busy, set(unit_ids))
+                else:
+                    booked.append((unit_id, start, end))
+            _assert_disjoint(self, booked)
+
+
+def _peak(intervals, start, end):
+    """Most of `intervals` overlapping at any whole instant of [start, end)."""
+    return max((sum(1 for first, stop in intervals if first <= at < stop) for at in range(start, end)), default=0)
+
+
+class ApprovalSimulationTests(SimpleTestCase):
+    def test_matches_brute_force_peaks(self):
+        rng = random.Random(3)
+        for _ in range(300):
+            quantity = rng.randrange(1, 4)
+            approved = [(start, end) for _, start, end in _random_intervals(rng, rng.randrange(0, 6))]
+            pending = _random_intervals(rng, rng.randrange(1, 10))
+
+            results = _simulate_resource(quantity, approved, pending)
+
+            everything = approved + [(start, end) for _, start, end in pending]
+            suggested = [(start, end) for key, start, end in pending if results[key][2]]
+            for key, start, end in pending:
+                blocked, oversubscribed, chosen = results[key]
+                self.assertEqual(blocked, _peak(approved, start, end) >= quantity)
+                self.assertEqual(oversubscribed, _peak(everything, start, end) > quantity)
+                if chosen:
+                    self.assertLessEqual(_peak(approved + suggested, start, end), quantity)
+                else:
+                    # Maximal: nothing left out would still fit.
+                    self.assertGreaterEqual(_peak(approved + suggested, start, end), quantity)
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """The same fresh-interpreter probe as `manage.py check_startup_budget`."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.samples = probe_startup(3)
+
+    def test_payment_stack_is_not_imported_at_startup(self):
+        loaded = {name for sample in self.samples for name in sample['deferred_loaded']}
+        self.assertNotIn('django_daraja.mpesa.core', loaded)
+        self.assertNotIn('requests', loaded)
+
+    def test_startup_is_within_budget(self):
+        total_ms = statistics.median(sample['total_ms'] for sample in self.samples)
+        self.assertLessEqual(total_ms, settings.STARTUP_BUDGET_MS)
@@ -0,0 +1,145 @@
+"""Booking writes as compare-and-swap updates.
+
+A transition is one `UPDATE ... WHERE pk = ... AND status = <expected>
+AND version = <loaded>`: when two requests race to move the same booking,
+exactly one UPDATE matches and the other learns it lost instead of
+overwriting the winner. Only the moves listed in BookingRequest.TRANSITIONS
+are allowed.
+
+Edits work the same way on BookingRequest.version, which every write here
+increments: a form carries the version it was rendered from, and saving
+it only matches while nobody else has written the booking since. A
+conflict costs the user a retry, never a lock.
+
+Because QuerySet.update() sends no post_save, a successful write sends
+booking_changed instead; booking/signals.py keeps the stats cache, change
+feed and occupancy index current from it. The write and its signal share
+one transaction, taken under the booking's resource lock like every other
+write to a resource's bookings. Transitions are also written to the audit
+log.
+"""
+from django.db import router, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from .audit import record_transitions
+from .models import BookingRequest
+from .occupancy import lock_resources
+
+
+# Sent with bookings=[...] (already carrying their new values), from_status
+# and to_status after a write reaches the database.
+booking_changed = Signal()
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def can_transition(from_status, to_status):
+    return to_status in BookingRequest.TRANSITIONS.get(from_status, ())
+
+
+def check_transition(from_status, to_status):
+    if not can_transition(from_status, to_status):
+        raise InvalidTransition(f"A {from_status} booking cannot become {to_status}.")
+
+
+def _field_values(booking, fields):
+    values = {}
+    for name in fields:
+        attname = BookingRequest._meta.get_field(name).attname
+        values[attname] = getattr(booking, attname)
+    return values
+
+
+def lock_booking_resources(*bookings):
+    """lock_resources() for the bookings' resources, old and new."""
+    resource_ids = set()
+    for booking in bookings:
+        resource_ids.add(booking.resource_id)
+        loaded = getattr(booking, '_loaded_footprint', None)
+        if isinstance(loaded, tuple):
+            resource_ids.add(loaded[0])
+    lock_resources(*resource_ids)
+
+
+def transition(booking, to_status, actor=None, reason='', expected=None, fields=(), version=None):
+    """Moves `booking` to `to_status` if it is still in `expected` (by
+    default the status it was loaded with) and at `version` (by default the
+    version it was loaded with, so its footprint is current too).
+
+    `fields` names other attributes of `booking` to write in the same
+    UPDATE, e.g. ['unit'] when persisting for assign_unit(). Returns True
+    when this call made the change and False when another request wrote
+    the booking first; `booking` is only updated in the first case.
+    """
+    from_status = booking.status if expected is None else expected
+    check_transition(from_status, to_status)
+
+    version = booking.version if version is None else version
+    values = {'status': to_status, **_field_values(booking, fields)}
+    matching = BookingRequest.objects.filter(pk=booking.pk, status=from_status, version=version)
+    with transaction.atomic():
+        lock_booking_resources(booking)
+        if not matching.update(version=F('version') + 1, **values):
+            return False
+        for attname, value in values.items():
+            setattr(booking, attname, value)
+        booking.version = version + 1
+        _transitioned([booking], from_status, to_status, actor, reason)
+    return True
+
+
+def save_if_unchanged(booking, fields, version):
+    """Writes `fields` of an edited `booking` if it is still at `version`.
+
+    Returns False, writing nothing, when the booking changed since that
+    version was read.
+    """
+    values = _field_values(booking, fields)
+    with transaction.atomic():
+        lock_booking_resources(booking)
+        if not BookingRequest.objects.filter(pk=booking.pk, version=version).update(version=F('version') + 1, **values):
+            return False
+        booking.version = version + 1
+        booking_changed.send(
+            sender=BookingRequest, bookings=[booking], from_status=booking.status, to_status=booking.status,
+        )
+    return True
+
+
+def transition_many(bookings, from_status, to_status, actor=None, reason=''):
+    """Moves every booking of the `bookings` queryset that is in
+    `from_status` to `to_status` with one UPDATE; returns the moved bookings.
+    """
+    check_transition(from_status, to_status)
+    using = router.db_for_write(BookingRequest)
+    with transaction.atomic(using=using):
+        candidates = bookings.using(using).filter(status=from_status).order_by()
+        lock_resources(*candidates.values_list('resource_id', flat=True).distinct())
+        # Locked so the UPDATE below matches exactly these rows.
+        moved = list(
+            bookings.using(using)
+            .filter(status=from_status)
+            .select_related('resource')
+            .select_for_update(of=('self',))
+        )
+        if not moved:
+            return []
+        BookingRequest.objects.using(using).filter(
+            pk__in=[booking.pk for booking in moved], status=from_status,
+        ).update(status=to_status, version=F('version') + 1)
+        for booking in moved:
+            booking.status = to_status
+            booking.version += 1
+        _transitioned(moved, from_status, to_status, actor, reason)
+    return moved
+
+
+def _transitioned(bookings, from_status, to_status, actor, reason):
+    record_transitions(
+        [(booking.pk, booking.resource_id) for booking in bookings], from_status, to_status, actor, reason,
+    )
+    booking_changed.send(
+        sender=BookingRequest, bookings=bookings, from_status=from_status, to_status=to_status,
+    )
@@ -1,41 +1,73 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, payments, views
+from .ratelimit import rate_limit
+
+# In ASGI mode the read-heavy pages, the event stream and the availability
+# check are served by their async versions.
+if settings.URBS_ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
+# Endpoints that scripts tend to hammer get their own budgets; every other
+# view falls under RateLimitMiddleware's defaults.
 
 app_name = 'booking'
 
 urlpatterns = [
     path('', views.landing_view, name='landing'),
     
-    path('home/', views.home_view, name='home'),
+    path('home/', read_views.home_view, name='home'),
     path('register/', views.register_view, name='register'),
     
-    path('resources/', views.resource_list, name='resource_list'),
+    path('resources/', rate_limit(authenticated='120/m', anonymous='30/m')(read_views.resource_list), name='resource_list'),
     path('resources/create/', views.create_resource_view, name='create_resource'),
     path('resources/<int:pk>/update/', views.resource_update_view, name='resource_update'),
     path('resources/<int:pk>/delete/', views.resource_delete_view, name='resource_delete'),
 
-    path('new/', views.booking_create_view, name='new_booking'),
+    path('new/', rate_limit(authenticated='30/m', anonymous='10/m')(views.booking_create_view), name='new_booking'),
+    path('availability/', read_views.availability_view, name='availability'),
     
     
-    path('payment/initiate/<int:pk>/', views.initiate_stk_push_view, name='initiate_payment'),
+    path('payment/initiate/<int:pk>/', rate_limit(authenticated='10/m', anonymous='5/m')(payments.initiate_stk_push_view), name='initiate_payment'),
 
     
     path('success/<int:pk>/', views.booking_success_view, name='booking_success'), 
 
-    path('my_bookings_dashboard/', views.my_bookings_dashboard, name='my_bookings_dashboard'),
+    path('my_bookings_dashboard/', read_views.my_bookings_dashboard, name='my_bookings_dashboard'),
     path('booking/<int:pk>/modify/', views.modify_booking, name='modify_booking'),
     path('booking/<int:pk>/cancel/', views.cancel_booking, name='cancel_booking'),
 
     path('requests/pending/', views.admin_pending_requests, name='admin_pending_dashboard'),
+    path('requests/pending/simulate/', views.admin_simulate_approvals, name='admin_simulate_approvals'),
     path('requests/<int:pk>/update/', views.modify_booking, name='admin_booking_update'), 
+    path('requests/explore/', views.admin_booking_explorer, name='admin_booking_explorer'),
+    path('requests/heatmap/', views.resource_heatmap_view, name='resource_heatmap'),
+    path('requests/heatmap/data/', views.resource_heatmap_data, name='resource_heatmap_data'),
     
     
     path('booking/admin/users/', views.admin_user_list_view, name='admin_user_list'),
     path('booking/admin/users/<int:pk>/delete/', views.admin_delete_user_view, name='admin_delete_user'),
     path('booking/admin/users/create-staff/', views.admin_create_staff_view, name='admin_create_staff'),
 
-    path('booking/messages/inbox/', views.message_inbox_view, name='message_inbox'),
+    path('booking/messages/inbox/', read_views.message_inbox_view, name='message_inbox'),
     path('booking/admin/send-message/', views.admin_send_message_view, name='admin_send_message'),
+    path('booking/events/', read_views.booking_events_view, name='booking_events'),
 
     path('/admin/pending/review/<int:pk>/', views.admin_review_booking, name='admin_review_booking'),
+
+    path('metrics/', views.metrics_view, name='metrics'),
+
+    path('api/v1/auth/token/', rate_limit(authenticated='10/m', anonymous='10/m')(api.obtain_token), name='api_obtain_token'),
+    path('api/v1/resources/', api.resource_list, name='api_resource_list'),
+    path('api/v1/resources/<int:pk>/', api.resource_detail, name='api_resource_detail'),
+    path('api/v1/resources/<int:pk>/history/', api.resource_history, name='api_resource_history'),
+    path('api/v1/bookings/', rate_limit(authenticated='120/m')(api.booking_list), name='api_booking_list'),
+    path('api/v1/bookings/<int:pk>/', api.booking_detail, name='api_booking_detail'),
+    path('api/v1/bookings/<int:pk>/cancel/', api.booking_cancel, name='api_booking_cancel'),
+    path('api/v1/bookings/<int:pk>/history/', api.booking_history, name='api_booking_history'),
+    path('api/v1/messages/', api.message_list, name='api_message_list'),
+    path('api/v1/messages/<int:pk>/', api.message_detail, name='api_message_detail'),
+    path('api/v1/messages/<int:pk>/read/', api.message_read, name='api_message_read'),
 ]
\ No newline at end of file
@@ -1,18 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
 from django.utils import timezone
 import json
-from decimal import Decimal
+from django.conf import settings
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from .models import BookingRequest, Resource, UserMessage
-from .forms import BookingRequestForm, UserRegistrationForm, ResourceCreationForm, UserMessageForm
-from django_daraja.mpesa.core import MpesaClient
+from .forms import ApprovalSimulationForm, AvailabilityQueryForm, BookingExplorerForm, BookingRequestForm, HeatmapQueryForm, UserRegistrationForm, ResourceCreationForm, UserMessageForm
+from .stats import get_user_booking_stats, invalidate_user_booking_stats
+from .metrics import registry as metrics_registry
+from .routers import mark_recent_write, use_read_replica
+from .catalog import catalog_etag, catalog_last_modified, get_catalog_state
+from .allocation import NoUnitAvailable, assign_unit
+from .idempotency import idempotent, new_idempotency_key
+from .transitions import can_transition, save_if_unchanged, transition, transition_many
+from .simulation import simulate_approvals
+from .explorer import decode_cursor, estimated_count, filtered_bookings, page_after
+from .events import event_stream_response, parse_last_event_id, poll_events
+from .notifications import notify_recipients
 
 
 User = get_user_model()
@@ -22,6 +32,7 @@ def index(request):
     return HttpResponse("")
 
 
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def landing_view(request):
     return render(request, 'booking/landing.html')
 
@@ -30,28 +41,7 @@ def home_view(request):
     context = {}
     
     if request.user.is_authenticated:
-        user_bookings = BookingRequest.objects.filter(user=request.user)
-        
-        total_bookings = user_bookings.count()
-        pending_bookings = user_bookings.filter(status='PENDING').count()
-        
-        upcoming_bookings = user_bookings.filter(
-            status='APPROVED', 
-            start_time__gte=timezone.now()
-        ).count()
-
-        
-        unread_messages_count = UserMessage.objects.filter(
-            recipient=request.user, 
-            is_read=False
-        ).count()
-        
-        context.update({
-            'total_bookings': total_bookings,
-            'pending_bookings': pending_bookings,
-            'upcoming_bookings': upcoming_bookings,
-            'unread_messages_count': unread_messages_count, 
-        })
+        context.update(get_user_booking_stats(request.user))
     
     return render(request, 'booking/home.html', context)
 
@@ -81,25 +71,17 @@ def login_success_handler(request):
     return redirect('booking:home')
 
 @login_required
+@idempotent('booking_create')
 def booking_create_view(request):
     if request.method == 'POST':
         form = BookingRequestForm(request.POST)
         if form.is_valid():
-            
-            booking = form.save(commit=False)
-            booking.user = request.user 
-            
-            resource = booking.resource
-            
-            if resource and resource.cost > 0:
-                booking.status = 'PENDING'
-                booking.save() 
-                messages.info(request, "Booking successfully reserved. Please complete payment to confirm.")
-                return redirect('booking:initiate_payment', pk=booking.pk)
-                
-            else:
-                booking.status = 'APPROVED'
-                booking.save()
+            booking = form.submit(request.user)
+            if booking is not None:
+                mark_recent_write(request)
+                if booking.status == BookingRequest.STATUS_PENDING:
+                    messages.info(request, "Booking successfully reserved. Please complete payment to confirm.")
+                    return redirect('booking:initiate_payment', pk=booking.pk)
                 messages.success(request, "Booking successfully created (no payment required).")
                 return redirect('booking:booking_success', pk=booking.pk)
         
@@ -121,10 +103,20 @@ def booking_create_view(request):
     
     context = {
         'form': form,
-        'resources': resources
+        'resources': resources,
+        'idempotency_key': new_idempotency_key(),
     }
     return render(request, 'booking/booking_form.html', context)
 
+@login_required
+@require_http_methods(["GET"])
+def availability_view(request):
+    """Live capacity pre-check for the booking form, using the form's own rules."""
+    form = AvailabilityQueryForm(request.GET, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    return JsonResponse(form.availability())
+
 @login_required
 def booking_success_view(request, pk):
     booking = get_object_or_404(BookingRequest, pk=pk, user=request.user)
@@ -135,84 +127,41 @@ def booking_success_view(request, pk):
     }
     return render(request, 'booking/booking_success.html', context)
 
-@login_required
-def initiate_stk_push_view(request, pk):
-    booking = get_object_or_404(BookingRequest, pk=pk, user=request.user)
-    
-    if booking.start_time and booking.end_time:
-        duration = booking.end_time - booking.start_time
-        duration_in_hours_float = duration.total_seconds() / 3600
-        
-        
-        duration_in_hours_decimal = Decimal(str(duration_in_hours_float))
-        
-        
-        total_cost = round(booking.resource.cost * duration_in_hours_decimal, 2)
-    else:
-        total_cost = booking.resource.cost
-    
-    if request.method == 'POST':
-        
-        phone_number = request.POST.get('phoneNumber')
-        try:
-            
-            amount = int(float(request.POST.get('amount')))
-            if amount <= 0:
-                raise ValueError("Amount must be positive.")
-        except (ValueError, TypeError):
-            messages.error(request, "Invalid amount provided for M-Pesa.")
-            return redirect('booking:initiate_payment', pk=pk)
-            
-        cl = MpesaClient()
-        account_reference = f'BOOKING_{booking.pk}'
-        transaction_desc = f'Payment for {booking.resource.name} Booking #{booking.pk}'
-        callback_url = 'https://api.darajambili.com/express-payment' 
-        
-        try:
-            response = cl.stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
-            
-            messages.success(request, f"M-Pesa prompt sent to {phone_number}. Please check your phone to complete the KES {amount} payment.")
-            
-            return redirect('booking:my_bookings_dashboard') 
-            
-        except Exception as e:
-            messages.error(request, f"Payment initiation failed. Error: {e}")
-            
-    context = {
-        'booking': booking,
-        'cost': total_cost,
-    }
-    
-    
-    return render(request, 'booking/stk_push_form.html', context)
-
 @login_required 
+@use_read_replica
 def my_bookings_dashboard(request):
     
     now = timezone.now()
     
-    BookingRequest.objects.filter(
-        user=request.user,
-        status='APPROVED',
-        end_time__lt=now 
-    ).update(status='COMPLETED')
+    # Read before writing: after a write the router sends reads to the primary.
+    all_bookings = list(
+        BookingRequest.objects.filter(user=request.user)
+        .select_related('resource', 'unit')
+        .order_by('-start_time')
+    )
     
+    if any(b.status == BookingRequest.STATUS_APPROVED and b.end_time < now for b in all_bookings):
+        completed = transition_many(
+            BookingRequest.objects.filter(user=request.user, end_time__lt=now),
+            BookingRequest.STATUS_APPROVED, BookingRequest.STATUS_COMPLETED, reason="End time passed",
+        )
+        completed_pks = {b.pk for b in completed}
+        for b in all_bookings:
+            if b.pk in completed_pks:
+                b.status = BookingRequest.STATUS_COMPLETED
     
-    all_bookings = BookingRequest.objects.filter(user=request.user).order_by('-start_time')
-    pending_bookings = all_bookings.filter(status='PENDING')
-    past_bookings = all_bookings.exclude(status='PENDING').order_by('-start_time')
+    pending_bookings = [b for b in all_bookings if b.status == 'PENDING']
+    past_bookings = [b for b in all_bookings if b.status != 'PENDING']
 
-    
-    unread_messages_count = UserMessage.objects.filter(
-        recipient=request.user, 
-        is_read=False
-    ).count()
+    stats = get_user_booking_stats(request.user)
     
     context = {
         'bookings': all_bookings,
         'pending_bookings': pending_bookings,
         'past_bookings': past_bookings,
-        'unread_messages_count': unread_messages_count, 
+        'total_bookings': stats['total_bookings'],
+        'pending_count': stats['pending_bookings'],
+        'unread_messages_count': stats['unread_messages_count'], 
     }
     
     return render(request, 'booking/my_bookings_dashboard.html', context)
@@ -222,7 +171,7 @@ def my_bookings_dashboard(request):
 def admin_pending_requests(request):
     
 
-    pending_bookings = BookingRequest.objects.filter(status='PENDING').order_by('start_time')
+    pending_bookings = BookingRequest.objects.filter(status='PENDING').select_related('resource', 'user').order_by('start_time')
     
     
     unread_messages_count = UserMessage.objects.filter(
@@ -240,6 +189,80 @@ def admin_pending_requests(request):
     return render(request, 'booking/admin_pending_list.html', context)
 
 
+@login_required
+@permission_required('booking.can_review_booking', raise_exception=True)
+@use_read_replica
+def admin_booking_explorer(request):
+    form = BookingExplorerForm(request.GET or None)
+    bookings, next_cursor = [], None
+    total, total_precision = 0, 'exact'
+    if not form.is_bound or form.is_valid():
+        filters = form.cleaned_data if form.is_bound else {}
+        matching = filtered_bookings(filters)
+        bookings, next_cursor = page_after(
+            matching, decode_cursor(request.GET.get('after')), settings.BOOKING_EXPLORER_PAGE_SIZE,
+        )
+        total, total_precision = estimated_count(matching)
+
+    unread_messages_count = UserMessage.objects.filter(
+        recipient=request.user,
+        is_read=False
+    ).count()
+
+    context = {
+        'form': form,
+        'bookings': bookings,
+        'next_cursor': next_cursor,
+        'is_first_page': 'after' not in request.GET,
+        'total': total,
+        'total_precision': total_precision,
+        'unread_messages_count': unread_messages_count,
+    }
+    return render(request, 'booking/admin_booking_explorer.html', context)
+
+
+@login_required
+@permission_required('booking.can_review_booking', raise_exception=True)
+def resource_heatmap_view(request):
+    unread_messages_count = UserMessage.objects.filter(
+        recipient=request.user,
+        is_read=False
+    ).count()
+
+    context = {
+        'form': HeatmapQueryForm(request.GET or None),
+        'unread_messages_count': unread_messages_count,
+    }
+    return render(request, 'booking/resource_heatmap.html', context)
+
+
+@login_required
+@permission_required('booking.can_review_booking', raise_exception=True)
+@require_http_methods(["GET"])
+def resource_heatmap_data(request):
+    """Hour-of-week occupancy of a resource, a resource type or everything."""
+    form = HeatmapQueryForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    return JsonResponse(form.heatmap())
+
+
+@login_required
+@permission_required('booking.can_review_booking', raise_exception=True)
+@require_http_methods(["GET"])
+def admin_simulate_approvals(request):
+    """What approving the pending queue (or the `booking` ids given) together would do."""
+    form = ApprovalSimulationForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    results = simulate_approvals(list(form.pending()))
+    return JsonResponse({
+        'results': results,
+        'suggested': [result['booking'] for result in results if result['suggested']],
+        'oversubscribed': [result['booking'] for result in results if result['oversubscribed']],
+    })
+
+
 @login_required
 @permission_required('booking.can_review_booking', raise_exception=True) 
 @require_http_methods(["POST"])
@@ -257,22 +280,42 @@ def admin_review_booking(request, pk):
     body = ""
 
     if action == 'approve':
-        booking.status = 'APPROVED'
+        to_status, fields = BookingRequest.STATUS_APPROVED, ['unit']
+        reason = "Approved by reviewer"
         subject = f"✅ Booking Approved: {booking.resource.name}"
         body = f"Your booking for {booking.resource.name} from {booking.start_time.strftime('%Y-%m-%d %H:%M')} to {booking.end_time.strftime('%Y-%m-%d %H:%M')} has been APPROVED."
-        messages.success(request, f"Booking ID {pk} approved.")
 
     elif action == 'reject':
-        booking.status = 'REJECTED'
+        to_status, fields = BookingRequest.STATUS_REJECTED, []
+        reason = "Rejected by reviewer"
         subject = f"❌ Booking Rejected: {booking.resource.name}"
         body = f"Your booking for {booking.resource.name} from {booking.start_time.strftime('%Y-%m-%d %H:%M')} has been REJECTED by the administrator."
-        messages.warning(request, f"Booking ID {pk} rejected.")
 
     else:
         messages.error(request, "Invalid action specified.")
         return redirect('booking:admin_pending_dashboard')
 
-    booking.save()
+    reason = request.POST.get('reason', '').strip() or reason
+
+    def write():
+        return transition(booking, to_status, request.user, reason, fields=fields)
+
+    try:
+        # Approval picks the unit and writes it under the resource's lock.
+        written = assign_unit(booking, write, actor=request.user) if to_status == BookingRequest.STATUS_APPROVED else write()
+    except NoUnitAvailable as exc:
+        messages.error(request, f"Booking ID {pk} cannot be approved. {exc}")
+        return redirect('booking:admin_pending_dashboard')
+    if not written:
+        messages.error(request, f"Booking ID {pk} was reviewed by someone else in the meantime.")
+        return redirect('booking:admin_pending_dashboard')
+
+    if to_status == BookingRequest.STATUS_APPROVED:
+        if booking.unit_id:
+            body += f" Your assigned unit is {booking.unit.label}."
+        messages.success(request, f"Booking ID {pk} approved.")
+    else:
+        messages.warning(request, f"Booking ID {pk} rejected.")
     
     
     UserMessage.objects.create(
@@ -288,6 +331,7 @@ def admin_review_booking(request, pk):
 
 
 @login_required
+@use_read_replica
 def admin_user_list_view(request):
     if not request.user.is_authenticated or not (request.user.is_staff or request.user.is_superuser):
         return HttpResponseForbidden("Access denied. You must be authorized staff or a superuser.")
@@ -349,16 +393,25 @@ def admin_delete_user_view(request, pk):
 @login_required
 def modify_booking(request, pk):
     booking = get_object_or_404(BookingRequest, pk=pk)
+    previous_status = booking.status
     is_owner = booking.user == request.user
     is_admin = request.user.is_staff or request.user.is_superuser
     
     if not (is_owner or is_admin):
         return HttpResponseForbidden("You do not have permission to view this booking.")
 
+    conflict = False
     if request.method == 'POST':
         form = BookingRequestForm(request.POST, instance=booking, is_admin=is_admin, is_owner=is_owner)
-
-        if form.is_valid():
+        try:
+            version = int(request.POST.get('version', ''))
+        except ValueError:
+            version = None
+
+        if version != booking.version:
+            # The booking was saved again after this form was rendered.
+            conflict = True
+        elif form.is_valid():
             
             if is_owner:
                 
@@ -369,33 +422,60 @@ def modify_booking(request, pk):
                 
                 updated_booking = form.save(commit=False)
                 updated_booking.status = 'PENDING'
-                updated_booking.save()
-                messages.success(request, "Booking time/date successfully updated and reset to PENDING status for review.")
-                return redirect('booking:my_bookings_dashboard') 
+                if save_if_unchanged(updated_booking, ['resource', 'start_time', 'end_time', 'purpose', 'status'], version):
+                    mark_recent_write(request)
+                    messages.success(request, "Booking time/date successfully updated and reset to PENDING status for review.")
+                    return redirect('booking:my_bookings_dashboard') 
+                conflict = True
                 
             elif is_admin:
                 
-                form.save()
-                messages.success(request, f"Booking ID {pk} status successfully updated to {booking.status}.")
-                
-                if booking.status in ['APPROVED', 'REJECTED']:
-                    subject = f"Booking Update: {booking.resource.name}"
-                    body = f"The administrator has manually updated your booking for **{booking.resource.name}** to **{booking.status}**."
-                    UserMessage.objects.create(
-                        sender=request.user, 
-                        recipient=booking.user,
-                        subject=subject,
-                        body=body,
-                        is_read=False,
+                def write():
+                    return booking.status == previous_status or transition(
+                        booking, booking.status, request.user, "Status updated by administrator",
+                        expected=previous_status, fields=['unit'], version=version,
                     )
+
+                try:
+                    if booking.status == 'APPROVED' and previous_status != 'APPROVED':
+                        written = assign_unit(booking, write, actor=request.user)
+                    else:
+                        written = write()
+                except NoUnitAvailable as exc:
+                    messages.error(request, f"Booking ID {pk} cannot be approved. {exc}")
+                    return redirect('booking:modify_booking', pk=pk)
                 
-                return redirect('booking:admin_pending_dashboard')
+                if written:
+                    messages.success(request, f"Booking ID {pk} status successfully updated to {booking.status}.")
+                    
+                    if booking.status in ['APPROVED', 'REJECTED']:
+                        subject = f"Booking Update: {booking.resource.name}"
+                        body = f"The administrator has manually updated your booking for **{booking.resource.name}** to **{booking.status}**."
+                        UserMessage.objects.create(
+                            sender=request.user, 
+                            recipient=booking.user,
+                            subject=subject,
+                            body=body,
+                            is_read=False,
+                        )
+                    
+                    return redirect('booking:admin_pending_dashboard')
+                conflict = True
         else:
             messages.error(request, "There was an error with your submission. Please check the form. Errors shown below.")
             
     else:
         form = BookingRequestForm(instance=booking, is_admin=is_admin, is_owner=is_owner)
 
+    if conflict:
+        # Start again from what is saved now; nothing was written.
+        booking = get_object_or_404(BookingRequest, pk=pk)
+        form = BookingRequestForm(instance=booking, is_admin=is_admin, is_owner=is_owner)
+        messages.error(
+            request,
+            f"Booking ID {pk} was changed by someone else while you were editing it. "
+            "Its current details are shown below; please make your changes again.",
+        )
     
     unread_messages_count = UserMessage.objects.filter(
         recipient=request.user, 
@@ -410,7 +490,7 @@ def modify_booking(request, pk):
         'unread_messages_count': unread_messages_count, 
     }
 
-    return render(request, 'booking/booking_update_form.html', context)
+    return render(request, 'booking/booking_update_form.html', context, status=409 if conflict else 200)
 
 
 @login_required
@@ -423,14 +503,16 @@ def cancel_booking(request, pk):
         return redirect('booking:my_bookings_dashboard')
     
     
-    if booking.status in ['APPROVED', 'PENDING']:
+    if can_transition(booking.status, BookingRequest.STATUS_CANCELLED):
         
         if booking.end_time < timezone.now():
             messages.error(request, f"Booking ID {pk} cannot be cancelled because the booking time has already passed.")
             return redirect('booking:my_bookings_dashboard')
 
-        booking.status = 'CANCELLED'
-        booking.save()
+        if not transition(booking, BookingRequest.STATUS_CANCELLED, request.user, "Cancelled by owner"):
+            messages.error(request, f"Booking ID {pk} changed while you were cancelling it. Please try again.")
+            return redirect('booking:my_bookings_dashboard')
+        mark_recent_write(request)
         messages.success(request, f"Booking ID {pk} for {booking.resource.name} has been successfully cancelled.")
     elif booking.status == 'CANCELLED':
         messages.info(request, "This booking is already cancelled.")
@@ -442,18 +524,26 @@ def cancel_booking(request, pk):
     return redirect('booking:my_bookings_dashboard')
 
 
+@use_read_replica
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def resource_list(request):
     resources = Resource.objects.filter(is_available=True).order_by('name')
     
-    query = request.GET.get('q')
+    query = request.GET.get('q', '')
     if query:
         resources = resources.filter(
             Q(name__icontains=query) | 
             Q(description__icontains=query)
         ).distinct()
 
+    # The queryset stays lazy: when the cached grid fragment is hit, the
+    # template never iterates it and no resource query runs.
     context = {
-        'resources': resources
+        'resources': resources,
+        'query': query,
+        'catalog_version': get_catalog_state()['version'],
+        'is_staff_view': request.user.is_staff or request.user.is_superuser,
+        'fragment_cache_ttl': settings.RESOURCE_FRAGMENT_CACHE_TTL,
     }
     return render(request, 'booking/resource_list.html', context)
 
@@ -549,14 +639,17 @@ def logged_out_view(request):
 
 
 @login_required
+@use_read_replica
 def message_inbox_view(request):
     
-    messages_list = UserMessage.objects.filter(recipient=request.user).order_by('-sent_at')
+    # Read before writing: after a write the router sends reads to the primary.
+    messages_list = list(UserMessage.objects.filter(recipient=request.user).order_by('-sent_at'))
     
     
-    unread_messages = messages_list.filter(is_read=False)
+    unread_pks = [message.pk for message in messages_list if not message.is_read]
     
-    unread_messages.update(is_read=True) 
+    if unread_pks and UserMessage.objects.filter(pk__in=unread_pks, is_read=False).update(is_read=True):
+        invalidate_user_booking_stats(request.user.pk)
     
     
     unread_messages_count = 0
@@ -599,6 +692,8 @@ def admin_send_message_view(request):
                 )
             
             UserMessage.objects.bulk_create(messages_to_create)
+            invalidate_user_booking_stats(*[m.recipient_id for m in messages_to_create])
+            notify_recipients(messages_to_create)
             
             messages.success(request, f"Broadcast message successfully sent to {len(messages_to_create)} users.")
             
@@ -618,4 +713,25 @@ def admin_send_message_view(request):
         'unread_messages_count': unread_messages_count,
         'is_broadcast': True,
     }
-    return render(request, 'booking/admin_send_message_form.html', context)
\ No newline at end of file
+    return render(request, 'booking/admin_send_message_form.html', context)
+
+
+@login_required
+def booking_events_view(request):
+    """Server-Sent Events of the user's booking updates and new messages.
+
+    Answered as a short poll: under WSGI a held-open stream would keep a
+    worker busy per open tab. async_views streams instead.
+    """
+    return event_stream_response([poll_events(request.user.pk, parse_last_event_id(request))])
+
+
+@login_required
+def metrics_view(request):
+    if not (request.user.is_staff or request.user.is_superuser):
+        return HttpResponseForbidden("Access denied. You must be authorized staff or a superuser.")
+
+    return HttpResponse(
+        metrics_registry.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
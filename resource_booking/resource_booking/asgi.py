@@ -2,6 +2,9 @@
 ASGI config for resource_booking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI the read-heavy views run as async views (URBS_ASYNC_VIEWS), e.g.:
+
+    uvicorn resource_booking.asgi:application --workers 4
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +15,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'resource_booking.settings')
+os.environ.setdefault('URBS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
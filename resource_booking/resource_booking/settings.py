@@ -17,16 +17,35 @@ import os
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Deployment profile
+# 'development' keeps the quick-start defaults below. 'production' turns off
+# DEBUG (which otherwise keeps every executed query in memory), tunes the
+# database connection and expects secrets and hosts from the environment.
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
+URBS_PROFILE = os.environ.get('URBS_PROFILE', 'development')
+IS_PRODUCTION = URBS_PROFILE == 'production'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-cq3_!21d6%zi-u=a^u0moel06us*n=3ia!&u-xd!c9u9q@st3o'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-cq3_!21d6%zi-u=a^u0moel06us*n=3ia!&u-xd!c9u9q@st3o',
+)
+if IS_PRODUCTION and SECRET_KEY.startswith('django-insecure-'):
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured("Set DJANGO_SECRET_KEY when URBS_PROFILE=production.")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', not IS_PRODUCTION)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -45,11 +64,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'booking.api.ApiTokenMiddleware',
+    'booking.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,7 +80,7 @@ ROOT_URLCONF = 'resource_booking.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'booking.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'], # <--- CONFIRMED PROJECT-LEVEL TEMPLATES
         # ...
         'APP_DIRS': True,
@@ -78,13 +100,280 @@ WSGI_APPLICATION = 'resource_booking.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_ENGINE selects 'sqlite' (default) or 'postgresql' (needs psycopg).
+# DATABASE_CONN_MAX_AGE keeps connections open across requests; 0 closes
+# them after every request as Django does by default.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60 if IS_PRODUCTION else 0))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'resource_booking'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DATABASE_CONN_MAX_AGE > 0,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        }
+    }
+
+    # WAL lets readers run alongside the single writer, busy_timeout makes a
+    # blocked writer wait instead of failing with "database is locked", and
+    # synchronous=NORMAL is durable under WAL while skipping an fsync per
+    # commit. IMMEDIATE transactions take the write lock up front so two
+    # requests cannot deadlock upgrading read locks.
+    if env_bool('SQLITE_TUNING', IS_PRODUCTION):
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+# Optional read replica for read-heavy views (see booking/routers.py).
+# DATABASE_REPLICA_NAME is the replica's SQLite file or PostgreSQL database;
+# DATABASE_REPLICA_HOST/PORT default to the primary's. Replication itself is
+# handled outside Django.
+
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=DATABASE_REPLICA_NAME,
+        TEST={'MIRROR': 'default'},
+    )
+    if DATABASE_ENGINE == 'postgresql':
+        DATABASES['replica']['HOST'] = os.environ.get('DATABASE_REPLICA_HOST', DATABASES['default']['HOST'])
+        DATABASES['replica']['PORT'] = os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT'])
+
+DATABASE_ROUTERS = ['booking.routers.ReadReplicaRouter']
+
+# After a user submits, modifies or cancels a booking their reads stay on the
+# primary for this many seconds.
+READ_REPLICA_STICKY_SECONDS = int(os.environ.get('READ_REPLICA_STICKY_SECONDS', 15))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'resource-booking',
     }
 }
 
+# Seconds the per-user dashboard counters stay cached. Entries are also
+# dropped whenever that user's bookings or messages change.
+BOOKING_STATS_CACHE_TTL = 30
+
+# Seconds the resource catalog version (used for ETags and fragment keys)
+# is trusted before re-reading it; resource saves and deletes clear it.
+RESOURCE_CATALOG_CACHE_TTL = 60
+
+# Seconds a rendered resource grid fragment is kept. The key includes the
+# catalog version, so edits are visible without waiting for expiry.
+RESOURCE_FRAGMENT_CACHE_TTL = 600
+
+# Seconds an availability pre-check answer is reused. Short on purpose:
+# the booking form re-checks on submit anyway.
+AVAILABILITY_CACHE_TTL = 5
+
+# Seconds a completed booking or payment POST is remembered by its form's
+# idempotency key (booking/idempotency.py), and how long a duplicate that
+# arrives mid-request waits for the original's result.
+IDEMPOTENCY_KEY_TTL = 600
+IDEMPOTENCY_WAIT_SECONDS = 5
+
+
+# Booking audit log
+# Transitions are buffered per process and written in bulk by a background
+# thread (booking/audit.py): every AUDIT_FLUSH_INTERVAL seconds, or as soon
+# as AUDIT_BATCH_SIZE events are waiting. If the database is unreachable the
+# buffer keeps at most AUDIT_MAX_BUFFER events.
+
+AUDIT_FLUSH_INTERVAL = 2.0
+AUDIT_BATCH_SIZE = 500
+AUDIT_MAX_BUFFER = 50000
+
+
+# Booking explorer
+# Rows per page of the staff explorer (booking/explorer.py). Result totals
+# are counted exactly up to BOOKING_EXPLORER_EXACT_COUNT_LIMIT; larger ones
+# show the database's estimate (PostgreSQL) or "more than" the limit.
+
+BOOKING_EXPLORER_PAGE_SIZE = 50
+BOOKING_EXPLORER_EXACT_COUNT_LIMIT = 10000
+
+
+# Occupancy heatmaps
+# Booked unit-time per hour-of-week bin (booking/heatmap.py). The bin size
+# must divide 60; stored weeks of another size are rebuilt when read.
+# Served heatmaps are cached for HEATMAP_CACHE_TTL seconds.
+
+HEATMAP_BIN_MINUTES = 60
+HEATMAP_WEEKS = 52
+HEATMAP_MAX_WEEKS = 156
+HEATMAP_CACHE_TTL = 30
+
+
+# JSON API
+# Default and largest page size of the paged /api/v1/ lists (booking/api.py).
+# Bearer tokens from /api/v1/auth/token/ are valid for API_TOKEN_MAX_AGE
+# seconds.
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_TOKEN_MAX_AGE = int(os.environ.get('API_TOKEN_MAX_AGE', 30 * 24 * 3600))
+
+
+# Start-up budget
+# Median milliseconds a fresh worker may spend in django.setup() plus loading
+# and resolving the URLconf; checked by `manage.py check_startup_budget`.
+
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1000))
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+# Notification emails (booking/notifications.py) are off unless
+# NOTIFICATION_EMAIL_ENABLED is set. They are sent in batches from a
+# background thread over one kept-open connection, retried with doubling
+# backoff, and dropped after NOTIFICATION_EMAIL_MAX_ATTEMPTS tries.
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = env_bool('EMAIL_USE_TLS', False)
+EMAIL_TIMEOUT = 10
+
+NOTIFICATION_EMAIL_ENABLED = env_bool('NOTIFICATION_EMAIL_ENABLED', False)
+NOTIFICATION_EMAIL_FROM = os.environ.get('NOTIFICATION_EMAIL_FROM', 'bookings@localhost')
+NOTIFICATION_EMAIL_BATCH_SIZE = 100
+NOTIFICATION_EMAIL_FLUSH_INTERVAL = 2.0
+NOTIFICATION_EMAIL_IDLE_SECONDS = 60
+NOTIFICATION_EMAIL_RETRY_BACKOFF = 5.0
+NOTIFICATION_EMAIL_MAX_ATTEMPTS = 5
+NOTIFICATION_EMAIL_MAX_BUFFER = 50000
+
+
+# Booking reminders
+# `manage.py send_booking_reminders --loop` (booking/reminders.py) messages
+# the owners of APPROVED bookings starting within the lead time, checking
+# every BOOKING_REMINDER_INTERVAL_SECONDS. Records of sent reminders are
+# kept BOOKING_REMINDER_RETENTION_DAYS past the booking's start.
+
+BOOKING_REMINDER_LEAD_MINUTES = int(os.environ.get('BOOKING_REMINDER_LEAD_MINUTES', 60))
+BOOKING_REMINDER_INTERVAL_SECONDS = 300
+BOOKING_REMINDER_BATCH_SIZE = 1000
+BOOKING_REMINDER_RETENTION_DAYS = 7
+
+
+# Rate limiting
+# Token buckets per URL name and client (booking/ratelimit.py), kept in the
+# RATE_LIMIT_CACHE alias. Views in booking/urls.py wrapped in @rate_limit
+# have their own budgets; everything else gets the defaults below. Budgets
+# read '<requests>/<s|m|h|d>'. With the per-process LocMemCache each worker
+# counts separately; point the alias at a shared cache to limit site-wide.
+
+RATE_LIMIT_ENABLED = env_bool('RATE_LIMIT_ENABLED', True)
+RATE_LIMIT_CACHE = 'default'
+RATE_LIMIT_DEFAULT_AUTHENTICATED = '600/m'
+RATE_LIMIT_DEFAULT_ANONYMOUS = '120/m'
+
+
+# ASGI mode
+# Serve the home page, resource list, dashboard and inbox from
+# booking/async_views.py. resource_booking/asgi.py turns this on by default.
+
+URBS_ASYNC_VIEWS = env_bool('URBS_ASYNC_VIEWS', False)
+
+
+# Live updates (Server-Sent Events)
+# Each process polls the change feed once per interval for all of its open
+# streams. Streams close after BOOKING_EVENTS_MAX_STREAM_SECONDS and the
+# browser reconnects, resuming from the last event id it saw.
+
+BOOKING_EVENTS_POLL_INTERVAL = float(os.environ.get('BOOKING_EVENTS_POLL_INTERVAL', 1.0))
+BOOKING_EVENTS_HEARTBEAT_SECONDS = 15
+BOOKING_EVENTS_MAX_STREAM_SECONDS = int(os.environ.get('BOOKING_EVENTS_MAX_STREAM_SECONDS', 300))
+BOOKING_EVENTS_RETRY_MS = 3000
+# Outside ASGI mode the event view answers at once instead of holding a
+# worker, and the browser polls again after this many milliseconds.
+BOOKING_EVENTS_SHORT_POLL_MS = int(os.environ.get('BOOKING_EVENTS_SHORT_POLL_MS', 15000))
+BOOKING_EVENTS_RETENTION_HOURS = 24
+# How long the feed keeps polling for an id it skipped, i.e. how late a
+# transaction may commit its event after a later id became visible.
+BOOKING_EVENTS_LATE_COMMIT_SECONDS = 10
+
+
+# Request metrics
+# Per-view latency, DB and template timings, exposed at /metrics/ for staff.
+# Off unless BOOKING_METRICS_ENABLED is set; when disabled the middleware
+# removes itself from the chain at startup.
+
+BOOKING_METRICS_ENABLED = env_bool('BOOKING_METRICS_ENABLED', False)
+
+# Requests slower than this, or issuing at least this many queries, are
+# logged as one JSON line on the 'booking.metrics' logger.
+BOOKING_METRICS_SLOW_REQUEST_MS = int(os.environ.get('BOOKING_METRICS_SLOW_REQUEST_MS', 500))
+BOOKING_METRICS_SLOW_QUERY_COUNT = int(os.environ.get('BOOKING_METRICS_SLOW_QUERY_COUNT', 50))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # SQL is only logged when DEBUG is on; keep it quiet either way.
+        'django.db.backends': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'booking.metrics': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+
+# Sessions and authentication
+# Sessions are read from the cache and written through to the database.
+# Users and their permission sets are cached as well (booking/auth.py), so an
+# authenticated request normally needs no auth queries at all. With the
+# per-process LocMemCache, invalidation only reaches the process that made the
+# change; AUTH_CACHE_TTL bounds how stale other workers can be. Point CACHES
+# at a shared backend in production to make invalidation immediate.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = ['booking.auth.CachedModelBackend']
+
+AUTH_CACHE_TTL = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators